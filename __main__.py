@@ -1,45 +1,87 @@
-import sys
 import time
+
+# Время запуска отсчитывается до остальных импортов
+STARTED_AT = time.perf_counter()
+
+import sys
+import json
+import signal
+import asyncio
+import argparse
 import threading
 
-from extensions.logging_ext import log
+from extensions.logging_ext import log, setup_file_logging
 from extensions.dotenv_ext import get_env
+from extensions.metrics_ext import metrics
+from extensions.startup_ext import check_startup, heavy_modules_loaded
 from services.browser import BrowserManager
-from services.vk import VKManager, VKInteraction
-from services.gui import start_gui
+from services.targets import load_targets
+from services.tracker import FriendsTracker
+from services.token_pool import load_accounts
 
 
 REFRESH_INTERVAL = int(get_env('REFRESH_INTERVAL'))
-USER_ID = get_env('USER_ID')
+TARGETS = load_targets(REFRESH_INTERVAL)
+ACCOUNTS = load_accounts()
+# Пауза перед перезапуском опроса после непредвиденной ошибки, растёт вдвое до максимума
+RESTART_DELAY = float(get_env('RESTART_DELAY', '5'))
+RESTART_MAX_DELAY = float(get_env('RESTART_MAX_DELAY', '300'))
+
+browser_managers = [BrowserManager(account) for account in ACCOUNTS]
+
+
+def stop_browsers():
+    """Закрывает браузеры всех аккаунтов"""
+
+    for browser_manager in browser_managers:
+        browser_manager.stop_browser()
+
 
-browser_manager = BrowserManager()
-app, gui_window = start_gui(browser_manager)
-log.info("GUI запущен")
+def report_startup() -> float:
+    """Записывает в лог и метрики, сколько секунд прошло от запуска до готовности к опросу"""
+
+    startup_seconds = time.perf_counter() - STARTED_AT
+    metrics.observe('stage_seconds', startup_seconds, stage='startup')
+    log.info(f'Запуск занял {startup_seconds:.2f} с')
+    return startup_seconds
 
 
 def main_function_decorator():
     """
-    Декоратор главной функции, в случае возникновения непредвиденной ошибки
-    или прерывания кода действиями пользователя - закрывает процесс браузера
+    Декоратор главной функции, в случае прерывания кода действиями пользователя -
+    закрывает процесс браузера. При непредвиденной ошибке закрывает браузеры
+    и перезапускает функцию через RESTART_DELAY секунд, при повторных
+    ошибках пауза растёт вдвое до RESTART_MAX_DELAY, чтобы опрос не останавливался молча
     """
 
     def decorator(func):
         def wrapper(*args, **kwargs):
-            try:
-                log.info("Главный цикл запущен")
-                return func(*args, **kwargs)
-                
-            except KeyboardInterrupt:
-                log.info("Прервано пользователем.")
-                browser_manager.stop_browser()
-            
-            except PermissionError as e:
-                log.error(f"Ошибка с ключом токена: {e}")
-                return
-
-            except Exception as e:
-                log.error(f"Произошла непредвиденная ошибка: {e}")
-                browser_manager.stop_browser()
+            restart_delay = RESTART_DELAY
+            while True:
+                started = time.monotonic()
+                try:
+                    log.info("Главный цикл запущен")
+                    return func(*args, **kwargs)
+
+                except KeyboardInterrupt:
+                    log.info("Прервано пользователем.")
+                    stop_browsers()
+                    return
+
+                except PermissionError as e:
+                    log.error(f"Ошибка с ключом токена: {e}")
+                    return
+
+                except Exception as e:
+                    log.error(f"Произошла непредвиденная ошибка: {e}")
+                    stop_browsers()
+
+                if time.monotonic() - started > RESTART_MAX_DELAY:
+                    restart_delay = RESTART_DELAY
+                metrics.inc('restarts_total')
+                log.warning(f"Перезапуск главного цикла через {restart_delay:.0f} сек.")
+                time.sleep(restart_delay)
+                restart_delay = min(restart_delay * 2, RESTART_MAX_DELAY)
 
         return wrapper
     return decorator
@@ -47,18 +89,92 @@ def main_function_decorator():
 
 @main_function_decorator()
 def main():
-    while True:
-        vk_interaction = VKInteraction(browser_manager)
-        token = vk_interaction.get_vk_actual_access_token()
-        vk_manager = VKManager(token, browser_manager)
-        vk_manager.get_friends_list(USER_ID)
-        log.warning(f"Ожидание перед следующим обновлением: {REFRESH_INTERVAL} сек.")
-        time.sleep(REFRESH_INTERVAL)
-        log.info("Инициализация нового цикла обновления...")
-        log.info("")
+    tracker = FriendsTracker(browser_managers, TARGETS)
+    report_startup()
+    asyncio.run(tracker.run())
+
+
+@main_function_decorator()
+def run_daemon():
+    """Работа без окна: лог в файлы, остановка по SIGINT/SIGTERM"""
+
+    tracker = FriendsTracker(browser_managers, TARGETS)
+    report_startup()
+    try:
+        asyncio.run(serve(tracker))
+    finally:
+        stop_browsers()
+    log.info("Программа остановлена")
+
+
+async def serve(tracker:FriendsTracker):
+    """Запускает опрос и останавливает его по сигналу, повторный сигнал - завершение без ожидания"""
+
+    loop = asyncio.get_running_loop()
+
+    def stop(signum):
+        log.info(f"Получен сигнал {signal.Signals(signum).name}, останавливаюсь...")
+        try:
+            loop.remove_signal_handler(signum)
+        except NotImplementedError:
+            signal.signal(signum, signal.SIG_DFL)
+        tracker.stop()
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop, signum)
+        except NotImplementedError:
+            # Windows: обычный обработчик сигнала, tracker.stop() можно вызывать из любого потока
+            signal.signal(signum, lambda signum, frame: stop(signum))
+
+    await tracker.run()
+
+
+def startup_only():
+    """Запуск без окна до готовности к опросу и выход, для проверки времени запуска"""
+
+    tracker = FriendsTracker(browser_managers, TARGETS)
+    startup_seconds = report_startup()
+    print(json.dumps({'startup_seconds': startup_seconds, 'heavy_modules': heavy_modules_loaded()}))
+    tracker.executor.shutdown()
+    tracker.notifier.stop()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="VK Friends Tracker")
+    parser.add_argument('--daemon', action='store_true',
+                        help="работа без окна: лог в data/logs/tracker.log с ротацией, остановка по SIGINT/SIGTERM")
+    parser.add_argument('--check-startup', action='store_true',
+                        help="проверить время запуска без окна относительно data/startup_baseline.json")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="вместе с --check-startup: сохранить текущее время запуска как базовое")
+    parser.add_argument('--startup-only', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
+    args = parse_args()
+
+    if args.check_startup:
+        command = [sys.executable, sys.argv[0], '--daemon', '--startup-only']
+        ok = check_startup(command, int(get_env('STARTUP_CHECK_RUNS', '5')),
+                           float(get_env('STARTUP_TOLERANCE', '0.5')), args.update_baseline)
+        sys.exit(0 if ok else 1)
+
+    if args.daemon:
+        setup_file_logging()
+        if args.startup_only:
+            startup_only()
+        else:
+            run_daemon()
+        sys.exit(0)
+
+    # Qt загружается только в режиме с окном
+    from services.gui import start_gui
+
+    app, gui_window = start_gui(browser_managers)
+    log.info("GUI запущен")
+
     thread = threading.Thread(target=main, daemon=True)
     thread.start()
-    sys.exit(app.exec())
\ No newline at end of file
+    sys.exit(app.exec())
@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+from extensions.logging_ext import log
+from benchmark.stubs import SyntheticVK, VKStubServer, TelegramStubServer
+
+
+# Готовые сценарии: (отслеживаемых пользователей, друзей у каждого)
+SCENARIOS = {
+    'tiny': (1, 10),
+    'small': (25, 200),
+    'medium': (100, 1000),
+    # 1 млн связей, списки длиннее одной страницы friends.get
+    'large': (100, 10000),
+}
+
+# Показатели отчёта: (ключ, заголовок, множитель, формат)
+COLUMNS = (
+    ('cycle_p50', 'цикл p50, мс', 1000, '.1f'),
+    ('cycle_p90', 'p90, мс', 1000, '.1f'),
+    ('cycle_p99', 'p99, мс', 1000, '.1f'),
+    ('targets_per_minute', 'польз./мин', 1, '.0f'),
+    ('peak_rss_bytes', 'RSS, МБ', 1 / 2 ** 20, '.1f'),
+    ('disk_growth_per_cycle', 'диск/цикл, КБ', 1 / 1024, '.1f'),
+    ('bytes_written_per_cycle', 'файлы/цикл, КБ', 1 / 1024, '.1f'),
+    ('first_round_seconds', 'первый проход, с', 1, '.2f'),
+    ('vk_api_calls', 'запросов VK', 1, '.0f'),
+    ('telegram_sent', 'сообщений ТГ', 1, '.0f'),
+)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(name:str, targets:int, friends:int, args) -> dict:
+    """Поднимает заглушки VK и Telegram и прогоняет сценарий в отдельном процессе"""
+
+    log.info(f'Сценарий {name}: пользователей {targets}, друзей у каждого {friends}, связей {targets * friends}')
+    vk = SyntheticVK(targets, friends, args.churn, args.seed)
+    vk_server = VKStubServer(vk, args.latency_ms / 1000, args.error_rate, args.seed)
+    telegram_server = TelegramStubServer()
+    vk_url = vk_server.start()
+    telegram_url = telegram_server.start()
+
+    config = {
+        'targets': vk.targets(),
+        'rounds': args.rounds,
+        'concurrency': args.concurrency,
+        'full_check_interval': args.full_check_interval,
+        'advance_url': vk_url.replace('/method/', '/_bench/advance'),
+        'log_level': args.log_level,
+    }
+    env = dict(os.environ,
+               PYTHONPATH=ROOT_DIR,
+               VK_API_URL=vk_url,
+               VK_API_RPS=str(args.rps),
+               TG_API_URL=telegram_url,
+               TG_BOT_TOKEN='benchmark',
+               TG_CHAT_ID='1',
+               TG_COALESCE_WINDOW='0.1',
+               USER_ID='',
+               PROFILE_FIELDS='',
+               GRAPH_DEPTH='0')
+
+    try:
+        with tempfile.TemporaryDirectory(prefix='vk-bench-') as work_dir:
+            completed = subprocess.run([sys.executable, '-m', 'benchmark.scenario', json.dumps(config)],
+                                       cwd=work_dir, env=env, capture_output=True, text=True)
+    finally:
+        vk_server.stop()
+        telegram_server.stop()
+
+    if completed.returncode != 0:
+        raise RuntimeError(f'Сценарий {name} завершился с кодом {completed.returncode}:\n{completed.stderr.strip()}')
+    if completed.stderr.strip():
+        log.warning(f'Сценарий {name}:\n{completed.stderr.strip()}')
+
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result.update(targets=targets, friends=friends, edges=vk.edge_count(),
+                  vk_requests=vk_server.requests, vk_errors_injected=vk_server.errors,
+                  telegram_received=telegram_server.messages)
+    return result
+
+
+def print_report(results:dict, baseline:dict | None = None):
+    """Таблица результатов, с baseline - ещё и изменение к базовому прогону в процентах"""
+
+    for name, result in results.items():
+        print(f"\n{name}: пользователей {result['targets']}, друзей {result['friends']}, связей {result['edges']}, "
+              f"ошибок 6 внесено {result['vk_errors_injected']}, повторов {result['vk_api_retries']:.0f}, "
+              f"неудачных опросов {result['failed_polls']}")
+        print(f"  полных выгрузок: по пробе {result['full_checks_probe']:.0f}, "
+              f"плановых {result['full_checks_scheduled']:.0f}, изменений {result['changes']}")
+        base = (baseline or {}).get(name)
+        for key, title, scale, spec in COLUMNS:
+            value = result.get(key)
+            line = f'  {title:<20} {_format(value, scale, spec):>12}'
+            if base is not None and base.get(key) is not None:
+                line += f'  база {_format(base[key], scale, spec):>12}'
+                if value is not None and base[key]:
+                    line += f'  {(value - base[key]) / base[key] * 100:+.1f}%'
+            print(line)
+
+
+def _format(value, scale:float, spec:str) -> str:
+    return '-' if value is None else format(value * scale, spec)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m benchmark',
+                                     description="Офлайн бенчмарк опроса друзей на локальных заглушках VK и Telegram")
+    parser.add_argument('scenarios', nargs='*', default=['tiny', 'small', 'medium'],
+                        help=f"сценарии: {', '.join(SCENARIOS)} (по умолчанию tiny small medium)")
+    parser.add_argument('--targets', type=int, help="свой сценарий: количество пользователей")
+    parser.add_argument('--friends', type=int, help="свой сценарий: друзей у каждого")
+    parser.add_argument('--rounds', type=int, default=5, help="проходов по всем пользователям (первый - загрузка)")
+    parser.add_argument('--churn', type=float, default=0.01, help="доля друзей, заменяемых между проходами")
+    parser.add_argument('--latency-ms', type=float, default=0, help="задержка ответа заглушки VK, мс")
+    parser.add_argument('--error-rate', type=float, default=0, help="доля запросов с ошибкой 6")
+    parser.add_argument('--rps', type=float, default=1000, help="VK_API_RPS для прогона (в работе - 3)")
+    parser.add_argument('--concurrency', type=int, default=4, help="пачек одновременно (MAX_CONCURRENCY)")
+    # По умолчанию 0: замену друга при том же количестве и первом id проба не видит,
+    # и с интервалом как в работе (86400) изменения между проходами почти не выгружались бы
+    parser.add_argument('--full-check-interval', type=int, default=0,
+                        help="FULL_CHECK_INTERVAL, 0 - полная выгрузка каждый проход (по умолчанию)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='WARNING', help="уровень лога процесса сценария")
+    parser.add_argument('--save', help="сохранить результаты в JSON файл (базовый прогон)")
+    parser.add_argument('--compare', help="сравнить с результатами из JSON файла")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    scenarios = {}
+    if args.targets or args.friends:
+        scenarios['custom'] = (args.targets or 1, args.friends or 100)
+    else:
+        for name in args.scenarios:
+            if name not in SCENARIOS:
+                sys.exit(f"Неизвестный сценарий {name}, доступны: {', '.join(SCENARIOS)}")
+            scenarios[name] = SCENARIOS[name]
+
+    results = {name: run(name, targets, friends, args) for name, (targets, friends) in scenarios.items()}
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+        log.info(f'Результаты сохранены в {args.save}')
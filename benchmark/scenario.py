@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+import time
+import logging
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from extensions.logging_ext import log
+from extensions.path_ext import get_path
+from extensions.metrics_ext import metrics
+from extensions.deadline_ext import DeadlineExceeded
+from services.vk import VKManager
+from services.vk_client import VKError
+from services.storage import FriendsStorage
+from services.profile_cache import ProfileCache
+from services.tg_bot import TelegramNotifier
+
+
+def run_scenario(config:dict) -> dict:
+    """
+    Прогон одного сценария в отдельном процессе (каталог запуска - временный,
+    адреса заглушек заданы в VK_API_URL и TG_API_URL): config['rounds'] раз
+    опрашивает всех пользователей пачками по EXECUTE_BATCH_SIZE, как планировщик,
+    до config['concurrency'] пачек одновременно. Между проходами просит заглушку
+    VK изменить списки друзей. Первый проход (первичная загрузка списков)
+    в задержки и пропускную способность не входит, если проходов больше одного.
+    """
+
+    logging.getLogger().setLevel(config.get('log_level', 'WARNING'))
+    os.makedirs(get_path('data'), exist_ok=True)
+
+    storage = FriendsStorage()
+    profile_cache = ProfileCache(storage)
+    notifier = TelegramNotifier()
+    vk_manager = VKManager('benchmark', None, profile_cache, storage, notifier)
+    executor = ThreadPoolExecutor(max_workers=config['concurrency'])
+
+    targets = [str(target) for target in config['targets']]
+    batch_size = VKManager.EXECUTE_BATCH_SIZE
+    batches = [targets[start:start + batch_size] for start in range(0, len(targets), batch_size)]
+
+    def poll(batch):
+        started = time.perf_counter()
+        try:
+            with metrics.timer('cycle'):
+                result = vk_manager.poll_friends_lists(batch, config['full_check_interval'])
+        except (VKError, DeadlineExceeded) as e:
+            log.error(f'Пачка не опрошена: {e}')
+            result = dict.fromkeys(batch)
+        return time.perf_counter() - started, result
+
+    rounds = []
+    for number in range(config['rounds']):
+        if number:
+            urllib.request.urlopen(urllib.request.Request(config['advance_url'], data=b'', method='POST')).read()
+
+        size_before = _data_size()
+        written_before = metrics.counter_value('bytes_written_total')
+        started = time.perf_counter()
+        polls = list(executor.map(poll, batches))
+        rounds.append({
+            'seconds': time.perf_counter() - started,
+            'latencies': [latency for latency, _ in polls],
+            'changes': sum(changes or 0 for _, result in polls for changes in result.values()),
+            'failed': sum(changes is None for _, result in polls for changes in result.values()),
+            'disk_growth': _data_size() - size_before,
+            'bytes_written': metrics.counter_value('bytes_written_total') - written_before,
+        })
+
+    # Ждём, пока уведомления уйдут в заглушку Telegram
+    deadline = time.monotonic() + config.get('drain_timeout', 30)
+    while notifier.queue_size() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    notifier.stop()
+    executor.shutdown()
+
+    measured = rounds[1:] if len(rounds) > 1 else rounds
+    latencies = sorted(latency for measured_round in measured for latency in measured_round['latencies'])
+    measured_seconds = sum(measured_round['seconds'] for measured_round in measured)
+    cycles = sum(len(measured_round['latencies']) for measured_round in measured)
+
+    return {
+        'first_round_seconds': rounds[0]['seconds'],
+        'round_seconds': measured_seconds / len(measured),
+        'cycle_p50': _percentile(latencies, 0.5),
+        'cycle_p90': _percentile(latencies, 0.9),
+        'cycle_p99': _percentile(latencies, 0.99),
+        'cycle_max': latencies[-1] if latencies else None,
+        'targets_per_minute': len(targets) * len(measured) / measured_seconds * 60 if measured_seconds else None,
+        'peak_rss_bytes': _peak_rss(),
+        'disk_growth_per_cycle': sum(measured_round['disk_growth'] for measured_round in measured) / max(cycles, 1),
+        'bytes_written_per_cycle': sum(measured_round['bytes_written'] for measured_round in measured) / max(cycles, 1),
+        'storage_bytes': _data_size(),
+        'changes': sum(measured_round['changes'] for measured_round in measured),
+        'failed_polls': sum(measured_round['failed'] for measured_round in rounds),
+        'full_checks_probe': metrics.counter_value('full_checks_total', reason='probe'),
+        'full_checks_scheduled': metrics.counter_value('full_checks_total', reason='scheduled'),
+        'vk_api_calls': metrics.counter_value('vk_api_calls_total'),
+        'vk_api_retries': metrics.counter_value('vk_api_retries_total'),
+        'rate_limit_wait_seconds': metrics.counter_value('vk_rate_limit_wait_seconds_total'),
+        'telegram_sent': metrics.counter_value('telegram_messages_sent_total'),
+        'telegram_pending': notifier.queue_size(),
+    }
+
+
+def _data_size() -> int:
+    """Суммарный размер файлов в каталоге data (база, WAL, кэш профилей, очередь уведомлений)"""
+
+    total = 0
+    for directory, _, files in os.walk(get_path('data')):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _peak_rss() -> int | None:
+    """Пиковый объём памяти процесса в байтах, на Windows - None"""
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS - байты
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _percentile(values:list, q:float) -> float | None:
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+if __name__ == '__main__':
+    result = run_scenario(json.loads(sys.argv[1]))
+    print(json.dumps(result))
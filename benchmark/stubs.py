@@ -0,0 +1,201 @@
+import json
+import time
+import random
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class SyntheticVK:
+    """
+    Синтетические данные для заглушки VK: у каждого отслеживаемого пользователя
+    свой отсортированный список id друзей. advance() имитирует изменения между
+    циклами: у каждого пользователя заменяется в среднем доля churn друзей.
+    """
+
+    # Id синтетических пользователей не пересекаются с реальными
+    FIRST_TARGET = 2_000_000_000
+    MAX_FRIEND_ID = 999_999_999
+
+    def __init__(self, targets:int, friends:int, churn:float = 0.0, seed:int = 1):
+        self.churn = churn
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.friends = {}
+        for target in range(self.FIRST_TARGET, self.FIRST_TARGET + targets):
+            self.friends[target] = sorted(self.random.sample(range(1, self.MAX_FRIEND_ID), friends))
+
+
+    def targets(self) -> list[int]:
+        return list(self.friends)
+
+
+    def edge_count(self) -> int:
+        return sum(len(uids) for uids in self.friends.values())
+
+
+    def advance(self) -> int:
+        """Вносит изменения в списки друзей, возвращает количество заменённых друзей"""
+
+        replaced = 0
+        with self.lock:
+            for target, uids in self.friends.items():
+                count = min(len(uids), int(len(uids) * self.churn + self.random.random()))
+                if not count:
+                    continue
+                current = set(uids)
+                current.difference_update(self.random.sample(uids, count))
+                while len(current) < len(uids):
+                    current.add(self.random.randrange(1, self.MAX_FRIEND_ID))
+                self.friends[target] = sorted(current)
+                replaced += count
+        return replaced
+
+
+    def call(self, method:str, params:dict):
+        """Ответ на вызов метода API, None - ошибка доступа"""
+
+        if method == 'friends.get':
+            with self.lock:
+                uids = self.friends.get(int(params.get('user_id', 0)))
+            if uids is None:
+                return None
+            offset = int(params.get('offset', 0))
+            count = int(params.get('count', 5000))
+            return {'count': len(uids), 'items': uids[offset:offset + count]}
+
+        if method == 'users.get':
+            uids = [int(uid) for uid in str(params.get('user_ids', '')).split(',') if uid] or [self.FIRST_TARGET]
+            return [{'id': uid, 'first_name': f'Имя{uid}', 'last_name': f'Фамилия{uid}'} for uid in uids]
+
+        if method == 'execute':
+            # Код VKScript из VKManager._execute: return [API.method({...}),...];
+            code = params['code']
+            decoder = json.JSONDecoder()
+            responses = []
+            position = code.find('API.')
+            while position != -1:
+                name_end = code.index('(', position)
+                call_params, end = decoder.raw_decode(code, name_end + 1)
+                responses.append(self.call(code[position + 4:name_end], call_params) or False)
+                position = code.find('API.', end)
+            return responses
+
+        return {}
+
+
+class VKStubServer:
+    """
+    Локальная заглушка VK API: POST /method/<метод>, ответы из SyntheticVK.
+    latency - задержка каждого ответа в секундах, error_rate - доля запросов,
+    на которые возвращается ошибка 6 (слишком много запросов).
+    POST /_bench/advance - применить изменения списков друзей (SyntheticVK.advance).
+    """
+
+    def __init__(self, vk:SyntheticVK, latency:float = 0.0, error_rate:float = 0.0, seed:int = 1):
+        self.vk = vk
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.server = None
+
+
+    def start(self) -> str:
+        """Запускает сервер в фоновом потоке, возвращает адрес для VK_API_URL"""
+
+        self.server = _serve(self._handle)
+        return f'http://127.0.0.1:{self.server.server_port}/method/'
+
+
+    def stop(self):
+        _shutdown(self.server)
+
+
+    def _handle(self, path:str, body:bytes) -> tuple[int, dict]:
+        if path == '/_bench/advance':
+            return 200, {'replaced': self.vk.advance()}
+
+        params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.requests += 1
+            throttled = self.random.random() < self.error_rate
+            if throttled:
+                self.errors += 1
+        if throttled:
+            return 200, {'error': {'error_code': 6, 'error_msg': 'Too many requests per second'}}
+
+        response = self.vk.call(path.rsplit('/', 1)[-1], params)
+        if response is None:
+            return 200, {'error': {'error_code': 30, 'error_msg': 'This profile is private'}}
+        return 200, {'response': response}
+
+
+class TelegramStubServer:
+    """Локальная заглушка Telegram Bot API: принимает sendMessage и считает сообщения"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.characters = 0
+        self.server = None
+
+
+    def start(self) -> str:
+        """Запускает сервер в фоновом потоке, возвращает адрес для TG_API_URL"""
+
+        self.server = _serve(self._handle)
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+
+    def stop(self):
+        _shutdown(self.server)
+
+
+    def _handle(self, path:str, body:bytes) -> tuple[int, dict]:
+        if not path.endswith('/sendMessage'):
+            return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+        text = json.loads(body).get('text', '')
+        with self.lock:
+            self.messages += 1
+            self.characters += len(text)
+        return 200, {'ok': True, 'result': {'message_id': self.messages}}
+
+
+def _serve(handle) -> ThreadingHTTPServer:
+    """HTTP сервер на свободном порту 127.0.0.1 с keep-alive, handle(path, body) -> (статус, JSON)"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Заголовки и тело ответа уходят отдельными пакетами, без этого Nagle добавляет ~40 мс к ответу
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            status, data = handle(self.path, body)
+            payload = json.dumps(data, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _shutdown(server:ThreadingHTTPServer | None):
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+__all__ = ['SyntheticVK', 'VKStubServer', 'TelegramStubServer']
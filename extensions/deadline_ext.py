@@ -0,0 +1,111 @@
+import time
+import threading
+
+
+class DeadlineExceeded(Exception):
+    """Этап работы не уложился в свой срок или был отменён сторожем"""
+
+
+class Deadline:
+    """
+    Крайний срок этапа работы в потоке. Блокирующий код нельзя прервать извне,
+    поэтому срок проверяется в точках ожидания (check_deadline перед запросом
+    к API и в паузах между повторами), а таймауты запросов укорачиваются
+    до оставшегося времени (remaining_time, после срока - DeadlineExceeded).
+    Сроки вкладываются друг в друга: with Deadline(900, 'cycle'): ...
+    with Deadline(120, 'probe'): ... действует ближайший из них.
+    seconds None или <= 0 - без ограничения. Отсчёт начинается при первом входе
+    в with, то есть в потоке, который выполняет этап: ожидание свободного потока
+    пула в срок не входит. cancel() можно вызвать из другого потока, тогда этап
+    остановится в ближайшей точке проверки.
+    """
+
+    # Активные сроки текущего потока, вложенные - в конце
+    _local = threading.local()
+
+    def __init__(self, seconds:float | None, stage:str):
+        self.seconds = seconds
+        self.stage = stage
+        # Монотонное время окончания срока, до start() - None
+        self.expires_at = None
+        self.cancelled = threading.Event()
+
+
+    def start(self):
+        """Начинает отсчёт срока, если он ещё не начат"""
+
+        if self.expires_at is None:
+            self.expires_at = time.monotonic() + self.seconds if self.seconds and self.seconds > 0 else float('inf')
+
+
+    def remaining(self) -> float:
+        """Сколько секунд осталось, после отмены - 0"""
+
+        if self.cancelled.is_set():
+            return 0.0
+        if self.expires_at is None:
+            return float(self.seconds) if self.seconds and self.seconds > 0 else float('inf')
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+    def cancel(self):
+        """Отменяет этап, можно вызывать из любого потока"""
+
+        self.cancelled.set()
+
+
+    def check(self):
+        """Поднимает DeadlineExceeded, если срок вышел или этап отменён"""
+
+        if self.cancelled.is_set():
+            raise DeadlineExceeded(f'этап {self.stage} отменён')
+        if self.expires_at is not None and time.monotonic() >= self.expires_at:
+            raise DeadlineExceeded(f'этап {self.stage} не уложился в {self.seconds:g} сек.')
+
+
+    def __enter__(self) -> 'Deadline':
+        self.start()
+        _active().append(self)
+        return self
+
+
+    def __exit__(self, *exc_info):
+        _active().remove(self)
+
+
+def check_deadline():
+    """Точка проверки: поднимает DeadlineExceeded, если вышел срок любого активного этапа потока"""
+
+    for deadline in _active():
+        deadline.check()
+
+
+def remaining_time(default:float) -> float:
+    """
+    Оставшееся время ближайшего срока потока, но не больше default (например таймаута запроса).
+    Если срок уже вышел или этап отменён - поднимает DeadlineExceeded, поэтому
+    результат всегда больше нуля и годится как таймаут запроса или пауза.
+    """
+
+    timeout = default
+    for deadline in _active():
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            deadline.check()
+        timeout = min(timeout, remaining)
+    return timeout
+
+
+def deadline_expired() -> bool:
+    """Вышел ли срок хотя бы одного активного этапа потока"""
+
+    return any(deadline.remaining() <= 0 for deadline in _active())
+
+
+def _active() -> list:
+    stack = getattr(Deadline._local, 'stack', None)
+    if stack is None:
+        stack = Deadline._local.stack = []
+    return stack
+
+__all__ = ['Deadline', 'DeadlineExceeded', 'check_deadline', 'remaining_time', 'deadline_expired']
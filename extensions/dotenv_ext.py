@@ -7,11 +7,11 @@ from extensions.path_ext import get_path
 
 load_dotenv(dotenv_path=get_path('data', 'settings.env'))
 
-def get_env(env_name:str) -> str:
+def get_env(env_name:str, default:str | None = None) -> str:
     """
     Возвращает строку с данными по названию из .env файлой,
-    если данные не найдены - вернёт None.
+    если данные не найдены - вернёт default (по умолчанию None).
     """
-    return str(os.getenv(env_name, default=None))
+    return str(os.getenv(env_name, default=default))
 
 __all__ = ['get_env']
\ No newline at end of file
@@ -0,0 +1,47 @@
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_open(file_path:str, mode:str = 'wb', encoding:str | None = None):
+    """
+    Открывает файл на запись так, чтобы при сбое посреди записи старый файл остался целым:
+    пишется временный файл рядом, после успешной записи - fsync и атомарная замена (os.replace),
+    затем fsync каталога, чтобы замена пережила отключение питания.
+    Если внутри with произошла ошибка - временный файл удаляется, старый не трогается.
+    Пример: with atomic_open(path, 'w', encoding='utf-8') as f: json.dump(data, f)
+    """
+
+    directory = os.path.dirname(file_path)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = file_path + '.tmp'
+
+    f = open(tmp_path, mode, encoding=encoding)
+    try:
+        yield f
+        f.flush()
+        os.fsync(f.fileno())
+    except BaseException:
+        f.close()
+        os.remove(tmp_path)
+        raise
+    f.close()
+    os.replace(tmp_path, file_path)
+    _fsync_directory(directory)
+
+
+def _fsync_directory(directory:str):
+    """Сбрасывает на диск запись каталога, на Windows каталоги не открываются - пропускается"""
+
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+__all__ = ['atomic_open']
@@ -1,8 +1,36 @@
+import os
 import logging
+from logging.handlers import RotatingFileHandler
 
+from extensions.path_ext import get_path
+from extensions.dotenv_ext import get_env
+
+
+LOG_FORMAT = '[%(levelname)s] [%(filename)s] [%(asctime)s]: %(message)s'
+LOG_DATE_FORMAT = '%d-%m-%Y %H:%M:%S'
 
 logging.basicConfig(level=logging.INFO,
-                    format='[%(levelname)s] [%(filename)s] [%(asctime)s]: %(message)s',
-                    datefmt='%d-%m-%Y %H:%M:%S')
+                    format=LOG_FORMAT,
+                    datefmt=LOG_DATE_FORMAT)
+
+log = logging.getLogger(__name__)
+
+
+def setup_file_logging(file_path:str | None = None) -> RotatingFileHandler:
+    """
+    Подключает к логу запись в файл с ротацией (по умолчанию data/logs/tracker.log):
+    файл не больше LOG_MAX_BYTES байт, хранится LOG_BACKUPS старых файлов.
+    Используется в режиме без окна вместо вывода лога в GUI.
+    """
+
+    file_path = file_path or get_path('data', 'logs', 'tracker.log')
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    handler = RotatingFileHandler(file_path,
+                                  maxBytes=int(get_env('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+                                  backupCount=int(get_env('LOG_BACKUPS', '5')),
+                                  encoding='utf-8')
+    handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+    log.addHandler(handler)
+    return handler
 
-log = logging.getLogger(__name__)
\ No newline at end of file
+__all__ = ['log', 'setup_file_logging']
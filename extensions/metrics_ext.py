@@ -0,0 +1,219 @@
+import os
+import time
+import pstats
+import cProfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from extensions.logging_ext import log
+from extensions.path_ext import get_path
+
+
+class Metrics:
+    """
+    Счётчики и скользящие гистограммы длительности этапов работы, потокобезопасно.
+    Для каждой гистограммы хранятся последние WINDOW наблюдений (по ним считаются
+    квантили) и накопленные количество и сумма. Вывод - в текстовом формате Prometheus.
+    Также умеет один раз снять cProfile следующего цикла опроса (request_profile).
+    """
+
+    # Сколько последних наблюдений гистограммы хранится для квантилей
+    WINDOW = 1024
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.help = {}
+        self.profile_requested = threading.Event()
+
+
+    def inc(self, name:str, amount:float = 1, **labels):
+        """Увеличивает счётчик"""
+
+        key = (name, _labels_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+
+    def observe(self, name:str, value:float, **labels):
+        """Добавляет наблюдение в гистограмму"""
+
+        key = (name, _labels_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [deque(maxlen=self.WINDOW), 0, 0.0]
+            histogram[0].append(value)
+            histogram[1] += 1
+            histogram[2] += value
+
+
+    @contextmanager
+    def timer(self, stage:str):
+        """Замеряет длительность этапа: with metrics.timer('diff'): ..."""
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - started, stage=stage)
+
+
+    def gauge(self, name:str, callback, description:str = ''):
+        """Регистрирует показатель, значение которого берётся вызовом callback при выводе"""
+
+        with self.lock:
+            self.gauges[name] = callback
+            if description:
+                self.help[name] = description
+
+
+    def counter_value(self, name:str, **labels) -> float:
+        """Текущее значение счётчика, без labels - сумма по всем меткам"""
+
+        with self.lock:
+            if labels:
+                return self.counters.get((name, _labels_key(labels)), 0)
+            return sum(value for (counter, _), value in self.counters.items() if counter == name)
+
+
+    def quantile(self, name:str, q:float, **labels) -> float:
+        """Квантиль скользящего окна гистограммы (без labels - по всем меткам), если наблюдений нет - None"""
+
+        key = _labels_key(labels)
+        with self.lock:
+            values = sorted(value for (histogram, histogram_labels), (window, _, _) in self.histograms.items()
+                            if histogram == name and (not labels or histogram_labels == key) for value in window)
+        return _quantile(values, q)
+
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, sorted(values), count, total) for key, (values, count, total) in self.histograms.items())
+            gauges = sorted(self.gauges.items())
+
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in self.help:
+                    lines.append(f'# HELP {name} {self.help[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        for (name, labels), values, count, total in histograms:
+            header(name, 'summary')
+            for q in self.QUANTILES:
+                lines.append(f'{name}{_format_labels(labels + (("quantile", str(q)),))} {_quantile(values, q) or 0:.6f}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {total:.6f}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+
+        for name, callback in gauges:
+            try:
+                value = callback()
+            except Exception as e:
+                log.warning(f'Не удалось получить метрику {name}: {e}')
+                continue
+            header(name, 'gauge')
+            lines.append(f'{name} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+    def summary(self) -> str:
+        """Короткая сводка для строки состояния окна"""
+
+        cycle = self.quantile('stage_seconds', 0.5, stage='cycle')
+        api = self.quantile('vk_api_request_seconds', 0.5)
+        parts = [f"Циклов: {self.counter_value('cycles_total'):.0f}"]
+        if cycle is not None:
+            parts.append(f'цикл p50 {cycle:.2f} с')
+        parts.append(f"запросов VK: {self.counter_value('vk_api_calls_total'):.0f}"
+                     f" (повторов {self.counter_value('vk_api_retries_total'):.0f})")
+        if api is not None:
+            parts.append(f'запрос p50 {api * 1000:.0f} мс')
+        parts.append(f"ожидание лимита: {self.counter_value('vk_rate_limit_wait_seconds_total'):.1f} с")
+        parts.append(f"ТГ отправлено: {self.counter_value('telegram_messages_sent_total'):.0f}")
+        queue = self.gauges.get('telegram_queue_size')
+        if queue is not None:
+            parts.append(f'в очереди: {queue()}')
+        return ', '.join(parts)
+
+
+    def request_profile(self):
+        """Просит снять cProfile следующего цикла опроса"""
+
+        self.profile_requested.set()
+        log.info('Профилирование следующего цикла включено')
+
+
+    def profile_call(self, func, *args):
+        """
+        Вызывает func(*args). Если было запрошено профилирование - под cProfile
+        (только один вызов), результат пишется в data/cprofile/cycle-<время>.prof
+        и 20 самых дорогих функций выводятся в лог.
+        """
+
+        if not self.profile_requested.is_set():
+            return func(*args)
+        self.profile_requested.clear()
+
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, *args)
+        finally:
+            file_path = get_path('data', 'cprofile', f'cycle-{time.strftime("%Y%m%d-%H%M%S")}.prof')
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            profiler.dump_stats(file_path)
+            stats = _StatsLog()
+            pstats.Stats(profiler, stream=stats).sort_stats('cumulative').print_stats(20)
+            log.info(f'Профиль цикла сохранён в {file_path}:\n{stats.text()}')
+
+
+class _StatsLog:
+    """Поток для pstats, собирает вывод в строку"""
+
+    def __init__(self):
+        self.parts = []
+
+
+    def write(self, text:str):
+        self.parts.append(text)
+
+
+    def text(self) -> str:
+        return ''.join(self.parts).strip()
+
+
+def _labels_key(labels:dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels:tuple) -> str:
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def _quantile(values:list, q:float) -> float:
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+metrics = Metrics()
+
+__all__ = ['metrics', 'Metrics']
@@ -0,0 +1,46 @@
+import time
+import threading
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты запросов (token bucket), потокобезопасный.
+    rate - сколько запросов в секунду пополняется,
+    capacity - сколько запросов можно сделать подряд без ожидания.
+    """
+
+    def __init__(self, rate:float, capacity:float | None = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def acquire(self, tokens:float = 1) -> float:
+        """
+        Забирает токены из корзины, если их не хватает - ждёт пополнения.
+        Возвращает сколько секунд пришлось ждать.
+        """
+
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+
+            time.sleep(delay)
+            waited += delay
+
+
+    def _refill(self):
+        """Пополняет корзину пропорционально прошедшему времени"""
+
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+__all__ = ['TokenBucket']
@@ -0,0 +1,73 @@
+import sys
+import json
+import time
+import statistics
+import subprocess
+
+from extensions.logging_ext import log
+from extensions.path_ext import get_path
+
+
+# Модули, которые режим без окна не должен загружать при запуске
+HEAVY_MODULES = ('PyQt6', 'selenium', 'webdriver_manager', 'requests')
+
+
+def heavy_modules_loaded() -> list[str]:
+    """Какие из тяжёлых модулей уже импортированы"""
+
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def check_startup(command:list[str], runs:int = 5, tolerance:float = 0.5,
+                  update_baseline:bool = False, baseline_path:str | None = None) -> bool:
+    """
+    Проверка времени запуска на регрессию: runs раз запускает command (процесс
+    должен вывести последней строкой JSON с startup_seconds и heavy_modules) и сравнивает
+    медиану с сохранённой в data/startup_baseline.json. Проверка не пройдена, если
+    запуск стал медленнее больше чем на tolerance (доля) или загрузил тяжёлые модули.
+    Если базы нет или update_baseline - текущий результат сохраняется как база.
+    """
+
+    baseline_path = baseline_path or get_path('data', 'startup_baseline.json')
+    results = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=300)
+        wall_seconds = time.perf_counter() - started
+        if completed.returncode != 0:
+            log.error(f'Процесс запуска завершился с кодом {completed.returncode}:\n{completed.stderr.strip()}')
+            return False
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        result['wall_seconds'] = wall_seconds
+        results.append(result)
+
+    startup_seconds = statistics.median(result['startup_seconds'] for result in results)
+    wall_seconds = statistics.median(result['wall_seconds'] for result in results)
+    heavy_modules = sorted({name for result in results for name in result['heavy_modules']})
+    log.info(f'Запуск без окна: {startup_seconds:.3f} с до готовности, {wall_seconds:.3f} с весь процесс (медиана из {runs})')
+
+    if heavy_modules:
+        log.error(f'При запуске без окна загружены тяжёлые модули: {", ".join(heavy_modules)}')
+        return False
+
+    try:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = None
+
+    if baseline is None or update_baseline:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump({'startup_seconds': startup_seconds, 'wall_seconds': wall_seconds,
+                       'python': sys.version.split()[0], 'measured_at': int(time.time())}, f, indent=4)
+        log.info(f'Время запуска сохранено как базовое в {baseline_path}')
+        return True
+
+    limit = baseline['startup_seconds'] * (1 + tolerance)
+    if startup_seconds > limit:
+        log.error(f'Запуск замедлился: {startup_seconds:.3f} с, база {baseline["startup_seconds"]:.3f} с (допустимо до {limit:.3f} с)')
+        return False
+    log.info(f'Время запуска в норме: база {baseline["startup_seconds"]:.3f} с, допустимо до {limit:.3f} с')
+    return True
+
+__all__ = ['HEAVY_MODULES', 'heavy_modules_loaded', 'check_startup']
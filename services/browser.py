@@ -1,29 +1,50 @@
 import os
 import re
 import json
-
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import SessionNotCreatedException
-from webdriver_manager.chrome import ChromeDriverManager
+import threading
+import subprocess
 
 from extensions.logging_ext import log
 from extensions.path_ext import get_path
+from extensions.dotenv_ext import get_env
+from extensions.metrics_ext import metrics
+from extensions.file_ext import atomic_open
+from services.local_storage import LocalStorageReader
 
 
 class BrowserManager:
-    """Управление браузером"""
+    """
+    Управление браузером. Selenium и webdriver_manager импортируются
+    только при первом запуске браузера, чтобы не замедлять старт программы.
+    """
     
-    def __init__(self):
-        self.PROFILE_NAME = 'script'
-        self.PROFILE_DIR = get_path('data', 'profile_data')
+    # Путь к chromedriver, определяется один раз на процесс
+    _driver_path = None
+    # Аккаунт, профиль которого лежит в data/profile_data
+    DEFAULT_ACCOUNT = 'script'
+
+    def __init__(self, account:str | None = None):
+        # У каждого аккаунта VK свой каталог профиля Chrome, чтобы браузеры
+        # разных аккаунтов могли работать одновременно
+        self.ACCOUNT = account or self.DEFAULT_ACCOUNT
+        self.PROFILE_NAME = self.ACCOUNT
+        if self.ACCOUNT == self.DEFAULT_ACCOUNT:
+            self.PROFILE_DIR = get_path('data', 'profile_data')
+        else:
+            self.PROFILE_DIR = get_path('data', f'profile_data_{self.ACCOUNT}')
+        self.DRIVER_PATH_CACHE = get_path('data', 'chromedriver_path.txt')
+        # Через сколько секунд простоя закрывать тёплый браузер
+        self.IDLE_TIMEOUT = float(get_env('BROWSER_IDLE_TIMEOUT', '600'))
+        # Сколько секунд ждать загрузки страницы, после - TimeoutException вместо зависания driver.get
+        self.PAGE_LOAD_TIMEOUT = float(get_env('BROWSER_PAGE_LOAD_TIMEOUT', '60'))
+        # Сколько раз пытаться запустить браузер, если Chrome не создал сессию
+        self.START_ATTEMPTS = 3
         
         # Связь функций управления для одного экземпляра класса
         self.driver = None
+        self.headless = None
+        self.idle_timer = None
+        self.lock = threading.RLock()
 
 
     def start_browser(self, headless:bool | None = True):
@@ -32,54 +53,123 @@ class BrowserManager:
         если указать headless False - запустится обычном режиме,
         по умолчанию headless - True. Возвращает driver.
         Если есть зависший процесс браузера с аналогичным профилем - 
-        будет доталово пытаться его закрыть и запустить новый.
+        пытается его закрыть и запустить новый (до START_ATTEMPTS раз).
         Если есть уже запущенный экземпляр браузера - закроет его.
         При возникновении непредвиденной ошибки - вернёт None.
         """
 
-        try:
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        from selenium.webdriver.chrome.options import Options
+        from selenium.common.exceptions import SessionNotCreatedException
+
+        with self.lock, metrics.timer('browser_start'):
+            self._cancel_idle_timer()
             if self.driver:
                 self.stop_browser()
-                return self.start_browser(headless=headless)
-            
-            log.info('Попытка запуска браузера...')
-            options = Options()
-            options.add_argument(f'--profile-directory={self.PROFILE_NAME}')
-            options.add_argument(f'--user-data-dir={self.PROFILE_DIR}')
-            if headless:
-                log.info("Запуск браузера в headless режиме")
-                options.add_argument('--headless=new')
-                options.add_argument('--disable-gpu')
-                options.add_argument('--no-sandbox')
-                options.add_argument('--disable-dev-shm-usage')
-                options.add_argument('--window-size=900,600')
-        
-            service = Service(ChromeDriverManager().install())
-            self.driver = webdriver.Chrome(service=service, options=options)
-            log.info('Браузер успешно запущен')
-            return self.driver
-        
-        except SessionNotCreatedException:
-            log.error('Chrome не удалось создать сессию, пробуем закрыть зависший процесс...')
-            os.system('taskkill /f /im chrome.exe')
-            log.info('Повторная попытка')
-            return self.start_browser(headless=headless)
 
-        except Exception as e:
-            log.error(f'Произошла непредвиденная ошибка: {e}')
+            for attempt in range(1, self.START_ATTEMPTS + 1):
+                try:
+                    log.info(f'Попытка запуска браузера (профиль {self.PROFILE_NAME})...')
+                    options = Options()
+                    options.add_argument(f'--profile-directory={self.PROFILE_NAME}')
+                    options.add_argument(f'--user-data-dir={self.PROFILE_DIR}')
+                    if headless:
+                        log.info("Запуск браузера в headless режиме")
+                        options.add_argument('--headless=new')
+                        options.add_argument('--disable-gpu')
+                        options.add_argument('--no-sandbox')
+                        options.add_argument('--disable-dev-shm-usage')
+                        options.add_argument('--window-size=900,600')
+                
+                    service = Service(self._get_driver_path())
+                    self.driver = webdriver.Chrome(service=service, options=options)
+                    self.driver.set_page_load_timeout(self.PAGE_LOAD_TIMEOUT)
+                    self.headless = bool(headless)
+                    log.info('Браузер успешно запущен')
+                    return self.driver
+                
+                except SessionNotCreatedException as e:
+                    # Обычно это зависший процесс с тем же профилем или обновившийся Chrome,
+                    # для которого сохранённый chromedriver уже не подходит
+                    log.error(f'Chrome не удалось создать сессию: {e.msg}, пробуем закрыть зависший процесс '
+                              f'и заново определить chromedriver...')
+                    self._forget_driver_path()
+                    self._kill_profile_processes()
+                    log.info(f'Повторная попытка ({attempt}/{self.START_ATTEMPTS})')
+
+                except Exception as e:
+                    log.error(f'Произошла непредвиденная ошибка: {e}')
+                    return None
+
+            log.error('Не удалось запустить браузер')
             return None
-        
+
+
+    def ensure_browser(self, headless:bool | None = True):
+        """
+        Возвращает уже запущенный (тёплый) браузер, если он жив и в нужном режиме,
+        иначе запускает новый. Мёртвая сессия заменяется новой без повторных рекурсивных запусков.
+        """
+
+        with self.lock:
+            self._cancel_idle_timer()
+            if self.driver is not None and self.headless == bool(headless):
+                if self.is_alive():
+                    log.info('Используется уже запущенный браузер')
+                    return self.driver
+                log.warning('Сессия браузера не отвечает, запускаю новую')
+                self._drop_dead_driver()
+            return self.start_browser(headless=headless)
+
+
+    def release_browser(self):
+        """
+        Сообщает что браузер пока не нужен: он остаётся запущенным
+        и закрывается, если не понадобится в течение IDLE_TIMEOUT секунд.
+        """
+
+        with self.lock:
+            self._cancel_idle_timer()
+            if self.driver is None:
+                return
+            if self.IDLE_TIMEOUT <= 0:
+                self.stop_browser()
+                return
+            self.idle_timer = threading.Timer(self.IDLE_TIMEOUT, self._stop_idle_browser)
+            self.idle_timer.daemon = True
+            self.idle_timer.start()
+
+
+    def is_alive(self) -> bool:
+        """Проверяет, что сессия браузера отвечает"""
+
+        with self.lock:
+            if self.driver is None:
+                return False
+            try:
+                self.driver.execute_script('return 1')
+                return True
+            except Exception:
+                return False
+
 
     def stop_browser(self):
             """Останавливает процесс браузера"""
 
-            log.info("Попытка остановить браузер...")
-            if self.driver is not None:
-                self.driver.quit()
-                self.driver = None
-                log.info("Браузер успешно остановлен")
-            else:
-                log.info("Браузер не был запущен")
+            with self.lock:
+                self._cancel_idle_timer()
+                log.info("Попытка остановить браузер...")
+                if self.driver is not None:
+                    try:
+                        self.driver.quit()
+                        log.info("Браузер успешно остановлен")
+                    except Exception as e:
+                        log.warning(f"Браузер завершился с ошибкой: {e}")
+                    self.driver = None
+                    self.headless = None
+                else:
+                    log.info("Браузер не был запущен")
 
 
     def open_url(self, url: str):
@@ -98,14 +188,40 @@ class BrowserManager:
         если не найден - возвращает None.
         """
         
+        token_data = self.get_token_data(key_pattern)
+        if token_data is not None:
+            return token_data.get('access_token')
+        else:
+            return None
+
+
+    def get_token_data(self, key_pattern:str) -> dict:
+        """
+        Возвращает весь JSON ключа с токеном (access_token, expires и т.д.),
+        ищет по регулярному выражению, если не найден - возвращает None.
+        """
+
         data = self._get_data_from_localstorage()
         if data is not None:
-            token = self._parse_token(key_pattern, data)
-            return token
+            return self._parse_token_data(key_pattern, data)
         else:
             return None
 
 
+    def get_token_data_from_profile(self, key_pattern:str, origin:str = 'https://vk.com') -> dict:
+        """
+        Возвращает JSON ключа с токеном, прочитанный прямо из файлов localStorage профиля
+        (LevelDB в каталоге профиля), без запуска браузера. Если не найден - None.
+        """
+
+        log.info('Чтение localStorage из файлов профиля...')
+        with metrics.timer('localstorage_file_read'):
+            data = LocalStorageReader(self.PROFILE_DIR, self.PROFILE_NAME).read_origin(origin)
+        if not data:
+            return None
+        return self._parse_token_data(key_pattern, data)
+
+
     def wait_page_load(self, class1:str, class2:str) -> str:
         """
         Ожидает загрузки страницы, ждёт пока один из двух классов не появится.
@@ -113,14 +229,19 @@ class BrowserManager:
         Возвращает название класса который был обнаружен, если не обнаружен - None. 
         """
 
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+
         log.info('Ожидаем загрузки страницы...')
 
-        WebDriverWait(self.driver, 10).until(
-            EC.any_of(
-                EC.presence_of_element_located((By.CLASS_NAME, class1)),
-                EC.presence_of_element_located((By.CLASS_NAME, class2))
+        with metrics.timer('page_load'):
+            WebDriverWait(self.driver, 10).until(
+                EC.any_of(
+                    EC.presence_of_element_located((By.CLASS_NAME, class1)),
+                    EC.presence_of_element_located((By.CLASS_NAME, class2))
+                )
             )
-        )
 
         if self.driver.find_elements(By.CLASS_NAME, class1):
             log.info(f'Страница загружена. Найден класс - {class1}')
@@ -134,6 +255,99 @@ class BrowserManager:
             return None
 
 
+    def _get_driver_path(self) -> str:
+        """
+        Возвращает путь к chromedriver. Определяется один раз: берётся из CHROMEDRIVER_PATH,
+        из сохранённого data/chromedriver_path.txt или через ChromeDriverManager,
+        и запоминается на весь процесс и для следующих запусков
+        (пока Chrome не откажется создавать сессию, см. _forget_driver_path).
+        """
+
+        if BrowserManager._driver_path and os.path.exists(BrowserManager._driver_path):
+            return BrowserManager._driver_path
+
+        driver_path = get_env('CHROMEDRIVER_PATH', '')
+        if not driver_path and os.path.exists(self.DRIVER_PATH_CACHE):
+            with open(self.DRIVER_PATH_CACHE, "r", encoding="utf-8") as f:
+                driver_path = f.read().strip()
+
+        if not driver_path or not os.path.exists(driver_path):
+            from webdriver_manager.chrome import ChromeDriverManager
+
+            log.info('Определяю путь к chromedriver...')
+            driver_path = ChromeDriverManager().install()
+            with atomic_open(self.DRIVER_PATH_CACHE, 'w', encoding='utf-8') as f:
+                f.write(driver_path)
+
+        BrowserManager._driver_path = driver_path
+        return driver_path
+
+
+    def _kill_profile_processes(self):
+        """
+        Завершает зависшие процессы Chrome только этого профиля (по аргументу --user-data-dir),
+        браузеры других аккаунтов, в том числе ожидающие авторизацию, не трогаются
+        """
+
+        marker = f'--user-data-dir={self.PROFILE_DIR}'
+        if os.name == 'nt':
+            # Аргумент должен закончиться сразу после пути, иначе profile_data совпадёт с profile_data_<аккаунт>
+            pattern = re.escape(marker).replace("'", "''") + r'("|\s|$)'
+            command = ['powershell', '-NoProfile', '-Command',
+                       "Get-CimInstance Win32_Process -Filter \"Name = 'chrome.exe'\" | "
+                       f"Where-Object {{ $_.CommandLine -match '{pattern}' }} | "
+                       "ForEach-Object { Stop-Process -Id $_.ProcessId -Force }"]
+        else:
+            pattern = re.sub(r'([.\[\]()*+?{}|^$\\])', r'\\\1', marker) + '( |$)'
+            command = ['pkill', '-f', '--', pattern]
+
+        try:
+            subprocess.run(command, capture_output=True, timeout=30)
+        except (OSError, subprocess.SubprocessError) as e:
+            log.warning(f'Не удалось завершить процессы браузера профиля {self.PROFILE_NAME}: {e}')
+
+
+    def _forget_driver_path(self):
+        """
+        Забывает сохранённый путь к chromedriver: после обновления Chrome старый драйвер
+        не создаёт сессию, при следующем запуске путь определится заново
+        """
+
+        BrowserManager._driver_path = None
+        try:
+            os.remove(self.DRIVER_PATH_CACHE)
+        except FileNotFoundError:
+            pass
+
+
+    def _stop_idle_browser(self):
+        """Вызывается таймером простоя"""
+
+        with self.lock:
+            # Таймер могли отменить, пока он ждал блокировку
+            if self.idle_timer is not threading.current_thread():
+                return
+            log.info('Браузер простаивает, закрываю')
+            self.stop_browser()
+
+
+    def _cancel_idle_timer(self):
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+
+
+    def _drop_dead_driver(self):
+        """Забывает неотвечающую сессию, процесс драйвера завершается по возможности"""
+
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+        self.driver = None
+        self.headless = None
+
+
     def _get_data_from_localstorage(self):
         """
         Получаем все данные key - value из localStorage браузера.
@@ -154,7 +368,8 @@ class BrowserManager:
         """
         
         try:
-            data = self.driver.execute_script(js)
+            with metrics.timer('localstorage_js_read'):
+                data = self.driver.execute_script(js)
             log.info("LocalStorage успешно прочитан")
         
         except Exception as e:
@@ -177,28 +392,40 @@ class BrowserManager:
         Попытаться извлечь token из полученных данных localStorage,
         возвращает токен или None. Ищет по регулярному выражению.
         """
+
+        token_data = self._parse_token_data(key_pattern, data)
+        if token_data is not None:
+            return token_data.get('access_token')
+        return None
+
+
+    def _parse_token_data(self, key_pattern:str, data:dict) -> dict:
+        """
+        Попытаться извлечь JSON с токеном из полученных данных localStorage,
+        возвращает dict с access_token и метаданными (expires и т.д.) или None.
+        Ищет по регулярному выражению.
+        """
         
         log.info("Начинаем поиск токена в localStorage...")
         # Ищем ключи по шаблону
         matched = [(key, value) for key, value in data.items() if key_pattern in key or re.search(key_pattern, key)]
         if not matched:
             log.warning(f"Ключ с шаблоном {key_pattern} не найден")
-            token = None
-        else:
-            # Берём последний элемент (предположительно самый новый)
-            _, value = matched[-1]
+            return None
 
-            # Парсим JSON и достаём token
-            try:
-                value_json = json.loads(value)
-                token = value_json.get('access_token')
-                if token:
-                    log.info("Access_token найден")
-                else:
-                    log.warning("Access_token не найден в JSON")
+        # Берём последний элемент (предположительно самый новый)
+        _, value = matched[-1]
+
+        # Парсим JSON и достаём token
+        try:
+            value_json = json.loads(value)
+        except (json.JSONDecodeError, TypeError):
+            log.warning("Не удалось распарсить значение ключа JSON")
+            return None
+
+        if not isinstance(value_json, dict) or not value_json.get('access_token'):
+            log.warning("Access_token не найден в JSON")
+            return None
 
-                return token
-            
-            except json.JSONDecodeError:
-                log.warning("Не удалось распарсить значение ключа JSON")
-                token = None
\ No newline at end of file
+        log.info("Access_token найден")
+        return value_json
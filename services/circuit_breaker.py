@@ -0,0 +1,58 @@
+import random
+
+from extensions.logging_ext import log
+from extensions.dotenv_ext import get_env
+
+
+class CircuitBreaker:
+    """
+    Предохранитель опроса для каждого пользователя отдельно. После FAILURE_THRESHOLD
+    неудачных опросов подряд он размыкается: следующий опрос откладывается
+    на интервал пользователя, умноженный на 2, 4, 8... (не больше BACKOFF_MAX секунд,
+    со случайным разбросом). Опрос после паузы - пробный: удача замыкает предохранитель,
+    неудача удваивает паузу. Неудачи одного пользователя не замедляют остальных.
+    Вызывается только из цикла asyncio.
+    """
+
+    # Случайный разброс паузы, доля
+    JITTER = 0.1
+
+    def __init__(self):
+        self.FAILURE_THRESHOLD = int(get_env('BREAKER_FAILURE_THRESHOLD', '3'))
+        self.BACKOFF_MAX = float(get_env('BREAKER_BACKOFF_MAX', '21600'))
+
+        # Пользователь -> неудачных опросов подряд
+        self.failures = {}
+
+
+    def record_success(self, target:str):
+        """Опрос пользователя удался: счётчик неудач сбрасывается, предохранитель замыкается"""
+
+        failures = self.failures.pop(target, 0)
+        if failures >= self.FAILURE_THRESHOLD:
+            log.info(f'Пользователь {target}: опрос снова удаётся после {failures} неудач, обычный интервал восстановлен')
+
+
+    def record_failure(self, target:str, interval:float) -> float:
+        """
+        Опрос пользователя не удался. Если предохранитель разомкнут - возвращает
+        паузу до следующего (пробного) опроса в секундах, иначе None (обычный интервал).
+        """
+
+        failures = self.failures[target] = self.failures.get(target, 0) + 1
+        if failures < self.FAILURE_THRESHOLD:
+            return None
+
+        exponent = min(failures - self.FAILURE_THRESHOLD + 1, 30)
+        delay = max(interval, min(interval * 2 ** exponent, self.BACKOFF_MAX))
+        delay *= random.uniform(1 - self.JITTER, 1 + self.JITTER)
+        log.warning(f'Пользователь {target}: неудачных опросов подряд {failures}, следующая попытка через {delay:.0f} сек.')
+        return delay
+
+
+    def open_count(self) -> int:
+        """Сколько пользователей сейчас с разомкнутым предохранителем"""
+
+        return sum(1 for failures in self.failures.values() if failures >= self.FAILURE_THRESHOLD)
+
+__all__ = ['CircuitBreaker']
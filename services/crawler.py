@@ -0,0 +1,194 @@
+import os
+import time
+from array import array
+
+from extensions.logging_ext import log
+from extensions.path_ext import get_path
+from extensions.dotenv_ext import get_env
+from services.graph import FriendsGraph, pack_edge
+
+
+class GraphCrawler:
+    """
+    Обход окружения пользователя поверх VKManager: кто из его друзей дружит
+    между собой (friends.getMutual с target_uids пачками, depth 1) и полные
+    списки друзей его друзей - второй круг (friends.get, depth 2).
+    За один вызов crawl тратится не больше GRAPH_CRAWL_BUDGET запросов, прогресс
+    хранится в базе, поэтому обход продолжается со следующего опроса и после перезапуска.
+    Завершённый обход сохраняется графом CSR в data/graph/<id>.csr и сравнивается
+    с прошлым: добавленные и пропавшие связи пишутся в журнал graph_events.
+    Новый обход начинается не раньше чем через GRAPH_CRAWL_INTERVAL секунд.
+    """
+
+    # Сколько id принимает target_uids одного вызова friends.getMutual
+    MUTUAL_BATCH_SIZE = 100
+    # Id упаковываются в связь по 32 бита
+    MAX_UID = FriendsGraph.MAX_UID
+
+    def __init__(self, vk_manager, graph_dir:str | None = None):
+        self.vk_manager = vk_manager
+        self.storage = vk_manager.storage
+        self.GRAPH_DIR = graph_dir or get_path('data', 'graph')
+        self.DEPTH = int(get_env('GRAPH_DEPTH', '0'))
+        self.BUDGET = int(get_env('GRAPH_CRAWL_BUDGET', '20'))
+        self.INTERVAL = int(get_env('GRAPH_CRAWL_INTERVAL', '604800'))
+
+
+    def crawl(self, user_id:str) -> bool:
+        """
+        Продолжает (или начинает, если пора) обход окружения пользователя.
+        Возвращает True, если обход завершился в этом вызове.
+        Пользователи с id больше MAX_UID не обходятся: их связи не упаковать в граф.
+        """
+
+        target = int(user_id)
+        if not 0 < target <= self.MAX_UID:
+            log.warning(f'Обход графа друзей пользователя {user_id} пропущен: id больше {self.MAX_UID}')
+            return False
+        now = int(time.time())
+        crawl_round = self.storage.load_crawl_round(target)
+        if crawl_round is not None and crawl_round['finished_at'] is not None:
+            if now - crawl_round['finished_at'] < self.INTERVAL and crawl_round['depth'] == self.DEPTH:
+                return False
+            crawl_round = None
+
+        if crawl_round is None or crawl_round['depth'] != self.DEPTH:
+            nodes = self.storage.load_snapshot(target).uids
+            self.storage.start_crawl_round(target, self.DEPTH, nodes, now)
+            log.info(f'Начат обход графа друзей пользователя {user_id}: друзей {len(nodes)}, глубина {self.DEPTH}')
+        else:
+            nodes = crawl_round['nodes']
+
+        budget = self._crawl_mutual(target, nodes, self.BUDGET)
+        pending = len(nodes) - len(self.storage.crawled_uids(target, 'mutual'))
+        if self.DEPTH >= 2:
+            if budget > 0:
+                budget = self._crawl_friends(target, nodes, budget)
+            pending += len(nodes) - len(self.storage.crawled_uids(target, 'friends'))
+
+        if pending:
+            log.info(f'Обход графа друзей пользователя {user_id}: осталось {pending} списков, продолжение в следующий опрос')
+            return False
+
+        self._finish_round(target, nodes)
+        return True
+
+
+    def graph_path(self, target:int) -> str:
+        return os.path.join(self.GRAPH_DIR, f'{target}.csr')
+
+
+    def _crawl_mutual(self, target:int, nodes:array, budget:int) -> int:
+        """
+        Общие друзья пользователя с каждым его другом: до MUTUAL_BATCH_SIZE друзей
+        в одном friends.getMutual, до EXECUTE_BATCH_SIZE вызовов в одном execute.
+        Возвращает остаток бюджета.
+        """
+
+        crawled = self.storage.crawled_uids(target, 'mutual')
+        pending = [uid for uid in nodes if uid not in crawled]
+        request_size = self.MUTUAL_BATCH_SIZE * self.vk_manager.EXECUTE_BATCH_SIZE
+
+        while pending and budget > 0:
+            chunk, pending = pending[:request_size], pending[request_size:]
+            batches = [chunk[start:start + self.MUTUAL_BATCH_SIZE] for start in range(0, len(chunk), self.MUTUAL_BATCH_SIZE)]
+            responses = self.vk_manager._execute([('friends.getMutual', {'source_uid': target, 'target_uids': ','.join(map(str, batch))})
+                                                  for batch in batches])
+            budget -= 1
+
+            # Друзья, для которых VK ничего не вернул, считаются без общих друзей
+            lists = {uid: array('q') for uid in chunk}
+            for response in responses:
+                for item in response or ():
+                    lists[item['id']] = array('q', item.get('common_friends') or ())
+            self.storage.save_crawl_lists(target, 'mutual', lists)
+        return budget
+
+
+    def _crawl_friends(self, target:int, nodes:array, budget:int) -> int:
+        """
+        Полные списки друзей друзей: первые страницы по EXECUTE_BATCH_SIZE в одном execute,
+        остальные страницы - отдельными запросами. Бюджет проверяется перед каждым списком:
+        если на его оставшиеся страницы бюджета не хватает, проход останавливается,
+        а список и следующие за ним остаются на следующий опрос. Единственный
+        список, который не помещается даже в весь бюджет, выгружается с превышением.
+        Возвращает остаток бюджета.
+        """
+
+        crawled = self.storage.crawled_uids(target, 'friends')
+        pending = [uid for uid in nodes if uid not in crawled]
+        batch_size = self.vk_manager.EXECUTE_BATCH_SIZE
+        saved = 0
+
+        while pending and budget > 0:
+            batch = pending[:batch_size]
+            responses = self.vk_manager._execute([('friends.get', {'user_id': uid, 'count': self.vk_manager.FRIENDS_PAGE_SIZE})
+                                                  for uid in batch])
+            budget -= 1
+
+            lists = {}
+            exhausted = False
+            for uid, response in zip(batch, responses):
+                extra_pages = self._extra_pages(response)
+                if extra_pages > budget and (saved or lists):
+                    exhausted = True
+                    break
+                uids = array('q')
+                if response:
+                    pages = 0
+                    for page in self.vk_manager.iter_friends_pages(str(uid), first_response=response):
+                        uids.extend(page)
+                        pages += 1
+                    # Первая страница пришла в execute, остальные - отдельными запросами
+                    budget -= max(0, pages - 1)
+                lists[uid] = uids
+
+            if lists:
+                self.storage.save_crawl_lists(target, 'friends', lists)
+                saved += len(lists)
+            # Списки обрабатываются по порядку, сохранённые - начало пачки
+            pending = pending[len(lists):]
+            if exhausted:
+                break
+        return budget
+
+
+    def _extra_pages(self, response) -> int:
+        """Сколько запросов friends.get понадобится после первой страницы из execute (по полю count)"""
+
+        if not response or not response['items']:
+            return 0
+        left = response['count'] - len(response['items'])
+        if left <= 0:
+            return 0
+        step = self.vk_manager.FRIENDS_PAGE_SIZE - self.vk_manager.FRIENDS_PAGE_OVERLAP
+        return -(-left // step)
+
+
+    def _finish_round(self, target:int, nodes:array):
+        """
+        Собирает граф из результатов обхода, сравнивает с прошлым и сохраняет.
+        Вершины с id больше MAX_UID пропускаются.
+        """
+
+        edges = array('Q')
+        edges.extend(pack_edge(target, uid) for uid in nodes if 0 < uid <= self.MAX_UID)
+        for phase in ('mutual', 'friends'):
+            for uid, uids in self.storage.load_crawl_lists(target, phase):
+                edges.extend(pack_edge(uid, neighbour) for neighbour in uids if 0 < neighbour <= self.MAX_UID)
+
+        graph = FriendsGraph.from_edges(edges)
+        file_path = self.graph_path(target)
+        first_round = not os.path.exists(file_path)
+        previous = FriendsGraph.open(file_path)
+        added, removed = ([], []) if first_round else previous.diff(graph)
+        previous.close()
+
+        self.storage.finish_crawl_round(target, added, removed)
+        graph.write(file_path)
+        log.info(f'Обход графа друзей пользователя {target} завершён: вершин {len(graph)}, связей {graph.edge_count()}, '
+                 f'новых связей {len(added)}, пропавших {len(removed)}')
+
+        if added or removed:
+            self.vk_manager.notifier.notify(f'Граф друзей пользователя vk.com/id{target}: '
+                                            f'новых связей {len(added)}, пропавших {len(removed)}')
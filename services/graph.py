@@ -0,0 +1,196 @@
+import os
+import mmap
+import heapq
+import struct
+from array import array
+from bisect import bisect_left
+
+from extensions.file_ext import atomic_open
+from extensions.metrics_ext import metrics
+from services.snapshot import diff_sorted
+
+
+class FriendsGraph:
+    """
+    Граф дружбы в формате CSR (compressed sparse row) в одном файле:
+    заголовок, отсортированные id вершин, смещения строк и соседи каждой
+    вершины подряд (по возрастанию). Все числа - int64 little-endian.
+    Файл открывается через mmap: чтобы получить соседей вершины,
+    весь граф в память не загружается. Связи неориентированные,
+    каждая хранится в обеих строках.
+    """
+
+    MAGIC = b'VKFG'
+    VERSION = 1
+    # magic, версия, количество вершин, количество записей соседей
+    HEADER = struct.Struct('<4sIQQ')
+    # Id упаковываются в связь по 32 бита (см. pack_edge)
+    MAX_UID = 0xffffffff
+    # По сколько связей сортируется за раз при сборке графа
+    SORT_CHUNK = 1 << 16
+
+    def __init__(self, nodes, offsets, neighbours, mapping:mmap.mmap | None = None):
+        self.nodes = nodes
+        self.offsets = offsets
+        self.neighbours_data = neighbours
+        self.mapping = mapping
+
+
+    @classmethod
+    def open(cls, file_path:str) -> 'FriendsGraph':
+        """Открывает файл графа через mmap, если файла нет - вернёт пустой граф"""
+
+        if not os.path.exists(file_path) or os.path.getsize(file_path) <= cls.HEADER.size:
+            return cls.from_edges(array('Q'))
+
+        with open(file_path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, node_count, entry_count = cls.HEADER.unpack_from(mapping, 0)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            mapping.close()
+            raise ValueError(f'{file_path}: не файл графа')
+
+        view = memoryview(mapping)[cls.HEADER.size:].cast('q')
+        nodes = view[:node_count]
+        offsets = view[node_count:2 * node_count + 1]
+        neighbours = view[2 * node_count + 1:2 * node_count + 1 + entry_count]
+        return cls(nodes, offsets, neighbours, mapping)
+
+
+    @classmethod
+    def from_edges(cls, edges:array) -> 'FriendsGraph':
+        """
+        Собирает граф в памяти из связей, упакованных в array('Q') как (a << 32) | b.
+        Каждая связь добавляется в обе стороны, повторы отбрасываются.
+        Связи сортируются на месте частями по SORT_CHUNK и сливаются при сборке строк,
+        поэтому списком Python одновременно бывает не больше одной части.
+        """
+
+        directed = array('Q', edges)
+        directed.extend((edge & 0xffffffff) << 32 | edge >> 32 for edge in edges)
+        for start in range(0, len(directed), cls.SORT_CHUNK):
+            directed[start:start + cls.SORT_CHUNK] = array('Q', sorted(directed[start:start + cls.SORT_CHUNK]))
+
+        nodes = array('q')
+        offsets = array('q')
+        neighbours = array('q')
+        previous = None
+        with memoryview(directed) as view:
+            runs = [view[start:start + cls.SORT_CHUNK] for start in range(0, len(directed), cls.SORT_CHUNK)]
+            for edge in heapq.merge(*runs):
+                if edge == previous:
+                    continue
+                previous = edge
+                source = edge >> 32
+                if not nodes or nodes[-1] != source:
+                    nodes.append(source)
+                    offsets.append(len(neighbours))
+                neighbours.append(edge & 0xffffffff)
+            for run in runs:
+                run.release()
+        offsets.append(len(neighbours))
+        return cls(nodes, offsets, neighbours)
+
+
+    def write(self, file_path:str):
+        """Записывает граф во временный файл и атомарно подменяет им file_path"""
+
+        with atomic_open(file_path) as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, len(self.nodes), len(self.neighbours_data)))
+            for part in (self.nodes, self.offsets, self.neighbours_data):
+                f.write(part if isinstance(part, memoryview) else part.tobytes())
+            metrics.inc('bytes_written_total', f.tell(), file='graph')
+
+
+    def close(self):
+        """Освобождает mmap, если граф открыт из файла"""
+
+        if self.mapping is not None:
+            for view in (self.nodes, self.offsets, self.neighbours_data):
+                view.release()
+            self.mapping.close()
+            self.mapping = None
+
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+
+    def __contains__(self, uid:int) -> bool:
+        return self._index(uid) is not None
+
+
+    def edge_count(self) -> int:
+        return len(self.neighbours_data) // 2
+
+
+    def neighbours(self, uid:int):
+        """Возвращает соседей вершины по возрастанию (срез без копирования), если вершины нет - пустой"""
+
+        index = self._index(uid)
+        if index is None:
+            return self.neighbours_data[0:0]
+        return self.neighbours_data[self.offsets[index]:self.offsets[index + 1]]
+
+
+    def iter_edges(self):
+        """Отдаёт связи (a, b), a < b, по возрастанию"""
+
+        for index, uid in enumerate(self.nodes):
+            row = self.neighbours_data[self.offsets[index]:self.offsets[index + 1]]
+            for neighbour in row[bisect_left(row, uid + 1):]:
+                yield uid, neighbour
+
+
+    def diff(self, new:'FriendsGraph') -> tuple[list[tuple[int, int]], list[tuple[int, int]]]:
+        """
+        Возвращает (добавленные, пропавшие) связи (a, b), a < b, относительно более
+        нового графа new. Строки вершин сравниваются слиянием отсортированных списков.
+        """
+
+        added = []
+        removed = []
+        i = j = 0
+        while i < len(self.nodes) or j < len(new.nodes):
+            old_uid = self.nodes[i] if i < len(self.nodes) else None
+            new_uid = new.nodes[j] if j < len(new.nodes) else None
+            if new_uid is None or (old_uid is not None and old_uid < new_uid):
+                uid, old_row, new_row = old_uid, self._row(i), ()
+                i += 1
+            elif old_uid is None or new_uid < old_uid:
+                uid, old_row, new_row = new_uid, (), new._row(j)
+                j += 1
+            else:
+                uid, old_row, new_row = old_uid, self._row(i), new._row(j)
+                i += 1
+                j += 1
+
+            row_added, row_removed = diff_sorted(old_row, new_row)
+            added.extend((uid, neighbour) for neighbour in row_added if neighbour > uid)
+            removed.extend((uid, neighbour) for neighbour in row_removed if neighbour > uid)
+        return added, removed
+
+
+    def _row(self, index:int):
+        return self.neighbours_data[self.offsets[index]:self.offsets[index + 1]]
+
+
+    def _index(self, uid:int) -> int:
+        index = bisect_left(self.nodes, uid)
+        if index < len(self.nodes) and self.nodes[index] == uid:
+            return index
+        return None
+
+
+def pack_edge(a:int, b:int) -> int:
+    """
+    Упаковывает связь в одно 64-битное число для array('Q').
+    Id больше FriendsGraph.MAX_UID не помещаются в 32 бита - ValueError.
+    """
+
+    if not (0 <= a <= FriendsGraph.MAX_UID and 0 <= b <= FriendsGraph.MAX_UID):
+        raise ValueError(f'Связь {a} - {b}: id не помещается в 32 бита')
+    return a << 32 | b
+
+__all__ = ['FriendsGraph', 'pack_edge']
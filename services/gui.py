@@ -1,44 +1,92 @@
 import logging
+from collections import deque
 
-from PyQt6.QtWidgets import QApplication, QMainWindow, QTextEdit, QSystemTrayIcon, QMenu
-from PyQt6.QtGui import QIcon, QAction
-from PyQt6.QtCore import Qt, QObject, pyqtSignal
+from PyQt6.QtWidgets import QApplication, QMainWindow, QPlainTextEdit, QSystemTrayIcon, QMenu
+from PyQt6.QtGui import QIcon, QAction, QColor, QFont, QTextCharFormat, QTextCursor
+from PyQt6.QtCore import Qt, QTimer
 
 from extensions.logging_ext import log
 from extensions.path_ext import get_path
+from extensions.dotenv_ext import get_env
+from extensions.metrics_ext import metrics
 
 
-class QTextEditLogger(logging.Handler, QObject):
-    append_text = pyqtSignal(str, str)  # текст + цвет
+class QTextEditLogger(logging.Handler):
+    """
+    Вывод лога в окно без роста памяти и без сигнала на каждую запись:
+    записи складываются в кольцевой буфер на capacity строк (старые вытесняются),
+    таймер в потоке GUI раз в flush_interval мс дописывает новые записи в виджет
+    одним блоком простого текста с форматом по уровню. Пока окно скрыто,
+    записи только копятся в буфере и не форматируются.
+    """
 
-    def __init__(self, text_edit: QTextEdit, font_size: int = 10):
-        QObject.__init__(self)
+    def __init__(self, text_edit: QPlainTextEdit, capacity: int, flush_interval: int):
         logging.Handler.__init__(self)
         self.widget = text_edit
-        self.font_size = font_size
-        self.append_text.connect(self.append_html)
+        self.widget.setMaximumBlockCount(capacity)
+        self.records = deque(maxlen=capacity)
+        # Номер последней принятой и последней выведенной записи
+        self.received = 0
+        self.shown = 0
+        self.formats = {}
+        for level, color in ((logging.ERROR, "red"), (logging.WARNING, "orange"), (logging.NOTSET, "white")):
+            text_format = QTextCharFormat()
+            text_format.setForeground(QColor(color))
+            self.formats[level] = text_format
+
+        self.timer = QTimer(self.widget)
+        self.timer.timeout.connect(self.flush_to_widget)
+        self.timer.start(flush_interval)
 
     def emit(self, record):
-        msg = self.format(record)
-        # цвет по уровню лога
-        if record.levelno >= logging.ERROR:
-            color = "red"
-        elif record.levelno >= logging.WARNING:
-            color = "orange"
-        else:
-            color = "white"
-        self.append_text.emit(msg, color)
-
-    def append_html(self, msg, color):
-        html = f'<span style="color:{color}; font-size:{self.font_size}pt;">{msg}</span>'
-        self.widget.append(html)
+        # Вызывается под блокировкой обработчика из любого потока
+        self.received += 1
+        self.records.append((self.received, record))
+
+    def flush_to_widget(self):
+        """Дописывает в виджет записи, появившиеся после прошлого вывода (поток GUI)"""
+
+        window = self.widget.window()
+        if not window.isVisible() or window.isMinimized():
+            return
+
+        self.acquire()
+        try:
+            if self.received == self.shown:
+                return
+            pending = [record for number, record in self.records if number > self.shown]
+            # Пока окно было скрыто, часть невыведенных записей вытеснена из буфера
+            overflow = self.received - self.shown > len(pending)
+            self.shown = self.received
+        finally:
+            self.release()
+
+        if overflow:
+            self.widget.clear()
+        cursor = QTextCursor(self.widget.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.beginEditBlock()
+        for record in pending:
+            if not self.widget.document().isEmpty():
+                cursor.insertBlock()
+            cursor.insertText(self.format(record), self._text_format(record.levelno))
+        cursor.endEditBlock()
+
+        scroll_bar = self.widget.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.maximum())
+
+    def _text_format(self, levelno: int) -> QTextCharFormat:
+        for level, text_format in self.formats.items():
+            if levelno >= level:
+                return text_format
+        return self.formats[logging.NOTSET]
 
 
 class LogWindow(QMainWindow):
     """Главное окно"""
-    def __init__(self, browser_manager, icon_path=None):
+    def __init__(self, browser_managers, icon_path=None):
         super().__init__()
-        self.browser_manager = browser_manager
+        self.browser_managers = browser_managers
         self.setWindowTitle("VK Manager")
         self.setFixedSize(1100, 600)
         self.setWindowFlags(
@@ -46,9 +94,16 @@ class LogWindow(QMainWindow):
             Qt.WindowType.MSWindowsFixedSizeDialogHint
         )
 
-        # QTextEdit для логов
-        self.log_console = QTextEdit(self)
+        # Сколько строк лога хранится и как часто (мс) новые выводятся в окно
+        self.LOG_LINES = int(get_env('GUI_LOG_LINES', '5000'))
+        self.LOG_FLUSH_INTERVAL = int(get_env('GUI_LOG_FLUSH_MS', '250'))
+
+        # Простой текст вместо HTML для логов
+        self.log_console = QPlainTextEdit(self)
         self.log_console.setReadOnly(True)
+        font = QFont(self.log_console.font())
+        font.setPointSize(11)
+        self.log_console.setFont(font)
         self.setCentralWidget(self.log_console)
 
         # Иконка для трея
@@ -60,24 +115,33 @@ class LogWindow(QMainWindow):
         # Меню трея
         tray_menu = QMenu()
         open_action = QAction("Открыть     ", self)
+        profile_action = QAction("Профилировать цикл     ", self)
         exit_action = QAction("Выйти     ", self)
         tray_menu.addAction(open_action)
+        tray_menu.addAction(profile_action)
         tray_menu.addAction(exit_action)
         self.tray_icon.setContextMenu(tray_menu)
 
         open_action.triggered.connect(self.show_window)
+        profile_action.triggered.connect(metrics.request_profile)
         exit_action.triggered.connect(self.exit_app)
 
+        # Сводка метрик в строке состояния, обновляется только пока окно видно
+        self.status_timer = QTimer(self)
+        self.status_timer.timeout.connect(self.update_status)
+        self.status_timer.start(2000)
+
         self.tray_icon.show()
 
         # Подключаем логгер GUI к существующему логгеру
-        qt_handler = QTextEditLogger(self.log_console, font_size=11)
+        qt_handler = QTextEditLogger(self.log_console, self.LOG_LINES, self.LOG_FLUSH_INTERVAL)
         formatter = logging.Formatter(
             "[%(levelname)s] [%(filename)s] [%(asctime)s]: %(message)s",
             datefmt="%d-%m-%Y %H:%M:%S"
         )
         qt_handler.setFormatter(formatter)
         log.addHandler(qt_handler)
+        self.qt_handler = qt_handler
 
     def closeEvent(self, event):
         event.ignore()
@@ -92,20 +156,26 @@ class LogWindow(QMainWindow):
     def show_window(self):
         self.showNormal()
         self.activateWindow()
+        self.qt_handler.flush_to_widget()
 
     def exit_app(self):
-        self.browser_manager.stop_browser()
+        for browser_manager in self.browser_managers:
+            browser_manager.stop_browser()
         self.tray_icon.hide()
         QApplication.quit()
 
+    def update_status(self):
+        if self.isVisible() and not self.isMinimized():
+            self.statusBar().showMessage(metrics.summary())
+
     def add_log(self, text: str):
-        self.log_console.append(text)
+        self.log_console.appendPlainText(text)
 
 
-def start_gui(browser_manager):
+def start_gui(browser_managers):
     """Функция ля запуска GUI из main"""
     
     app = QApplication([])
-    window = LogWindow(browser_manager)
+    window = LogWindow(browser_managers)
     window.show()
     return app, window
\ No newline at end of file
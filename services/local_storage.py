@@ -0,0 +1,234 @@
+import os
+import struct
+
+from extensions.logging_ext import log
+
+
+class LocalStorageReader:
+    """
+    Чтение localStorage Chrome прямо с диска, без запуска браузера.
+    Разбирает LevelDB в '<профиль>/Local Storage/leveldb': журналы (*.log)
+    и таблицы (*.ldb, *.sst), для каждого ключа берёт значение с наибольшим
+    порядковым номером (самое новое), удалённые ключи пропускает.
+    """
+
+    # Размер блока журнала LevelDB
+    LOG_BLOCK_SIZE = 32768
+    # Последние 8 байт таблицы LevelDB
+    TABLE_MAGIC = 0xdb4775248b80fb57
+
+    def __init__(self, profile_dir:str, profile_name:str):
+        self.LEVELDB_DIR = os.path.join(profile_dir, profile_name, 'Local Storage', 'leveldb')
+
+
+    def read_origin(self, origin:str) -> dict:
+        """
+        Возвращает {ключ: значение} localStorage сайта origin (например https://vk.com).
+        Записи упорядочены от старых к новым. Если базы нет - вернёт пустой dict.
+        """
+
+        prefix = b'_' + origin.encode() + b'\x00'
+        latest = {}
+        for user_key, sequence, value in self._iter_records():
+            if not user_key.startswith(prefix):
+                continue
+            if user_key not in latest or sequence > latest[user_key][0]:
+                latest[user_key] = (sequence, value)
+
+        data = {}
+        for user_key, (_, value) in sorted(latest.items(), key=lambda item: item[1][0]):
+            if value is None:
+                continue
+            try:
+                data[_decode_string(user_key[len(prefix):])] = _decode_string(value)
+            except UnicodeDecodeError:
+                continue
+        return data
+
+
+    def _iter_records(self):
+        """Отдаёт (ключ, порядковый номер, значение или None для удаления) из всех файлов базы"""
+
+        if not os.path.isdir(self.LEVELDB_DIR):
+            log.info(f'Каталог localStorage не найден: {self.LEVELDB_DIR}')
+            return
+
+        for file_name in sorted(os.listdir(self.LEVELDB_DIR)):
+            file_path = os.path.join(self.LEVELDB_DIR, file_name)
+            try:
+                with open(file_path, 'rb') as f:
+                    content = f.read()
+                if file_name.endswith('.log'):
+                    yield from self._iter_log(content)
+                elif file_name.endswith(('.ldb', '.sst')):
+                    yield from self._iter_table(content)
+            except (OSError, ValueError, IndexError, struct.error) as e:
+                log.warning(f'Не удалось прочитать {file_name}: {e}')
+
+
+    def _iter_log(self, content:bytes):
+        """Разбирает журнал: блоки по 32 КБ с записями FULL/FIRST/MIDDLE/LAST, внутри - WriteBatch"""
+
+        batch = b''
+        position = 0
+        while position + 7 <= len(content):
+            block_left = self.LOG_BLOCK_SIZE - position % self.LOG_BLOCK_SIZE
+            if block_left < 7:
+                position += block_left
+                continue
+
+            length, record_type = struct.unpack_from('<HB', content, position + 4)
+            payload = content[position + 7:position + 7 + length]
+            position += 7 + length
+
+            if record_type == 1:
+                yield from self._iter_write_batch(payload)
+            elif record_type == 2:
+                batch = payload
+            elif record_type == 3:
+                batch += payload
+            elif record_type == 4:
+                yield from self._iter_write_batch(batch + payload)
+                batch = b''
+
+
+    def _iter_write_batch(self, batch:bytes):
+        """WriteBatch: номер(8) количество(4), затем записи 1=значение / 0=удаление"""
+
+        sequence, count = struct.unpack_from('<QI', batch, 0)
+        position = 12
+        for index in range(count):
+            tag = batch[position]
+            position += 1
+            key, position = _read_slice(batch, position)
+            if tag == 1:
+                value, position = _read_slice(batch, position)
+                yield key, sequence + index, value
+            else:
+                yield key, sequence + index, None
+
+
+    def _iter_table(self, content:bytes):
+        """Разбирает таблицу: футер -> индексный блок -> блоки данных"""
+
+        if len(content) < 48 or struct.unpack_from('<Q', content, len(content) - 8)[0] != self.TABLE_MAGIC:
+            raise ValueError('не таблица LevelDB')
+
+        footer_position = len(content) - 48
+        _, position = _read_block_handle(content, footer_position)
+        index_handle, _ = _read_block_handle(content, position)
+
+        for _, handle in self._iter_block(content, index_handle):
+            data_handle, _ = _read_block_handle(handle, 0)
+            for internal_key, value in self._iter_block(content, data_handle):
+                # Внутренний ключ: пользовательский ключ + 8 байт (номер << 8 | тип)
+                trailer = struct.unpack_from('<Q', internal_key, len(internal_key) - 8)[0]
+                user_key = internal_key[:-8]
+                yield user_key, trailer >> 8, value if trailer & 0xff == 1 else None
+
+
+    def _iter_block(self, content:bytes, handle:tuple[int, int]):
+        """Отдаёт (ключ, значение) блока таблицы, при необходимости распаковывает snappy"""
+
+        offset, size = handle
+        block = content[offset:offset + size]
+        compression = content[offset + size]
+        if compression == 1:
+            block = snappy_decompress(block)
+        elif compression != 0:
+            raise ValueError(f'неизвестное сжатие блока: {compression}')
+
+        restarts_count = struct.unpack_from('<I', block, len(block) - 4)[0]
+        end = len(block) - 4 - 4 * restarts_count
+        position = 0
+        key = b''
+        while position < end:
+            shared, position = _read_varint(block, position)
+            non_shared, position = _read_varint(block, position)
+            value_length, position = _read_varint(block, position)
+            key = key[:shared] + block[position:position + non_shared]
+            position += non_shared
+            yield key, block[position:position + value_length]
+            position += value_length
+
+
+def snappy_decompress(data:bytes) -> bytes:
+    """Распаковка формата snappy (сырой блок, без фрейминга)"""
+
+    length, position = _read_varint(data, 0)
+    out = bytearray()
+    while position < len(data):
+        tag = data[position]
+        position += 1
+        kind = tag & 3
+
+        if kind == 0:
+            literal_length = tag >> 2
+            if literal_length >= 60:
+                extra = literal_length - 59
+                literal_length = int.from_bytes(data[position:position + extra], 'little')
+                position += extra
+            literal_length += 1
+            out += data[position:position + literal_length]
+            position += literal_length
+            continue
+
+        if kind == 1:
+            copy_length = ((tag >> 2) & 7) + 4
+            copy_offset = ((tag >> 5) << 8) | data[position]
+            position += 1
+        elif kind == 2:
+            copy_length = (tag >> 2) + 1
+            copy_offset = int.from_bytes(data[position:position + 2], 'little')
+            position += 2
+        else:
+            copy_length = (tag >> 2) + 1
+            copy_offset = int.from_bytes(data[position:position + 4], 'little')
+            position += 4
+
+        start = len(out) - copy_offset
+        if copy_offset >= copy_length:
+            out += out[start:start + copy_length]
+        else:
+            # Перекрывающееся копирование повторяет уже записанные байты
+            for index in range(copy_length):
+                out.append(out[start + index])
+
+    if len(out) != length:
+        raise ValueError('повреждённый блок snappy')
+    return bytes(out)
+
+
+def _decode_string(raw:bytes) -> str:
+    """Строки localStorage Chrome: первый байт 0 - UTF-16LE, 1 - Latin-1"""
+
+    if raw[:1] == b'\x00':
+        return raw[1:].decode('utf-16-le')
+    if raw[:1] == b'\x01':
+        return raw[1:].decode('latin-1')
+    return raw.decode('utf-8')
+
+
+def _read_varint(data:bytes, position:int) -> tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+
+
+def _read_slice(data:bytes, position:int) -> tuple[bytes, int]:
+    length, position = _read_varint(data, position)
+    return data[position:position + length], position + length
+
+
+def _read_block_handle(data:bytes, position:int) -> tuple[tuple[int, int], int]:
+    offset, position = _read_varint(data, position)
+    size, position = _read_varint(data, position)
+    return (offset, size), position
+
+__all__ = ['LocalStorageReader', 'snappy_decompress']
@@ -0,0 +1,74 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from extensions.logging_ext import log
+from extensions.dotenv_ext import get_env
+from extensions.metrics_ext import metrics
+
+
+class MetricsServer:
+    """
+    Локальный HTTP сервер метрик (только 127.0.0.1):
+    GET /metrics - метрики в текстовом формате Prometheus,
+    GET или POST /profile - снять cProfile следующего цикла опроса.
+    Порт METRICS_PORT, 0 - сервер не запускается.
+    """
+
+    def __init__(self):
+        self.HOST = get_env('METRICS_HOST', '127.0.0.1')
+        self.PORT = int(get_env('METRICS_PORT', '9108'))
+        self.server = None
+
+
+    def start(self):
+        """Запускает сервер в фоновом потоке"""
+
+        if not self.PORT:
+            return
+        try:
+            self.server = ThreadingHTTPServer((self.HOST, self.PORT), _MetricsHandler)
+        except OSError as e:
+            log.error(f'Не удалось запустить сервер метрик на {self.HOST}:{self.PORT}: {e}')
+            return
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True).start()
+        log.info(f'Метрики доступны на http://{self.HOST}:{self.PORT}/metrics')
+
+
+    def stop(self):
+        """Останавливает сервер"""
+
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._reply(200, metrics.render(), 'text/plain; version=0.0.4; charset=utf-8')
+        elif self.path == '/profile':
+            metrics.request_profile()
+            self._reply(202, 'Следующий цикл будет профилирован\n')
+        else:
+            self._reply(404, 'Not found\n')
+
+
+    def do_POST(self):
+        self.do_GET()
+
+
+    def log_message(self, format, *args):
+        # Запросы Prometheus не засоряют лог
+        pass
+
+
+    def _reply(self, status:int, text:str, content_type:str = 'text/plain; charset=utf-8'):
+        body = text.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
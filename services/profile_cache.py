@@ -0,0 +1,139 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+
+from extensions.logging_ext import log
+from extensions.path_ext import get_path
+from extensions.dotenv_ext import get_env
+from extensions.metrics_ext import metrics
+
+
+class ProfileCache:
+    """
+    Кэш профилей пользователей VK (uid -> имя/фамилия) с вытеснением
+    давно не использованных записей (LRU). Хранится в базе FriendsStorage:
+    save() дописывает только изменившиеся и использованные с прошлого сохранения
+    записи и удаляет вытесненные, весь кэш не переписывается.
+    Старый data/profiles.json переносится в базу при первом запуске.
+    """
+
+    def __init__(self, storage, capacity:int | None = None, json_path:str | None = None):
+        self.storage = storage
+        self.JSON_PATH = json_path or get_path('data', 'profiles.json')
+        self.CAPACITY = capacity or int(get_env('PROFILE_CACHE_SIZE', '200000'))
+
+        self.profiles = OrderedDict()
+        # Изменённые или использованные с прошлого save() id, по порядку использования
+        self.touched = OrderedDict()
+        # Вытесненные с прошлого save() id
+        self.evicted = set()
+        # Кэш общий для параллельных опросов
+        self.lock = threading.RLock()
+        self._load()
+
+
+    def get(self, uid:int) -> dict:
+        """Возвращает профиль из кэша и помечает его как недавно использованный, иначе None"""
+
+        with self.lock:
+            profile = self.profiles.get(uid)
+            if profile is not None:
+                self.profiles.move_to_end(uid)
+                self._touch(uid)
+            return profile
+
+
+    def put(self, uid:int, profile:dict):
+        """Кладёт профиль в кэш, при переполнении вытесняет самые старые записи"""
+
+        with self.lock:
+            self.profiles[uid] = {'first_name': profile.get('first_name', ''), 'last_name': profile.get('last_name', '')}
+            self.profiles.move_to_end(uid)
+            self._touch(uid)
+            self.evicted.discard(uid)
+            while len(self.profiles) > self.CAPACITY:
+                evicted, _ = self.profiles.popitem(last=False)
+                self.touched.pop(evicted, None)
+                self.evicted.add(evicted)
+
+
+    def missing(self, uids) -> list[int]:
+        """Возвращает id, которых нет в кэше"""
+
+        with self.lock:
+            return [uid for uid in uids if uid not in self.profiles]
+
+
+    def peek_name(self, uid:int) -> str | None:
+        """Возвращает 'Имя Фамилия' из кэша, не отмечая профиль как использованный, если профиля нет - None"""
+
+        with self.lock:
+            profile = self.profiles.get(uid)
+        if profile is None:
+            return None
+        return f"{profile['first_name']} {profile['last_name']}"
+
+
+    def name(self, uid:int) -> str:
+        """Возвращает 'Имя Фамилия' из кэша, если профиля нет - id"""
+
+        profile = self.get(uid)
+        if profile is None:
+            return f'id{uid}'
+        return f"{profile['first_name']} {profile['last_name']}"
+
+
+    def save(self):
+        """Записывает в базу изменения кэша с прошлого сохранения, если они есть"""
+
+        with self.lock:
+            if not self.touched and not self.evicted:
+                return
+            names = [(uid, self.profiles[uid]['first_name'], self.profiles[uid]['last_name']) for uid in self.touched]
+            removed = list(self.evicted)
+
+            with metrics.timer('profile_cache_write'):
+                self.storage.save_profile_names(names, removed, self.CAPACITY)
+            self.touched.clear()
+            self.evicted.clear()
+        metrics.inc('profile_cache_rows_written_total', len(names))
+        log.info(f'Кэш профилей сохранён: записано {len(names)}, удалено {len(removed)}')
+
+
+    def _touch(self, uid:int):
+        """Отмечает запись для следующего save(), вызывается под lock"""
+
+        self.touched[uid] = None
+        self.touched.move_to_end(uid)
+
+
+    def _load(self):
+        """Загружает кэш из базы (порядок записей - порядок LRU), если там пусто - переносит data/profiles.json"""
+
+        for uid, first_name, last_name in self.storage.load_profile_names(self.CAPACITY):
+            self.profiles[uid] = {'first_name': first_name, 'last_name': last_name}
+        if self.profiles:
+            log.info(f'Загружен кэш профилей: {len(self.profiles)} записей')
+            return
+
+        if os.path.exists(self.JSON_PATH):
+            self._migrate_json()
+
+
+    def _migrate_json(self):
+        """Переносит кэш из старого data/profiles.json в базу, файл переименовывается в *.migrated"""
+
+        try:
+            with open(self.JSON_PATH, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            log.warning(f'Не удалось прочитать кэш профилей: {e}')
+            return
+
+        names = [(int(uid), first_name, last_name) for uid, first_name, last_name in rows[-self.CAPACITY:]]
+        self.storage.save_profile_names(names, [], self.CAPACITY)
+        for uid, first_name, last_name in names:
+            self.profiles[uid] = {'first_name': first_name, 'last_name': last_name}
+        os.replace(self.JSON_PATH, self.JSON_PATH + '.migrated')
+        log.info(f'Кэш профилей перенесён из {self.JSON_PATH}: {len(self.profiles)} записей')
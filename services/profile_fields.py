@@ -0,0 +1,65 @@
+import json
+import hashlib
+
+
+# Поля, которые users.get отдаёт без параметра fields
+DEFAULT_FIELDS = {'name', 'first_name', 'last_name', 'deactivated'}
+
+
+def parse_fields(value:str) -> list[str]:
+    """
+    Разбирает список отслеживаемых полей профиля из настройки (через запятую),
+    например 'name,deactivated,domain,last_seen'. Пустая строка - отслеживание выключено.
+    """
+
+    fields = []
+    for field in value.split(','):
+        field = field.strip()
+        if field and field != 'None' and field not in fields:
+            fields.append(field)
+    return fields
+
+
+def request_fields(fields:list[str]) -> str:
+    """Значение параметра fields для users.get: только поля, которых нет в ответе по умолчанию"""
+
+    return ','.join(field for field in fields if field not in DEFAULT_FIELDS)
+
+
+def extract_fields(profile:dict, fields:list[str]) -> dict:
+    """
+    Достаёт из ответа users.get значения отслеживаемых полей в виде строк (или None).
+    name - 'Имя Фамилия', last_seen - только время последнего визита.
+    """
+
+    values = {}
+    for field in fields:
+        if field == 'name':
+            value = f"{profile.get('first_name', '')} {profile.get('last_name', '')}"
+        elif field == 'last_seen':
+            value = (profile.get('last_seen') or {}).get('time')
+        else:
+            value = profile.get(field)
+
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value, ensure_ascii=False, sort_keys=True)
+        values[field] = None if value in (None, '') else str(value)
+    return values
+
+
+def fingerprint(values:dict) -> int:
+    """64-битный хеш значений полей профиля, помещается в INTEGER SQLite"""
+
+    data = json.dumps(values, ensure_ascii=False, sort_keys=True).encode()
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big', signed=True)
+
+
+def diff_fields(old:dict, new:dict) -> dict:
+    """
+    Возвращает {поле: (старое, новое)} для изменившихся полей.
+    Поля, которых раньше не отслеживали, изменениями не считаются.
+    """
+
+    return {field: (old[field], value) for field, value in new.items() if field in old and old[field] != value}
+
+__all__ = ['parse_fields', 'request_fields', 'extract_fields', 'fingerprint', 'diff_fields']
@@ -0,0 +1,344 @@
+import io
+import csv
+import json
+import base64
+import hashlib
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from extensions.logging_ext import log
+from extensions.dotenv_ext import get_env
+
+
+class QueryServer:
+    """
+    Локальный HTTP/JSON сервер данных трекера (только 127.0.0.1), читает из FriendsStorage:
+    GET /targets - отслеживаемые пользователи,
+    GET /friends?target=ID - текущий список друзей,
+    GET /events?target=ID,ID&from=TS&to=TS&since=CURSOR&limit=N - журнал изменений
+    с непрозрачным курсором since для инкрементальной выгрузки (в ответе - next),
+    GET /stream?target=ID&since=CURSOR - изменения в реальном времени (server-sent events).
+    /friends и /events с format=ndjson или format=csv отдаются потоком, страницами из базы.
+    На ответы ставится ETag, при совпадении If-None-Match - 304 без запроса данных.
+    Порт QUERY_API_PORT, 0 - сервер не запускается.
+    """
+
+    # Сколько записей читается из базы за раз и сколько событий отдаётся в одном ответе JSON
+    PAGE_SIZE = 1000
+    MAX_LIMIT = 10000
+
+    def __init__(self, storage, profile_cache=None):
+        self.HOST = get_env('QUERY_API_HOST', '127.0.0.1')
+        self.PORT = int(get_env('QUERY_API_PORT', '9110'))
+        # Как часто (сек.) в потоке /stream отправляется пустой комментарий, чтобы соединение не закрылось
+        self.KEEPALIVE = float(get_env('QUERY_API_KEEPALIVE', '15'))
+        self.storage = storage
+        self.profile_cache = profile_cache
+        self.stopped = threading.Event()
+        self.server = None
+
+
+    def start(self):
+        """Запускает сервер в фоновом потоке"""
+
+        if not self.PORT:
+            return
+        try:
+            self.server = ThreadingHTTPServer((self.HOST, self.PORT), _QueryHandler)
+        except OSError as e:
+            log.error(f'Не удалось запустить сервер данных на {self.HOST}:{self.PORT}: {e}')
+            return
+        self.server.daemon_threads = True
+        self.server.api = self
+        threading.Thread(target=self.server.serve_forever, name='query-api', daemon=True).start()
+        log.info(f'Данные трекера доступны на http://{self.HOST}:{self.PORT}/')
+
+
+    def stop(self):
+        """Останавливает сервер и открытые потоки /stream"""
+
+        self.stopped.set()
+        with self.storage.changed:
+            self.storage.changed.notify_all()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+    def name(self, uid:int) -> str | None:
+        """Имя из кэша профилей, если неизвестно - None"""
+
+        if self.profile_cache is None:
+            return None
+        return self.profile_cache.peek_name(uid)
+
+
+def encode_cursor(event_id:int) -> str:
+    """Непрозрачный курсор позиции в журнале событий"""
+
+    return base64.urlsafe_b64encode(f'e:{event_id}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor:str) -> int:
+    """Позиция в журнале из курсора, некорректный курсор - ValueError"""
+
+    try:
+        kind, _, value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().partition(':')
+        event_id = int(value)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f'некорректный курсор: {cursor}')
+    if kind != 'e' or event_id < 0:
+        raise ValueError(f'некорректный курсор: {cursor}')
+    return event_id
+
+
+class _QueryHandler(BaseHTTPRequestHandler):
+
+    EVENT_FIELDS = ('target', 'uid', 'name', 'kind', 'ts')
+    FRIEND_FIELDS = ('uid', 'name', 'added_at')
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        self.query = urllib.parse.parse_qs(url.query)
+        self.api = self.server.api
+        self.etag = None
+        routes = {'/targets': self._targets, '/friends': self._friends, '/events': self._events, '/stream': self._stream}
+        route = routes.get(url.path)
+        if route is None:
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            route()
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент закрыл соединение во время выгрузки
+            pass
+
+
+    def log_message(self, format, *args):
+        # Запросы опрашивающих сервисов не засоряют лог
+        pass
+
+
+    def _targets(self):
+        targets = [{'target': target, 'synced_at': synced_at, 'friends_count': friends_count}
+                   for target, synced_at, friends_count in self.api.storage.load_targets()]
+        body = json.dumps({'targets': targets}, ensure_ascii=False).encode()
+        if self._not_modified(f'"t-{hashlib.blake2b(body, digest_size=8).hexdigest()}"'):
+            return
+        self._send_body(200, body, 'application/json; charset=utf-8')
+
+
+    def _friends(self):
+        target = self._int_param('target', required=True)
+        file_format = self._format()
+        version = self.api.storage.friends_version(target)
+        if version is None:
+            self._send_json(404, {'error': f'пользователь {target} не отслеживается'})
+            return
+        if self._not_modified(f'W/"f-{target}-{version}-{file_format}"'):
+            return
+
+        def rows():
+            after_uid = 0
+            while True:
+                page = self.api.storage.load_friends_page(target, after_uid, self.api.PAGE_SIZE)
+                for uid, added_at in page:
+                    yield {'uid': uid, 'name': self.api.name(uid), 'added_at': added_at}
+                if len(page) < self.api.PAGE_SIZE:
+                    return
+                after_uid = page[-1][0]
+
+        if file_format == 'json':
+            friends = list(rows())
+            self._send_json(200, {'target': target, 'count': len(friends), 'friends': friends})
+        else:
+            self._stream_rows(rows(), file_format, self.FRIEND_FIELDS, f'friends-{target}')
+
+
+    def _events(self):
+        targets = self._targets_param()
+        since_ts = self._int_param('from')
+        until_ts = self._int_param('to')
+        after_id = self._cursor_param()
+        limit = max(1, min(self._int_param('limit') or self.api.PAGE_SIZE, self.api.MAX_LIMIT))
+        file_format = self._format()
+
+        # Журнал только дописывается: ответ определяется запросом и последним подходящим событием
+        last_id = self.api.storage.last_event_id(targets, since_ts, until_ts)
+        query_hash = hashlib.blake2b(urllib.parse.urlsplit(self.path).query.encode(), digest_size=6).hexdigest()
+        if self._not_modified(f'W/"e-{last_id}-{query_hash}"'):
+            return
+
+        if file_format == 'json':
+            events = self.api.storage.load_events(after_id, targets, since_ts, until_ts, limit, last_id)
+            position = events[-1][0] if len(events) == limit else max(after_id, last_id)
+            self._send_json(200, {'events': [self._event(row) for row in events],
+                                  'next': encode_cursor(position), 'more': len(events) == limit})
+            return
+
+        def rows():
+            position = after_id
+            while True:
+                page = self.api.storage.load_events(position, targets, since_ts, until_ts, self.api.PAGE_SIZE, last_id)
+                for row in page:
+                    yield self._event(row)
+                if len(page) < self.api.PAGE_SIZE:
+                    return
+                position = page[-1][0]
+
+        self._stream_rows(rows(), file_format, self.EVENT_FIELDS, 'events',
+                          {'X-Next-Cursor': encode_cursor(max(after_id, last_id))})
+
+
+    def _stream(self):
+        """
+        Server-sent events: каждое сообщение - изменения одного пользователя за одну сверку
+        {target, ts, added: [{uid, name}], removed: [...]}, id сообщения - курсор.
+        Начинает после since (или заголовка Last-Event-ID), без него - с текущего момента.
+        """
+
+        targets = self._targets_param()
+        cursor = self.headers.get('Last-Event-ID') or self._param('since')
+        storage = self.api.storage
+        position = decode_cursor(cursor) if cursor else storage.last_event_id()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self._write(f'retry: 3000\nid: {encode_cursor(position)}\n\n')
+
+        while not self.api.stopped.is_set():
+            last_id = storage.last_event_id()
+            page = storage.load_events(position, targets, limit=self.api.PAGE_SIZE, max_id=last_id)
+            for diff in self._group_diffs(page):
+                self._write(f'id: {encode_cursor(diff.pop("id"))}\nevent: diff\n'
+                            f'data: {json.dumps(diff, ensure_ascii=False)}\n\n')
+            if len(page) == self.api.PAGE_SIZE:
+                position = page[-1][0]
+                continue
+
+            # Всё до last_id просмотрено, события других пользователей пропускаются
+            position = last_id
+            if not storage.wait_for_events(position, self.api.KEEPALIVE, self.api.stopped):
+                self._write(': ping\n\n')
+
+
+    def _group_diffs(self, rows:list[tuple]) -> list[dict]:
+        """Объединяет подряд идущие события одного пользователя с одним временем в одно изменение"""
+
+        diffs = []
+        for event_id, target, uid, kind, ts in rows:
+            if not diffs or diffs[-1]['target'] != target or diffs[-1]['ts'] != ts:
+                diffs.append({'id': event_id, 'target': target, 'ts': ts, 'added': [], 'removed': []})
+            diffs[-1]['id'] = event_id
+            diffs[-1][kind].append({'uid': uid, 'name': self.api.name(uid)})
+        return diffs
+
+
+    def _event(self, row:tuple) -> dict:
+        _, target, uid, kind, ts = row
+        return {'target': target, 'uid': uid, 'name': self.api.name(uid), 'kind': kind, 'ts': ts}
+
+
+    def _stream_rows(self, rows, file_format:str, fields:tuple, file_name:str, headers:dict | None = None):
+        """Отдаёт строки потоком в NDJSON или CSV, ответ заканчивается закрытием соединения"""
+
+        content_type = 'application/x-ndjson' if file_format == 'ndjson' else 'text/csv'
+        self.send_response(200)
+        self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+        self.send_header('Content-Disposition', f'attachment; filename="{file_name}.{file_format}"')
+        self.send_header('ETag', self.etag)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fields, lineterminator='\n')
+        if file_format == 'csv':
+            writer.writeheader()
+        for number, row in enumerate(rows, 1):
+            if file_format == 'csv':
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(row, ensure_ascii=False) + '\n')
+            if number % self.api.PAGE_SIZE == 0:
+                self._write(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate()
+        self._write(buffer.getvalue())
+
+
+    def _not_modified(self, etag:str) -> bool:
+        """Запоминает ETag ответа, если клиент прислал такой же - отвечает 304"""
+
+        self.etag = etag
+        if etag not in (tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')):
+            return False
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.end_headers()
+        return True
+
+
+    def _send_json(self, status:int, data:dict):
+        self._send_body(status, json.dumps(data, ensure_ascii=False).encode(), 'application/json; charset=utf-8')
+
+
+    def _send_body(self, status:int, body:bytes, content_type:str):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if status == 200 and self.etag:
+            self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def _write(self, text:str):
+        if text:
+            self.wfile.write(text.encode())
+            self.wfile.flush()
+
+
+    def _param(self, name:str) -> str | None:
+        values = self.query.get(name)
+        return values[-1] if values else None
+
+
+    def _int_param(self, name:str, required:bool = False) -> int | None:
+        value = self._param(name)
+        if value is None:
+            if required:
+                raise ValueError(f'не указан параметр {name}')
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f'параметр {name} должен быть числом: {value}')
+
+
+    def _targets_param(self) -> list[int] | None:
+        values = [value for item in self.query.get('target', []) for value in item.split(',') if value]
+        try:
+            return [int(value) for value in values] or None
+        except ValueError:
+            raise ValueError('параметр target должен быть id или списком id через запятую')
+
+
+    def _cursor_param(self) -> int:
+        cursor = self._param('since')
+        return decode_cursor(cursor) if cursor else 0
+
+
+    def _format(self) -> str:
+        file_format = self._param('format') or 'json'
+        if file_format not in ('json', 'ndjson', 'csv'):
+            raise ValueError(f'неизвестный формат {file_format}, доступны json, ndjson, csv')
+        return file_format
+
+__all__ = ['QueryServer', 'encode_cursor', 'decode_cursor']
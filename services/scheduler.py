@@ -0,0 +1,253 @@
+import time
+import heapq
+import random
+import asyncio
+
+from extensions.logging_ext import log
+from extensions.metrics_ext import metrics
+
+
+class TargetScheduler:
+    """
+    Асинхронный планировщик опроса пользователей.
+    У каждого пользователя свой интервал со случайным разбросом (jitter),
+    готовые к опросу пользователи собираются в пачки до batch_size,
+    одновременно выполняется не больше max_concurrency пачек.
+    Когда кому-то пора на опрос, к нему в пачку берутся и те, чей срок
+    наступит в ближайшие batch_window секунд - так пачки execute заполняются плотнее.
+    Пока пользователь опрашивается, повторно в работу он не попадёт - в том числе
+    после конца пачки, если run_batch удержал его (hold) до возврата зависшего потока.
+    Ошибка в самом цикле планировщика не останавливает опрос: цикл перезапускается.
+    """
+
+    # Пауза перед перезапуском упавшего цикла, при повторных падениях растёт вдвое до максимума
+    RESTART_DELAY = 1
+    RESTART_MAX_DELAY = 60
+
+    def __init__(self, targets:dict[str, int], run_batch, max_concurrency:int = 4,
+                 batch_size:int = 25, jitter:float = 0.1, batch_window:float = 30):
+        # run_batch - корутина, принимает список id пользователей
+        self.run_batch = run_batch
+        self.MAX_CONCURRENCY = max_concurrency
+        self.BATCH_SIZE = batch_size
+        self.JITTER = jitter
+        self.BATCH_WINDOW = batch_window
+
+        self.intervals = {}
+        # Разовая задержка следующего опроса вместо интервала (см. postpone)
+        self.delays = {}
+        self.queue = []
+        # Пользователи, у которых есть запись в очереди
+        self.scheduled = set()
+        self.running = set()
+        # Задача опроса -> пачка пользователей
+        self.tasks = {}
+        # Удержанные пользователи (см. hold) -> закончилась ли уже их пачка
+        self.held = {}
+        self.wakeup = asyncio.Event()
+        self.stopped = False
+
+        for target, interval in targets.items():
+            self.add_target(target, interval)
+
+
+    def add_target(self, target:str, interval:int):
+        """
+        Добавляет пользователя в расписание. Первый опрос случайно
+        распределяется внутри разброса, чтобы не опрашивать всех одновременно.
+        """
+
+        self.intervals[target] = interval
+        if target not in self.scheduled and target not in self.running:
+            self._push(target, random.uniform(0, interval * self.JITTER))
+
+
+    def set_interval(self, target:str, interval:int):
+        """Меняет интервал пользователя, действует со следующей постановки в очередь"""
+
+        if target in self.intervals:
+            self.intervals[target] = interval
+
+
+    def remove_target(self, target:str):
+        """Убирает пользователя из расписания, уже начатый опрос доработает"""
+
+        self.intervals.pop(target, None)
+        self.delays.pop(target, None)
+
+
+    def postpone(self, target:str, delay:float):
+        """
+        Вызывается из run_batch: после текущего опроса пользователь встанет
+        в очередь через delay секунд вместо своего интервала (один раз)
+        """
+
+        if target in self.intervals:
+            self.delays[target] = delay
+
+
+    def hold(self, targets:list[str]):
+        """
+        Вызывается из run_batch: пользователи останутся опрашиваемыми и после
+        конца пачки, пока не будет вызван release (например, поток зависшего
+        опроса ещё работает и новый опрос пошёл бы параллельно с ним)
+        """
+
+        for target in targets:
+            self.held[target] = False
+
+
+    def release(self, targets:list[str]):
+        """Возвращает удержанных пользователей в расписание"""
+
+        for target in targets:
+            # Если пачка ещё не закончилась, в очередь пользователя поставит она сама
+            if self.held.pop(target, False):
+                self._reschedule(target)
+
+
+    async def run(self):
+        """
+        Работает до вызова stop(). Если главный цикл упал с непредвиденной ошибкой,
+        планировщик не завершается: пользователи, выпавшие из очереди, возвращаются в неё,
+        а цикл перезапускается через RESTART_DELAY секунд (при повторных падениях
+        пауза растёт вдвое до RESTART_MAX_DELAY). Начатые опросы при этом не прерываются.
+        """
+
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENCY)
+        log.info(f'Планировщик запущен: пользователей {len(self.intervals)}, параллельно до {self.MAX_CONCURRENCY} пачек')
+
+        restart_delay = self.RESTART_DELAY
+        while not self.stopped:
+            started = self._now()
+            try:
+                await self._loop(semaphore)
+            except Exception as e:
+                if self._now() - started > self.RESTART_MAX_DELAY:
+                    restart_delay = self.RESTART_DELAY
+                metrics.inc('scheduler_restarts_total')
+                log.error(f'Ошибка в цикле планировщика: {e}, перезапуск через {restart_delay} сек.')
+                self._recover()
+                await self._pause(restart_delay)
+                restart_delay = min(restart_delay * 2, self.RESTART_MAX_DELAY)
+
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        log.info('Планировщик остановлен')
+
+
+    def stop(self):
+        """Останавливает планировщик"""
+
+        self.stopped = True
+        self.wakeup.set()
+
+
+    async def _loop(self, semaphore:asyncio.Semaphore):
+        """Главный цикл: запускает пачки тех, кому пора на опрос, и ждёт следующего срока"""
+
+        while not self.stopped:
+            due = self._pop_due()
+            for start in range(0, len(due), self.BATCH_SIZE):
+                batch = due[start:start + self.BATCH_SIZE]
+                self.running.update(batch)
+                task = asyncio.create_task(self._run_batch(batch, semaphore))
+                self.tasks[task] = batch
+                task.add_done_callback(self._forget_task)
+
+            self.wakeup.clear()
+            timeout = self.queue[0][0] - self._now() if self.queue else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+    def _forget_task(self, task:asyncio.Task):
+        self.tasks.pop(task, None)
+
+
+    def _recover(self):
+        """
+        После падения цикла: опрашиваемыми считаются только пачки живых задач,
+        пользователи, которых нет ни в очереди, ни в опросе, ставятся в очередь
+        """
+
+        self.running = {target for batch in self.tasks.values() for target in batch} | set(self.held)
+        lost = [target for target in self.intervals if target not in self.scheduled and target not in self.running]
+        for target in lost:
+            self._push(target, random.uniform(0, self.intervals[target] * self.JITTER))
+        if lost:
+            log.warning(f'В очередь планировщика возвращены пользователи: {len(lost)}')
+
+
+    async def _pause(self, delay:float):
+        """Ждёт delay секунд, прерывается вызовом stop()"""
+
+        resume_at = self._now() + delay
+        while not self.stopped and self._now() < resume_at:
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), resume_at - self._now())
+            except asyncio.TimeoutError:
+                pass
+
+
+    async def _run_batch(self, batch:list[str], semaphore:asyncio.Semaphore):
+        """Опрашивает пачку пользователей и ставит их в очередь на следующий раз"""
+
+        try:
+            async with semaphore:
+                await self.run_batch(batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error(f'Ошибка при опросе пользователей {", ".join(batch)}: {e}')
+        finally:
+            for target in batch:
+                if target in self.held:
+                    self.held[target] = True
+                else:
+                    self._reschedule(target)
+
+
+    def _reschedule(self, target:str):
+        """После опроса ставит пользователя в очередь: через отложенную задержку (postpone) или свой интервал"""
+
+        self.running.discard(target)
+        interval = self.intervals.get(target)
+        delay = self.delays.pop(target, None)
+        if interval is None:
+            return
+        if delay is None:
+            delay = interval * random.uniform(1 - self.JITTER, 1 + self.JITTER)
+        self._push(target, delay)
+
+
+    def _pop_due(self) -> list[str]:
+        """Достаёт из очереди всех пользователей, которым пора на опрос (с учётом BATCH_WINDOW)"""
+
+        now = self._now()
+        due = []
+        if not self.queue or self.queue[0][0] > now:
+            return due
+
+        while self.queue and self.queue[0][0] <= now + self.BATCH_WINDOW:
+            _, target = heapq.heappop(self.queue)
+            self.scheduled.discard(target)
+            if target in self.intervals:
+                due.append(target)
+        return due
+
+
+    def _push(self, target:str, delay:float):
+        """Ставит пользователя в очередь через delay секунд"""
+
+        heapq.heappush(self.queue, (self._now() + delay, target))
+        self.scheduled.add(target)
+        self.wakeup.set()
+
+
+    def _now(self) -> float:
+        return time.monotonic()
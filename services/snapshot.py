@@ -0,0 +1,118 @@
+from array import array
+from bisect import bisect_left
+
+
+class FriendsSnapshot:
+    """
+    Компактный снимок списка друзей: отсортированный массив int64 id
+    (8 байт на друга вместо str и отдельного объекта на каждую запись).
+    Вместо array подойдёт и memoryview с форматом 'q' (id прямо из файла снимка).
+    Имена в снимке не хранятся, они лежат в кэше профилей.
+    """
+
+    TYPECODE = 'q'
+
+    def __init__(self, uids:array | None = None):
+        self.uids = uids if uids is not None else array(self.TYPECODE)
+
+
+    @classmethod
+    def from_pages(cls, pages) -> 'FriendsSnapshot':
+        """
+        Собирает снимок из страниц id (генератор iter_friends_pages).
+        Страницы приходят по возрастанию id, сортировка нужна только если порядок нарушен.
+        """
+
+        uids = array(cls.TYPECODE)
+        for page in pages:
+            uids.extend(page)
+        return cls(_sorted_unique(uids))
+
+
+    @classmethod
+    def from_iterable(cls, uids) -> 'FriendsSnapshot':
+        """Собирает снимок из произвольного набора id"""
+
+        return cls(_sorted_unique(array(cls.TYPECODE, uids)))
+
+
+    def __len__(self) -> int:
+        return len(self.uids)
+
+
+    def __iter__(self):
+        return iter(self.uids)
+
+
+    def __contains__(self, uid:int) -> bool:
+        index = bisect_left(self.uids, uid)
+        return index < len(self.uids) and self.uids[index] == uid
+
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FriendsSnapshot) and self.uids == other.uids
+
+
+    def patched(self, added:list[int], removed:list[int]) -> 'FriendsSnapshot':
+        """Снимок с применёнными изменениями, без изменений - этот же снимок"""
+
+        if not added and not removed:
+            return self
+        return FriendsSnapshot(array(self.TYPECODE, sorted(set(self.uids).difference(removed).union(added))))
+
+
+    def diff(self, new:'FriendsSnapshot') -> tuple[list[int], list[int]]:
+        """Возвращает (добавленные, пропавшие) id относительно более нового снимка new"""
+
+        return diff_sorted(self.uids, new.uids)
+
+
+def diff_sorted(old, new) -> tuple[list[int], list[int]]:
+    """
+    Сравнивает два отсортированных массива id линейным слиянием.
+    Возвращает (добавленные, пропавшие), оба по возрастанию.
+    """
+
+    # Частый случай - ничего не изменилось, сравнение массивов идёт целиком на C
+    if old == new:
+        return [], []
+
+    added = []
+    removed = []
+    i = j = 0
+    old_len, new_len = len(old), len(new)
+    while i < old_len and j < new_len:
+        old_uid, new_uid = old[i], new[j]
+        if old_uid == new_uid:
+            i += 1
+            j += 1
+        elif old_uid < new_uid:
+            removed.append(old_uid)
+            i += 1
+        else:
+            added.append(new_uid)
+            j += 1
+
+    removed.extend(old[i:])
+    added.extend(new[j:])
+    return added, removed
+
+
+def diff_sets(old, new) -> tuple[list[int], list[int]]:
+    """
+    Эталонная реализация сравнения через set(), как было раньше.
+    Результат должен совпадать с diff_sorted.
+    """
+
+    old_set, new_set = set(old), set(new)
+    return sorted(new_set - old_set), sorted(old_set - new_set)
+
+
+def _sorted_unique(uids:array) -> array:
+    """Возвращает массив по возрастанию без повторов, уже упорядоченный не копирует"""
+
+    if all(uids[k] < uids[k + 1] for k in range(len(uids) - 1)):
+        return uids
+    return array(uids.typecode, sorted(set(uids)))
+
+__all__ = ['FriendsSnapshot', 'diff_sorted', 'diff_sets']
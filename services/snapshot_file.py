@@ -0,0 +1,175 @@
+import os
+import mmap
+import zlib
+import struct
+from array import array
+from bisect import bisect_left
+
+from extensions.logging_ext import log
+from extensions.file_ext import atomic_open
+from extensions.metrics_ext import metrics
+
+
+class SnapshotFile:
+    """
+    Снимок списка друзей в одном бинарном файле: заголовок, отсортированные id (int64),
+    смещения имён (uint32, на одно больше чем id) и имена подряд в UTF-8.
+    Заголовок хранит версию данных, по которой видно, с какого места журнала базы
+    дочитывать изменения, и две CRC32: заголовка с id и смещениями и отдельно имён.
+    Файл открывается через mmap: id используются прямо из файла без копирования,
+    CRC имён проверяется только при первом чтении имени, проверка «есть ли id
+    в снимке» - двоичный поиск по файлу.
+    Запись атомарная (временный файл, fsync, замена), при сбое остаётся прошлый файл.
+    """
+
+    MAGIC = b'VKFS'
+    VERSION = 2
+    # magic, версия формата, id базы, версия данных, количество id, размер имён, CRC32 id, CRC32 имён
+    HEADER = struct.Struct('<4sIqqQQII')
+
+    def __init__(self, mapping:mmap.mmap, db_id:int, data_version:int, count:int, names_size:int, names_checksum:int):
+        self.mapping = mapping
+        self.db_id = db_id
+        self.data_version = data_version
+        self.names_checksum = names_checksum
+        # Сошлась ли CRC имён, None - ещё не проверялась
+        self.names_valid = None
+        view = memoryview(mapping)
+        self.uids = view[self.HEADER.size:self.HEADER.size + 8 * count].cast('q')
+        offsets_start = self.HEADER.size + 8 * count
+        self.offsets = view[offsets_start:offsets_start + 4 * (count + 1)].cast('I')
+        self.names = view[offsets_start + 4 * (count + 1):offsets_start + 4 * (count + 1) + names_size]
+        view.release()
+
+
+    @classmethod
+    def open(cls, file_path:str, verify:bool = True) -> 'SnapshotFile':
+        """
+        Открывает файл снимка через mmap, если файла нет - вернёт None.
+        Повреждённый файл (обрезан, не тот формат, не сошлась CRC id при verify) - ValueError.
+        """
+
+        if not os.path.exists(file_path):
+            return None
+
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < cls.HEADER.size:
+                raise ValueError(f'{file_path}: файл снимка обрезан')
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, db_id, data_version, count, names_size, checksum, names_checksum = cls.HEADER.unpack_from(mapping, 0)
+        expected_size = cls.HEADER.size + 8 * count + 4 * (count + 1) + names_size
+        error = None
+        if magic != cls.MAGIC:
+            error = 'не файл снимка'
+        elif version != cls.VERSION:
+            error = f'версия формата {version} вместо {cls.VERSION}'
+        elif size != expected_size:
+            error = f'размер {size} байт вместо {expected_size}'
+        elif verify and _checksum(mapping, db_id, data_version, count, names_size, names_checksum) != checksum:
+            error = 'не сошлась контрольная сумма'
+        if error is not None:
+            mapping.close()
+            raise ValueError(f'{file_path}: {error}')
+        return cls(mapping, db_id, data_version, count, names_size, names_checksum)
+
+
+    @classmethod
+    def write(cls, file_path:str, uids, names, db_id:int, data_version:int):
+        """
+        Записывает снимок атомарно. uids - отсортированные id,
+        names(uid) - имя или None (в файл попадёт пустая строка).
+        """
+
+        offsets = array('I', [0])
+        names_data = bytearray()
+        for uid in uids:
+            names_data += (names(uid) or '').encode()
+            offsets.append(len(names_data))
+
+        body = array('q', uids).tobytes() + offsets.tobytes()
+        names_checksum = zlib.crc32(names_data)
+        header = cls.HEADER.pack(cls.MAGIC, cls.VERSION, db_id, data_version, len(uids), len(names_data), 0, names_checksum)
+        checksum = zlib.crc32(body, zlib.crc32(header))
+        with atomic_open(file_path) as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, db_id, data_version, len(uids), len(names_data),
+                                    checksum, names_checksum))
+            f.write(body)
+            f.write(names_data)
+            metrics.inc('bytes_written_total', f.tell(), file='snapshot')
+
+
+    def close(self):
+        """Освобождает mmap"""
+
+        if self.mapping is not None:
+            for view in (self.uids, self.offsets, self.names):
+                view.release()
+            self.mapping.close()
+            self.mapping = None
+
+
+    def __enter__(self) -> 'SnapshotFile':
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    def __len__(self) -> int:
+        return len(self.uids)
+
+
+    def __contains__(self, uid:int) -> bool:
+        return self._index(uid) is not None
+
+
+    def to_array(self) -> array:
+        """Копия id в array('q') одним копированием памяти, без разбора по записям"""
+
+        uids = array('q')
+        uids.frombytes(self.uids.cast('B'))
+        return uids
+
+
+    def name(self, uid:int) -> str:
+        """
+        Имя друга, сохранённое в снимке, если id нет или имя не было известно - None.
+        Если имена в файле повреждены (не сошлась CRC имён), все имена считаются неизвестными.
+        """
+
+        index = self._index(uid)
+        if index is None or self.offsets[index] == self.offsets[index + 1] or not self._check_names():
+            return None
+        return bytes(self.names[self.offsets[index]:self.offsets[index + 1]]).decode()
+
+
+    def _check_names(self) -> bool:
+        """Проверяет CRC имён при первом обращении"""
+
+        if self.names_valid is None:
+            self.names_valid = zlib.crc32(self.names) == self.names_checksum
+            if not self.names_valid:
+                log.warning('Имена в файле снимка повреждены (не сошлась контрольная сумма), они не используются')
+        return self.names_valid
+
+
+    def _index(self, uid:int) -> int:
+        index = bisect_left(self.uids, uid)
+        if index < len(self.uids) and self.uids[index] == uid:
+            return index
+        return None
+
+
+def _checksum(mapping:mmap.mmap, db_id:int, data_version:int, count:int, names_size:int, names_checksum:int) -> int:
+    """CRC32 заголовка (с нулевым полем CRC id), id и смещений имён"""
+
+    header = SnapshotFile.HEADER.pack(SnapshotFile.MAGIC, SnapshotFile.VERSION, db_id, data_version, count, names_size,
+                                      0, names_checksum)
+    end = SnapshotFile.HEADER.size + 8 * count + 4 * (count + 1)
+    with memoryview(mapping) as view, view[SnapshotFile.HEADER.size:end] as body:
+        return zlib.crc32(body, zlib.crc32(header))
+
+__all__ = ['SnapshotFile']
@@ -0,0 +1,530 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import threading
+from array import array
+
+from extensions.logging_ext import log
+from extensions.path_ext import get_path
+from services.snapshot import FriendsSnapshot
+from services.snapshot_file import SnapshotFile
+
+
+class FriendsStorage:
+    """
+    Хранилище списков друзей в SQLite (режим WAL):
+    текущий состав друзей по каждому пользователю и журнал изменений,
+    в который только дописываются события added/removed.
+    Для отслеживаемых полей профилей хранятся хеш и последние значения,
+    изменения полей дописываются в отдельный журнал. Здесь же лежат имена
+    кэша профилей (см. ProfileCache) в порядке последнего использования.
+    Прогресс обхода графа друзей хранится до завершения обхода,
+    изменения связей графа дописываются в свой журнал.
+    О новых событиях журнала друзей сообщает условие changed (см. wait_for_events).
+    Рядом с базой в snapshots/<id>.snap лежат бинарные снимки списков (см. SnapshotFile):
+    снимок - основа, изменения после его версии дочитываются из журнала, а сам файл
+    переписывается, только когда их накопилось много (см. snapshot_outdated).
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS targets (
+        target      INTEGER PRIMARY KEY,
+        synced_at   INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS friends (
+        target      INTEGER NOT NULL,
+        uid         INTEGER NOT NULL,
+        added_at    INTEGER NOT NULL,
+        PRIMARY KEY (target, uid)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS events (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        target      INTEGER NOT NULL,
+        uid         INTEGER NOT NULL,
+        kind        TEXT NOT NULL CHECK (kind IN ('added', 'removed')),
+        ts          INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS events_target_ts ON events (target, ts);
+    CREATE INDEX IF NOT EXISTS events_target_id ON events (target, id);
+    CREATE TABLE IF NOT EXISTS poll_state (
+        target          INTEGER PRIMARY KEY,
+        friends_count   INTEGER NOT NULL DEFAULT 0,
+        first_uid       INTEGER NOT NULL DEFAULT 0,
+        full_checked_at INTEGER NOT NULL DEFAULT 0,
+        interval        INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS profiles (
+        uid         INTEGER PRIMARY KEY,
+        fingerprint INTEGER NOT NULL,
+        fields      TEXT NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS profile_events (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        uid         INTEGER NOT NULL,
+        field       TEXT NOT NULL,
+        old_value   TEXT,
+        new_value   TEXT,
+        ts          INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS profile_events_uid_ts ON profile_events (uid, ts);
+    CREATE TABLE IF NOT EXISTS profile_names (
+        uid         INTEGER PRIMARY KEY,
+        first_name  TEXT NOT NULL,
+        last_name   TEXT NOT NULL,
+        seq         INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS profile_names_seq ON profile_names (seq);
+    CREATE TABLE IF NOT EXISTS profile_checks (
+        target      INTEGER PRIMARY KEY,
+        checked_at  INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS crawl_rounds (
+        target      INTEGER PRIMARY KEY,
+        depth       INTEGER NOT NULL,
+        nodes       BLOB NOT NULL,
+        started_at  INTEGER NOT NULL,
+        finished_at INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS crawl_lists (
+        target      INTEGER NOT NULL,
+        phase       TEXT NOT NULL CHECK (phase IN ('mutual', 'friends')),
+        uid         INTEGER NOT NULL,
+        uids        BLOB NOT NULL,
+        PRIMARY KEY (target, phase, uid)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS graph_events (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        target      INTEGER NOT NULL,
+        a           INTEGER NOT NULL,
+        b           INTEGER NOT NULL,
+        kind        TEXT NOT NULL CHECK (kind IN ('added', 'removed')),
+        ts          INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS graph_events_target_ts ON graph_events (target, ts);
+    CREATE TABLE IF NOT EXISTS meta (
+        key         TEXT PRIMARY KEY,
+        value       INTEGER NOT NULL
+    );
+    """
+    # Сколько id подставляется в один запрос IN (...)
+    IN_BATCH_SIZE = 500
+    # Файл снимка переписывается, когда изменений после его версии набралось
+    # больше такой доли списка (но не меньше SNAPSHOT_COMPACT_MIN)
+    SNAPSHOT_COMPACT_RATIO = 0.1
+    SNAPSHOT_COMPACT_MIN = 100
+
+    def __init__(self, db_path:str | None = None):
+        self.DB_PATH = db_path or get_path('data', 'tracker.db')
+        self.SNAPSHOT_DIR = os.path.join(os.path.dirname(self.DB_PATH), 'snapshots')
+
+        self.lock = threading.Lock()
+        self.changed = threading.Condition()
+        self.connection = sqlite3.connect(self.DB_PATH, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(self.SCHEMA)
+        # Случайный id базы: снимки от другой (пересозданной) базы не подойдут
+        self.connection.execute('INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)', ('db_id', random.getrandbits(62)))
+        self.connection.commit()
+        self.DB_ID = self.connection.execute('SELECT value FROM meta WHERE key = ?', ('db_id',)).fetchone()[0]
+
+
+    def has_snapshot(self, target:int) -> bool:
+        """Проверяет, сохранялся ли уже список друзей пользователя"""
+
+        with self.lock:
+            row = self.connection.execute('SELECT 1 FROM targets WHERE target = ?', (target,)).fetchone()
+        return row is not None
+
+
+    def load_snapshot(self, target:int) -> FriendsSnapshot:
+        """
+        Возвращает снимок текущих друзей пользователя.
+        Строки читаются в порядке первичного ключа, поэтому сразу отсортированы.
+        """
+
+        with self.lock:
+            rows = self.connection.execute('SELECT uid FROM friends WHERE target = ? ORDER BY uid', (target,))
+            return FriendsSnapshot(array(FriendsSnapshot.TYPECODE, (uid for (uid,) in rows)))
+
+
+    def apply_diff(self, target:int, added:list[int], removed:list[int], ts:int | None = None):
+        """
+        Применяет изменения одной транзакцией: обновляет текущий состав
+        и дописывает события в журнал. Стоимость записи зависит
+        только от количества изменений.
+        """
+
+        ts = ts or int(time.time())
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO friends (target, uid, added_at) VALUES (?, ?, ?)',
+                                        ((target, uid, ts) for uid in added))
+            self.connection.executemany('DELETE FROM friends WHERE target = ? AND uid = ?',
+                                        ((target, uid) for uid in removed))
+            self.connection.executemany('INSERT INTO events (target, uid, kind, ts) VALUES (?, ?, ?, ?)',
+                                        [(target, uid, 'added', ts) for uid in added] +
+                                        [(target, uid, 'removed', ts) for uid in removed])
+            self._mark_synced(target, ts)
+
+        if added or removed:
+            with self.changed:
+                self.changed.notify_all()
+
+
+    def import_snapshot(self, target:int, uids, ts:int | None = None):
+        """
+        Записывает начальный список друзей пользователя без событий в журнале:
+        первый снимок или перенос из старых JSON файлов.
+        """
+
+        ts = ts or int(time.time())
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO friends (target, uid, added_at) VALUES (?, ?, ?)',
+                                        ((target, uid, ts) for uid in uids))
+            self._mark_synced(target, ts)
+
+
+    def load_targets(self) -> list[tuple[int, int, int]]:
+        """Возвращает [(target, время последней сверки, количество друзей при последней полной выгрузке)]"""
+
+        with self.lock:
+            return self.connection.execute('SELECT targets.target, targets.synced_at, poll_state.friends_count FROM targets '
+                                           'LEFT JOIN poll_state ON poll_state.target = targets.target '
+                                           'ORDER BY targets.target').fetchall()
+
+
+    def load_friends_page(self, target:int, after_uid:int = 0, limit:int = 1000) -> list[tuple[int, int]]:
+        """Возвращает следующие limit друзей [(uid, added_at)] с uid больше after_uid, по возрастанию uid"""
+
+        with self.lock:
+            return self.connection.execute('SELECT uid, added_at FROM friends WHERE target = ? AND uid > ? ORDER BY uid LIMIT ?',
+                                           (target, after_uid, limit)).fetchall()
+
+
+    def friends_version(self, target:int) -> int | None:
+        """
+        Версия списка друзей пользователя: id последнего события в его журнале (0 - событий нет),
+        если списка ещё нет - None. Пока версия не изменилась, не изменился и список.
+        """
+
+        with self.lock:
+            row = self.connection.execute('SELECT EXISTS (SELECT 1 FROM targets WHERE target = ?), '
+                                          'COALESCE((SELECT MAX(id) FROM events WHERE target = ?), 0)',
+                                          (target, target)).fetchone()
+        return row[1] if row[0] else None
+
+
+    def open_snapshot_file(self, target:int) -> SnapshotFile | None:
+        """
+        Открывает бинарный снимок списка друзей пользователя, если он подходит к базе:
+        от этой же базы и не новее её журнала. Изменения после версии снимка -
+        snapshot_changes. Если файла нет, он от другой базы или повреждён - вернёт None.
+        """
+
+        file_path = self.snapshot_path(target)
+        try:
+            snapshot_file = SnapshotFile.open(file_path)
+        except (OSError, ValueError) as e:
+            log.warning(f'Снимок пользователя {target} не прочитан, список будет загружен из базы: {e}')
+            return None
+        if snapshot_file is None:
+            return None
+
+        version = self.friends_version(target)
+        if snapshot_file.db_id != self.DB_ID or version is None or snapshot_file.data_version > version:
+            snapshot_file.close()
+            return None
+        return snapshot_file
+
+
+    def snapshot_changes(self, target:int, after_version:int) -> tuple[list[int], list[int]]:
+        """
+        Итоговые изменения списка друзей после версии after_version (id события журнала):
+        (добавленные, пропавшие), по возрастанию. Для id с несколькими событиями действует последнее.
+        """
+
+        with self.lock:
+            rows = self.connection.execute('SELECT uid, kind FROM events WHERE target = ? AND id > ? ORDER BY id',
+                                           (target, after_version)).fetchall()
+        last_kind = dict(rows)
+        added = sorted(uid for uid, kind in last_kind.items() if kind == 'added')
+        removed = sorted(uid for uid, kind in last_kind.items() if kind == 'removed')
+        return added, removed
+
+
+    def snapshot_outdated(self, changes:int, size:int) -> bool:
+        """Пора ли переписать файл снимка размером size, если после его версии накопилось changes изменений"""
+
+        return changes >= max(self.SNAPSHOT_COMPACT_MIN, size * self.SNAPSHOT_COMPACT_RATIO)
+
+
+    def write_snapshot_file(self, target:int, snapshot:FriendsSnapshot, names):
+        """
+        Записывает бинарный снимок текущего списка друзей (должен совпадать с базой),
+        names(uid) - известное имя друга или None.
+        """
+
+        version = self.friends_version(target)
+        if version is not None:
+            SnapshotFile.write(self.snapshot_path(target), snapshot.uids, names, self.DB_ID, version)
+
+
+    def snapshot_path(self, target:int) -> str:
+        return os.path.join(self.SNAPSHOT_DIR, f'{target}.snap')
+
+
+    def last_event_id(self, targets:list[int] | None = None, since_ts:int | None = None, until_ts:int | None = None) -> int:
+        """Id последнего события журнала друзей, подходящего под фильтр (0 - таких нет)"""
+
+        where, params = self._events_filter(targets, since_ts, until_ts)
+        with self.lock:
+            return self.connection.execute(f'SELECT COALESCE(MAX(id), 0) FROM events {where}', params).fetchone()[0]
+
+
+    def load_events(self, after_id:int = 0, targets:list[int] | None = None, since_ts:int | None = None,
+                    until_ts:int | None = None, limit:int = 1000, max_id:int | None = None) -> list[tuple]:
+        """
+        Возвращает следующие limit событий журнала друзей [(id, target, uid, kind, ts)] с id больше after_id
+        (и не больше max_id), по возрастанию id. targets - только эти пользователи,
+        since_ts/until_ts - время события в пределах [since_ts, until_ts).
+        """
+
+        where, params = self._events_filter(targets, since_ts, until_ts)
+        where += (' AND' if where else 'WHERE') + ' id > ?'
+        params.append(after_id)
+        if max_id is not None:
+            where += ' AND id <= ?'
+            params.append(max_id)
+        with self.lock:
+            return self.connection.execute(f'SELECT id, target, uid, kind, ts FROM events {where} ORDER BY id LIMIT ?',
+                                           (*params, limit)).fetchall()
+
+
+    def wait_for_events(self, after_id:int, timeout:float, stopped:threading.Event | None = None) -> bool:
+        """
+        Ждёт появления в журнале друзей событий с id больше after_id,
+        возвращает False по таймауту. stopped - прервать ожидание (нужно вызвать changed.notify_all()).
+        """
+
+        with self.changed:
+            return self.changed.wait_for(lambda: (stopped is not None and stopped.is_set())
+                                         or self.last_event_id() > after_id, timeout)
+
+
+    def load_poll_states(self, targets:list[int] | None = None) -> dict:
+        """
+        Возвращает {target: {friends_count, first_uid, full_checked_at, interval}}
+        для указанных пользователей, если targets не указан - для всех.
+        """
+
+        query = 'SELECT target, friends_count, first_uid, full_checked_at, interval FROM poll_state'
+        if targets is not None:
+            rows = self._select_in(query + ' WHERE target IN ({})', targets)
+        else:
+            with self.lock:
+                rows = self.connection.execute(query).fetchall()
+        return {row[0]: {'friends_count': row[1], 'first_uid': row[2], 'full_checked_at': row[3], 'interval': row[4]}
+                for row in rows}
+
+
+    def save_full_check(self, target:int, friends_count:int, first_uid:int, ts:int | None = None):
+        """Запоминает результат полной выгрузки списка: с ним сравниваются следующие пробы"""
+
+        with self.lock, self.connection:
+            self.connection.execute('INSERT INTO poll_state (target, friends_count, first_uid, full_checked_at) VALUES (?, ?, ?, ?) '
+                                    'ON CONFLICT (target) DO UPDATE SET friends_count = excluded.friends_count, '
+                                    'first_uid = excluded.first_uid, full_checked_at = excluded.full_checked_at',
+                                    (target, friends_count, first_uid, ts or int(time.time())))
+
+
+    def save_interval(self, target:int, interval:int):
+        """Запоминает подобранный интервал опроса пользователя"""
+
+        with self.lock, self.connection:
+            self.connection.execute('INSERT INTO poll_state (target, interval) VALUES (?, ?) '
+                                    'ON CONFLICT (target) DO UPDATE SET interval = excluded.interval', (target, interval))
+
+
+    def due_profile_checks(self, targets:list[int], checked_before:int) -> list[int]:
+        """Возвращает пользователей, профили друзей которых не проверялись с момента checked_before"""
+
+        rows = self._select_in('SELECT target FROM profile_checks WHERE checked_at >= ? AND target IN ({})',
+                               targets, (checked_before,))
+        fresh = {target for (target,) in rows}
+        return [target for target in targets if target not in fresh]
+
+
+    def mark_profiles_checked(self, target:int, ts:int | None = None):
+        """Запоминает время проверки профилей друзей пользователя"""
+
+        with self.lock, self.connection:
+            self.connection.execute('INSERT INTO profile_checks (target, checked_at) VALUES (?, ?) '
+                                    'ON CONFLICT (target) DO UPDATE SET checked_at = excluded.checked_at',
+                                    (target, ts or int(time.time())))
+
+
+    def load_fingerprints(self, uids:list[int]) -> dict:
+        """Возвращает {uid: хеш полей профиля} для уже известных профилей"""
+
+        return dict(self._select_in('SELECT uid, fingerprint FROM profiles WHERE uid IN ({})', uids))
+
+
+    def load_profile_fields(self, uids:list[int]) -> dict:
+        """Возвращает {uid: {поле: значение}} сохранённых профилей"""
+
+        return {uid: json.loads(fields) for uid, fields in self._select_in('SELECT uid, fields FROM profiles WHERE uid IN ({})', uids)}
+
+
+    def save_profiles(self, profiles:dict, changes:list[tuple], ts:int | None = None):
+        """
+        Одной транзакцией записывает новые и изменившиеся профили
+        ({uid: (хеш, {поле: значение})}) и события изменения полей
+        [(uid, поле, старое, новое)]. Неизменившиеся профили не переписываются.
+        """
+
+        ts = ts or int(time.time())
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT INTO profiles (uid, fingerprint, fields) VALUES (?, ?, ?) '
+                                        'ON CONFLICT (uid) DO UPDATE SET fingerprint = excluded.fingerprint, fields = excluded.fields',
+                                        ((uid, value_hash, json.dumps(fields, ensure_ascii=False))
+                                         for uid, (value_hash, fields) in profiles.items()))
+            self.connection.executemany('INSERT INTO profile_events (uid, field, old_value, new_value, ts) VALUES (?, ?, ?, ?, ?)',
+                                        ((uid, field, old, new, ts) for uid, field, old, new in changes))
+
+
+    def load_profile_names(self, limit:int) -> list[tuple[int, str, str]]:
+        """Возвращает limit последних использованных имён кэша профилей [(uid, имя, фамилия)], от старых к новым"""
+
+        with self.lock:
+            rows = self.connection.execute('SELECT uid, first_name, last_name FROM profile_names ORDER BY seq DESC LIMIT ?',
+                                           (limit,)).fetchall()
+        rows.reverse()
+        return rows
+
+
+    def save_profile_names(self, names:list[tuple[int, str, str]], removed:list[int], capacity:int):
+        """
+        Одной транзакцией записывает изменившиеся и использованные имена кэша профилей
+        [(uid, имя, фамилия)] (по порядку использования, последнее - самое свежее),
+        удаляет вытесненные и всё, что сверх capacity последних.
+        """
+
+        with self.lock, self.connection:
+            last_seq = self.connection.execute('SELECT COALESCE(MAX(seq), 0) FROM profile_names').fetchone()[0]
+            self.connection.executemany('INSERT INTO profile_names (uid, first_name, last_name, seq) VALUES (?, ?, ?, ?) '
+                                        'ON CONFLICT (uid) DO UPDATE SET first_name = excluded.first_name, '
+                                        'last_name = excluded.last_name, seq = excluded.seq',
+                                        ((uid, first_name, last_name, last_seq + number)
+                                         for number, (uid, first_name, last_name) in enumerate(names, 1)))
+            self.connection.executemany('DELETE FROM profile_names WHERE uid = ?', ((uid,) for uid in removed))
+            self.connection.execute('DELETE FROM profile_names WHERE seq <= '
+                                    '(SELECT seq FROM profile_names ORDER BY seq DESC LIMIT 1 OFFSET ?)', (capacity,))
+
+
+    def load_crawl_round(self, target:int) -> dict:
+        """Возвращает текущий обход графа пользователя {depth, nodes, started_at, finished_at}, если его нет - None"""
+
+        with self.lock:
+            row = self.connection.execute('SELECT depth, nodes, started_at, finished_at FROM crawl_rounds WHERE target = ?',
+                                          (target,)).fetchone()
+        if row is None:
+            return None
+        nodes = array(FriendsSnapshot.TYPECODE)
+        nodes.frombytes(row[1])
+        return {'depth': row[0], 'nodes': nodes, 'started_at': row[2], 'finished_at': row[3]}
+
+
+    def start_crawl_round(self, target:int, depth:int, nodes:array, ts:int | None = None):
+        """Начинает новый обход графа: запоминает набор вершин и сбрасывает прогресс прошлого"""
+
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM crawl_lists WHERE target = ?', (target,))
+            self.connection.execute('INSERT OR REPLACE INTO crawl_rounds (target, depth, nodes, started_at, finished_at) '
+                                    'VALUES (?, ?, ?, ?, NULL)', (target, depth, nodes.tobytes(), ts or int(time.time())))
+
+
+    def crawled_uids(self, target:int, phase:str) -> set:
+        """Возвращает id, уже обработанные на этапе phase текущего обхода"""
+
+        with self.lock:
+            rows = self.connection.execute('SELECT uid FROM crawl_lists WHERE target = ? AND phase = ?', (target, phase))
+            return {uid for (uid,) in rows}
+
+
+    def save_crawl_lists(self, target:int, phase:str, lists:dict):
+        """Сохраняет полученные на этапе phase списки {uid: array id}, чтобы обход можно было продолжить"""
+
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO crawl_lists (target, phase, uid, uids) VALUES (?, ?, ?, ?)',
+                                        ((target, phase, uid, uids.tobytes()) for uid, uids in lists.items()))
+
+
+    def load_crawl_lists(self, target:int, phase:str) -> list[tuple[int, array]]:
+        """Возвращает [(uid, array id)] этапа phase текущего обхода"""
+
+        with self.lock:
+            rows = self.connection.execute('SELECT uid, uids FROM crawl_lists WHERE target = ? AND phase = ?',
+                                           (target, phase)).fetchall()
+        result = []
+        for uid, data in rows:
+            uids = array(FriendsSnapshot.TYPECODE)
+            uids.frombytes(data)
+            result.append((uid, uids))
+        return result
+
+
+    def finish_crawl_round(self, target:int, added:list[tuple], removed:list[tuple], ts:int | None = None):
+        """Записывает изменения связей графа, удаляет прогресс обхода и отмечает его завершённым"""
+
+        ts = ts or int(time.time())
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT INTO graph_events (target, a, b, kind, ts) VALUES (?, ?, ?, ?, ?)',
+                                        [(target, a, b, 'added', ts) for a, b in added] +
+                                        [(target, a, b, 'removed', ts) for a, b in removed])
+            self.connection.execute('DELETE FROM crawl_lists WHERE target = ?', (target,))
+            self.connection.execute('UPDATE crawl_rounds SET finished_at = ? WHERE target = ?', (ts, target))
+
+
+    def close(self):
+        """Закрывает соединение с базой"""
+
+        with self.lock:
+            self.connection.close()
+        log.info('Хранилище друзей закрыто')
+
+
+    def _select_in(self, query:str, ids:list[int], params:tuple = ()) -> list:
+        """Выполняет запрос с IN ({}) частями по IN_BATCH_SIZE id, params - параметры до IN"""
+
+        rows = []
+        with self.lock:
+            for start in range(0, len(ids), self.IN_BATCH_SIZE):
+                batch = ids[start:start + self.IN_BATCH_SIZE]
+                rows.extend(self.connection.execute(query.format(",".join("?" * len(batch))), (*params, *batch)))
+        return rows
+
+
+    def _events_filter(self, targets:list[int] | None, since_ts:int | None, until_ts:int | None) -> tuple[str, list]:
+        """Условие WHERE и его параметры для выборки событий журнала друзей"""
+
+        conditions = []
+        params = []
+        if targets:
+            conditions.append(f'target IN ({",".join("?" * len(targets))})')
+            params.extend(targets)
+        if since_ts is not None:
+            conditions.append('ts >= ?')
+            params.append(since_ts)
+        if until_ts is not None:
+            conditions.append('ts < ?')
+            params.append(until_ts)
+        return ('WHERE ' + ' AND '.join(conditions)) if conditions else '', params
+
+
+    def _mark_synced(self, target:int, ts:int):
+        """Запоминает время последней сверки списка, вызывается внутри транзакции"""
+
+        self.connection.execute('INSERT INTO targets (target, synced_at) VALUES (?, ?) '
+                                'ON CONFLICT (target) DO UPDATE SET synced_at = excluded.synced_at', (target, ts))
@@ -0,0 +1,54 @@
+import os
+
+from extensions.logging_ext import log
+from extensions.path_ext import get_path
+from extensions.dotenv_ext import get_env
+
+
+def load_targets(default_interval:int) -> dict[str, int]:
+    """
+    Возвращает {id пользователя VK: интервал проверки в секундах} для всех, за кем следим.
+    Берёт id из USER_IDS (через запятую, можно id:интервал), из файла TARGETS_FILE
+    (по одному id в строке, через пробел можно указать интервал, # - комментарий,
+    по умолчанию data/targets.txt) и из старой настройки USER_ID.
+    Если интервал не указан - используется default_interval.
+    Повторы и нечисловые id отбрасываются.
+    """
+
+    entries = []
+
+    user_ids = get_env('USER_IDS', '')
+    entries.extend(entry.replace(':', ' ') for entry in user_ids.split(','))
+
+    targets_file = get_env('TARGETS_FILE', get_path('data', 'targets.txt'))
+    if os.path.exists(targets_file):
+        with open(targets_file, "r", encoding="utf-8") as f:
+            for line in f:
+                entries.append(line.split('#', 1)[0])
+
+    entries.append(get_env('USER_ID', ''))
+
+    targets = {}
+    for entry in entries:
+        parts = entry.split()
+        if not parts or parts[0] == 'None':
+            continue
+
+        user_id = parts[0].removeprefix('id')
+        if not user_id.isdigit():
+            log.warning(f'Пропускаю некорректный id пользователя: {parts[0]}')
+            continue
+
+        interval = default_interval
+        if len(parts) > 1:
+            if parts[1].isdigit() and int(parts[1]) > 0:
+                interval = int(parts[1])
+            else:
+                log.warning(f'Некорректный интервал для пользователя {user_id}: {parts[1]}, используется {default_interval}')
+
+        targets.setdefault(user_id, interval)
+
+    log.info(f'Отслеживаемых пользователей: {len(targets)}')
+    return targets
+
+__all__ = ['load_targets']
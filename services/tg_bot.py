@@ -1,34 +1,305 @@
 import json
+import time
+import random
+import sqlite3
+import threading
+import http.client
 import urllib.parse
-import urllib.request
 
 from extensions.logging_ext import log
+from extensions.path_ext import get_path
 from extensions.dotenv_ext import get_env
+from extensions.metrics_ext import metrics
+
+
+class TelegramUnavailable(Exception):
+    """Telegram временно недоступен, сообщение нужно отправить позже"""
 
 
 class TelegramAgent:
     """Отправка сообщений через Telegram Bot API без сторонних библиотек"""
 
-    def __init__(self):
+    # Ограничение Telegram на длину одного сообщения
+    MAX_MESSAGE_LENGTH = 4096
+
+    def __init__(self, stopped: threading.Event | None = None):
         self.BOT_TOKEN = get_env('TG_BOT_TOKEN')
         self.CHAT_ID = get_env('TG_CHAT_ID')
+        self.API_URL = get_env('TG_API_URL', 'https://api.telegram.org')
+        self.TIMEOUT = float(get_env('TG_TIMEOUT', '15'))
+        self.MAX_RETRIES = int(get_env('TG_MAX_RETRIES', '5'))
 
-    def send_message(self, text: str):
-        """Отправляет сообщение в Telegram"""
+        # Одно keep-alive соединение на все сообщения
+        self.connection = None
+        # Паузы между повторами прерываются этим событием
+        self.stopped = stopped or threading.Event()
 
-        url = f"https://api.telegram.org/bot{self.BOT_TOKEN}/sendMessage"
-        data = {
-            "chat_id": self.CHAT_ID,
-            "text": text
-        }
-        encoded_data = urllib.parse.urlencode(data).encode()
+    def send_message(self, text: str) -> bool:
+        """
+        Отправляет сообщение в Telegram, длинное - несколькими частями.
+        Возвращает True если доставлено, False если Telegram отклонил сообщение.
+        Если Telegram недоступен и повторы не помогли - поднимает TelegramUnavailable.
+        """
 
-        try:
-            with urllib.request.urlopen(url, data=encoded_data) as response:
-                result = json.loads(response.read())
+        for chunk in split_message(text, self.MAX_MESSAGE_LENGTH):
+            if not self.send_chunk(chunk):
+                return False
+        return True
+
+    def send_chunk(self, text: str) -> bool:
+        """
+        Отправляет одно сообщение не длиннее MAX_MESSAGE_LENGTH.
+        На 429 ждёт retry_after, на сетевые ошибки и 5xx - экспоненциальную задержку.
+        Если во время паузы установлено stopped - сразу поднимает TelegramUnavailable.
+        """
+
+        attempt = 0
+        while True:
+            try:
+                with metrics.timer('telegram_send'):
+                    status, result = self._post('sendMessage', {"chat_id": self.CHAT_ID, "text": text})
                 if result.get('ok'):
+                    metrics.inc('telegram_messages_sent_total')
                     log.info(f'Сообщение отправлено в Telegram (chat_id={self.CHAT_ID})')
+                    return True
+                metrics.inc('telegram_errors_total', status=status)
+
+                if status == 429:
+                    delay = float(result.get('parameters', {}).get('retry_after', 1))
+                elif status >= 500:
+                    delay = min(60.0, 2 ** attempt) + random.uniform(0, 1)
                 else:
                     log.error(f'Ошибка API Telegram: {result}')
-        except Exception as e:
-            log.error(f'Непредвиденная ошибка при отправке сообщения в Telegram: {e}')
\ No newline at end of file
+                    return False
+
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                self.close()
+                status = None
+                metrics.inc('telegram_errors_total', status='network')
+                delay = min(60.0, 2 ** attempt) + random.uniform(0, 1)
+                log.warning(f'Ошибка соединения с Telegram: {e}')
+
+            if attempt >= self.MAX_RETRIES:
+                raise TelegramUnavailable(f'Telegram недоступен (последний статус: {status})')
+            attempt += 1
+            log.warning(f'Повтор отправки в Telegram {attempt}/{self.MAX_RETRIES} через {delay:.1f} сек.')
+            if self.stopped.wait(delay):
+                raise TelegramUnavailable('Отправка в Telegram остановлена')
+
+    def close(self):
+        """Закрывает соединение с Telegram"""
+
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def _post(self, method: str, payload: dict) -> tuple[int, dict]:
+        """POST запрос к Bot API через общее соединение, возвращает (HTTP статус, JSON ответа)"""
+
+        url = urllib.parse.urlsplit(self.API_URL)
+        if self.connection is None:
+            connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+            self.connection = connection_class(url.netloc, timeout=self.TIMEOUT)
+
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self.connection.request('POST', f'{url.path.rstrip("/")}/bot{self.BOT_TOKEN}/{method}', body=body,
+                                headers={'Content-Type': 'application/json', 'Connection': 'keep-alive'})
+        response = self.connection.getresponse()
+        data = response.read()
+        if response.will_close:
+            self.close()
+        return response.status, json.loads(data)
+
+
+class TelegramNotifier:
+    """
+    Неблокирующая отправка уведомлений: сообщения складываются в ограниченную
+    очередь на диске (data/notifications.db), фоновый поток собирает всё, что пришло
+    за TG_COALESCE_WINDOW секунд, в части по 4096 символов (целые сообщения, длинное - несколькими
+    частями) и отправляет через одно keep-alive соединение. Сообщение удаляется из очереди,
+    когда ушла его последняя часть, неотправленное переживает перезапуск.
+    Сообщения части, которую Telegram отклонил (не временная ошибка), не удаляются,
+    а остаются в очереди с пометкой failed (не больше MAX_QUEUE_SIZE последних).
+    """
+
+    def __init__(self, db_path: str | None = None):
+        self.DB_PATH = db_path or get_path('data', 'notifications.db')
+        self.MAX_QUEUE_SIZE = int(get_env('TG_QUEUE_SIZE', '1000'))
+        self.COALESCE_WINDOW = float(get_env('TG_COALESCE_WINDOW', '5'))
+        # Сколько сообщений очереди объединяется за один раз
+        self.MAX_BATCH = 200
+
+        self.lock = threading.Lock()
+        self.has_messages = threading.Event()
+        self.stopped = threading.Event()
+        self.agent = TelegramAgent(self.stopped)
+
+        self.connection = sqlite3.connect(self.DB_PATH, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS outbox ('
+                                'id INTEGER PRIMARY KEY AUTOINCREMENT, text TEXT NOT NULL, created_at INTEGER NOT NULL, '
+                                'failed INTEGER NOT NULL DEFAULT 0)')
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(outbox)')]
+        if 'failed' not in columns:
+            self.connection.execute('ALTER TABLE outbox ADD COLUMN failed INTEGER NOT NULL DEFAULT 0')
+        self.connection.commit()
+        if self.queue_size():
+            self.has_messages.set()
+
+        metrics.gauge('telegram_queue_size', self.queue_size, 'Уведомлений в очереди на отправку')
+        self.worker = threading.Thread(target=self._work, name='tg-notifier', daemon=True)
+        self.worker.start()
+
+    def notify(self, text: str):
+        """Ставит сообщение в очередь и сразу возвращается"""
+
+        with self.lock, self.connection:
+            self.connection.execute('INSERT INTO outbox (text, created_at) VALUES (?, ?)', (text, int(time.time())))
+            overflow = self._queue_size() - self.MAX_QUEUE_SIZE
+            if overflow > 0:
+                self.connection.execute('DELETE FROM outbox WHERE id IN '
+                                        '(SELECT id FROM outbox WHERE failed = 0 ORDER BY id LIMIT ?)', (overflow,))
+                log.warning(f'Очередь уведомлений переполнена, удалено старых сообщений: {overflow}')
+        metrics.inc('notifications_queued_total')
+        self.has_messages.set()
+
+    def queue_size(self) -> int:
+        """Количество сообщений, ожидающих отправки"""
+
+        with self.lock:
+            return self._queue_size()
+
+    def stop(self, timeout: float = 5):
+        """Останавливает фоновый поток, неотправленное остаётся в очереди"""
+
+        self.stopped.set()
+        self.has_messages.set()
+        self.worker.join(timeout)
+        self.agent.close()
+
+    def _work(self):
+        """Фоновый поток: ждёт сообщения, объединяет и отправляет"""
+
+        backoff = 1.0
+        while not self.stopped.is_set():
+            self.has_messages.wait()
+            if self.stopped.wait(self.COALESCE_WINDOW):
+                return
+
+            with self.lock:
+                rows = self.connection.execute('SELECT id, text FROM outbox WHERE failed = 0 ORDER BY id LIMIT ?',
+                                               (self.MAX_BATCH,)).fetchall()
+                if len(rows) < self.MAX_BATCH:
+                    self.has_messages.clear()
+            if not rows:
+                continue
+
+            chunks = self._chunk_rows(rows)
+            # Сообщение удаляется из очереди, когда ушла его последняя часть
+            last_chunk = {row_id: index for index, (_, row_ids) in enumerate(chunks) for row_id in row_ids}
+            rejected = set()
+            log.info(f'Отправка в Telegram: сообщений в очереди {len(rows)}, частей {len(chunks)}')
+
+            index = 0
+            while index < len(chunks) and not self.stopped.is_set():
+                text, row_ids = chunks[index]
+                # Остальные части уже отклонённого длинного сообщения не отправляются
+                if rejected.issuperset(row_ids):
+                    index += 1
+                    continue
+                try:
+                    delivered = self.agent.send_chunk(text)
+                except TelegramUnavailable as e:
+                    log.error(f'{e}, повтор через {backoff:.0f} сек.')
+                    self.stopped.wait(backoff)
+                    backoff = min(backoff * 2, 600)
+                    continue
+
+                backoff = 1.0
+                if delivered:
+                    self._delete([row_id for row_id in row_ids if last_chunk[row_id] == index and row_id not in rejected])
+                else:
+                    rejected.update(row_ids)
+                    self._mark_failed(row_ids)
+                index += 1
+
+    def _chunk_rows(self, rows: list[tuple[int, str]]) -> list[tuple[str, list[int]]]:
+        """
+        Объединяет сообщения очереди [(id, текст)] в части не длиннее MAX_MESSAGE_LENGTH:
+        целые сообщения через пустую строку, слишком длинное - отдельными частями.
+        Возвращает [(текст части, id сообщений в ней)].
+        """
+
+        limit = TelegramAgent.MAX_MESSAGE_LENGTH
+        chunks = []
+        text, row_ids = None, []
+        for row_id, row_text in rows:
+            candidate = row_text if text is None else f'{text}\n\n{row_text}'
+            if len(candidate) <= limit:
+                text = candidate
+                row_ids.append(row_id)
+                continue
+
+            if text is not None:
+                chunks.append((text, row_ids))
+            if len(row_text) <= limit:
+                text, row_ids = row_text, [row_id]
+            else:
+                # Сообщение из одних пробелов Telegram отклонит, и оно уйдёт в failed, а не застрянет в очереди
+                parts = split_message(row_text, limit) or [row_text[:limit]]
+                chunks.extend((part, [row_id]) for part in parts)
+                text, row_ids = None, []
+
+        if text is not None:
+            chunks.append((text, row_ids))
+        return chunks
+
+    def _delete(self, row_ids: list[int]):
+        """Удаляет доставленные сообщения из очереди"""
+
+        if row_ids:
+            with self.lock, self.connection:
+                self.connection.execute(f'DELETE FROM outbox WHERE id IN ({",".join("?" * len(row_ids))})', row_ids)
+
+    def _mark_failed(self, row_ids: list[int]):
+        """Помечает отклонённые Telegram сообщения, старые отклонённые сверх MAX_QUEUE_SIZE удаляются"""
+
+        with self.lock, self.connection:
+            self.connection.execute(f'UPDATE outbox SET failed = 1 WHERE id IN ({",".join("?" * len(row_ids))})', row_ids)
+            self.connection.execute('DELETE FROM outbox WHERE failed = 1 AND id NOT IN '
+                                    '(SELECT id FROM outbox WHERE failed = 1 ORDER BY id DESC LIMIT ?)', (self.MAX_QUEUE_SIZE,))
+        metrics.inc('notifications_failed_total', len(row_ids))
+        log.error(f'Telegram отклонил сообщения (id в очереди {row_ids[0]}..{row_ids[-1]}: {len(row_ids)} шт.), '
+                  f'они сохранены в {self.DB_PATH} с пометкой failed')
+
+    def _queue_size(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM outbox WHERE failed = 0').fetchone()[0]
+
+
+def split_message(text: str, limit: int) -> list[str]:
+    """
+    Делит текст на части не длиннее limit, стараясь резать по строкам.
+    Строка длиннее limit режется по символам. Пустые строки сохраняются,
+    отбрасываются только части из одних пробелов (Telegram их не принимает).
+    """
+
+    chunks = []
+    current = None
+    for line in text.split('\n'):
+        while len(line) > limit:
+            if current is not None:
+                chunks.append(current)
+                current = None
+            chunks.append(line[:limit])
+            line = line[limit:]
+
+        candidate = line if current is None else f'{current}\n{line}'
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = candidate
+
+    if current is not None:
+        chunks.append(current)
+    return [chunk for chunk in chunks if chunk.strip()]
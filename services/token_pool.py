@@ -0,0 +1,133 @@
+import time
+
+from extensions.logging_ext import log
+from extensions.path_ext import get_path
+from extensions.dotenv_ext import get_env
+from services.vk import VKInteraction
+from services.browser import BrowserManager
+from services.token_store import TokenStore
+from services.token_refresher import TokenRefresher
+
+
+def load_accounts() -> list[str]:
+    """
+    Возвращает названия аккаунтов VK из VK_ACCOUNTS (через запятую).
+    Если не указаны - один аккаунт по умолчанию (профиль data/profile_data).
+    """
+
+    accounts = []
+    for account in get_env('VK_ACCOUNTS', '').split(','):
+        account = account.strip()
+        if account and account != 'None' and account not in accounts:
+            accounts.append(account)
+    return accounts or [BrowserManager.DEFAULT_ACCOUNT]
+
+
+class TokenPool:
+    """
+    Несколько аккаунтов VK: у каждого свой профиль браузера, свой токен
+    и свой фоновый TokenRefresher, а значит и свой лимит запросов.
+    Пользователи закрепляются за аккаунтами так, чтобы нагрузка
+    (сумма 1/интервал опроса) распределялась поровну. Если токен аккаунта
+    отклонён или упёрся в лимит, его пользователи переходят к остальным.
+    Методы распределения вызываются только из цикла asyncio.
+    """
+
+    def __init__(self, browser_managers:list):
+        # На сколько секунд аккаунт выводится из работы после ошибки 6 (слишком много запросов)
+        self.THROTTLE_COOLDOWN = int(get_env('TOKEN_THROTTLE_COOLDOWN', '600'))
+
+        self.refreshers = {}
+        for browser_manager in browser_managers:
+            account = browser_manager.ACCOUNT
+            token_path = None
+            if account != BrowserManager.DEFAULT_ACCOUNT:
+                token_path = get_path('data', f'token_{account}.json')
+            vk_interaction = VKInteraction(browser_manager, TokenStore(token_path))
+            self.refreshers[account] = TokenRefresher(vk_interaction, account)
+        self.RETRY_DELAY = min(refresher.RETRY_DELAY for refresher in self.refreshers.values())
+
+        # Пользователь -> аккаунт, его вклад в нагрузку и нагрузка аккаунтов
+        self.assignments = {}
+        self.weights = {}
+        self.loads = dict.fromkeys(self.refreshers, 0.0)
+        # Аккаунт -> до какого момента (time.monotonic) он не используется
+        self.cooldowns = {}
+
+
+    def start(self):
+        """Запускает фоновое получение токенов всех аккаунтов"""
+
+        for refresher in self.refreshers.values():
+            refresher.start()
+
+
+    def stop(self):
+        """Останавливает фоновые потоки всех аккаунтов"""
+
+        for refresher in self.refreshers.values():
+            refresher.stop()
+
+
+    def browser_manager(self, account:str):
+        return self.refreshers[account].vk_interaction.browser_manager
+
+
+    def available_tokens(self) -> dict[str, str]:
+        """Возвращает {аккаунт: токен} для аккаунтов с действующим токеном и без паузы"""
+
+        now = time.monotonic()
+        tokens = {}
+        for account, refresher in self.refreshers.items():
+            if self.cooldowns.get(account, 0) > now:
+                continue
+            token = refresher.current_token()
+            if token is not None:
+                tokens[account] = token
+        return tokens
+
+
+    def assign(self, intervals:dict[str, float]) -> tuple[dict, list[str]]:
+        """
+        Распределяет пачку пользователей ({id: интервал опроса}) по аккаунтам.
+        Возвращает ({аккаунт: (токен, [id])}, [id без доступного аккаунта]).
+        Пользователь остаётся за своим аккаунтом, пока тот доступен и перекос
+        нагрузки не больше его собственного вклада, иначе уходит к наименее загруженному.
+        """
+
+        tokens = self.available_tokens()
+        if not tokens:
+            return {}, list(intervals)
+
+        groups = {}
+        for target, interval in intervals.items():
+            weight = 1 / max(interval, 1)
+            current = self.assignments.get(target)
+            if current is not None:
+                self.loads[current] -= self.weights.pop(target)
+
+            account = min(tokens, key=self.loads.get)
+            if current in tokens and self.loads[current] - self.loads[account] <= weight:
+                account = current
+            elif current is not None:
+                log.info(f'Пользователь {target} переходит от аккаунта {current} к {account}')
+
+            self.assignments[target] = account
+            self.weights[target] = weight
+            self.loads[account] += weight
+            groups.setdefault(account, (tokens[account], []))[1].append(target)
+        return groups, []
+
+
+    def invalidate(self, account:str, token:str):
+        """VK отклонил токен аккаунта: его пользователи перейдут к другим, пока токен получается заново"""
+
+        self.refreshers[account].invalidate(token)
+
+
+    def throttle(self, account:str):
+        """Аккаунт упёрся в лимит запросов VK: выводится из работы на THROTTLE_COOLDOWN секунд"""
+
+        self.cooldowns[account] = time.monotonic() + self.THROTTLE_COOLDOWN
+        log.warning(f'Аккаунт {account}: слишком много запросов, пауза {self.THROTTLE_COOLDOWN} сек., '
+                    f'пользователи переходят к другим аккаунтам')
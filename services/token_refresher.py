@@ -0,0 +1,133 @@
+import time
+import threading
+
+from extensions.logging_ext import log
+from extensions.dotenv_ext import get_env
+from services.vk_client import VKClient
+
+
+class TokenRefresher:
+    """
+    Получение и обновление токена VK в отдельном потоке.
+    Опрос друзей не ждёт браузер и авторизацию: он берёт текущий опубликованный
+    токен через current_token(), а поток заранее, за TOKEN_RENEW_BEFORE секунд
+    до истечения, получает новый и подменяет его одним присваиванием под блокировкой.
+    Пока действующего токена нет, current_token() возвращает None.
+    """
+
+    def __init__(self, vk_interaction, account:str | None = None):
+        self.vk_interaction = vk_interaction
+        self.ACCOUNT = account or vk_interaction.browser_manager.ACCOUNT
+        self.token_store = vk_interaction.token_store
+        # За сколько секунд до истечения токен обновляется заранее
+        self.RENEW_BEFORE = int(get_env('TOKEN_RENEW_BEFORE', '3600'))
+        # Пауза перед повторной попыткой, если токена нет
+        self.RETRY_DELAY = int(get_env('TOKEN_RETRY_DELAY', '60'))
+        # Пауза перед повторным обновлением заранее, если срок продлить не удалось
+        self.RENEW_RETRY_DELAY = 600
+        # Как часто просыпаться, если срок действия токена не известен
+        self.CHECK_INTERVAL = 3600
+
+        self.lock = threading.Lock()
+        self.token_data = None
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.worker = threading.Thread(target=self._work, name=f'vk-token-{self.ACCOUNT}', daemon=True)
+
+
+    def start(self):
+        """
+        Публикует сохранённый токен, если он не истёк, и запускает фоновый поток.
+        Сохранённый токен публикуется сразу, без запроса к VK, чтобы первый проход
+        планировщика не откладывался на TOKEN_RETRY_DELAY; если VK его отклонит,
+        опрос снимет его через invalidate() и поток получит новый.
+        """
+
+        token_data = self.token_store.load()
+        if token_data is not None and not self.token_store.is_expired(token_data):
+            with self.lock:
+                self.token_data = token_data
+            log.info(f'Аккаунт {self.ACCOUNT}: опубликован сохранённый токен VK')
+        self.worker.start()
+
+
+    def stop(self, timeout:float = 5):
+        """Останавливает поток, ожидание авторизации в браузере прерывается"""
+
+        self.stopped.set()
+        self.wakeup.set()
+        self.worker.join(timeout)
+
+
+    def current_token(self) -> str:
+        """Возвращает опубликованный действующий токен, если его нет - None. Не блокирует"""
+
+        with self.lock:
+            token_data = self.token_data
+        if token_data is None or self.token_store.is_expired(token_data):
+            return None
+        return token_data['access_token']
+
+
+    def invalidate(self, token:str):
+        """VK отклонил токен: он снимается с публикации, поток сразу получает новый"""
+
+        with self.lock:
+            if self.token_data is None or self.token_data['access_token'] != token:
+                return
+            self.token_data = None
+        VKClient.forget_token(token)
+        self.wakeup.set()
+
+
+    def _work(self):
+        """Фоновый поток: получает токен, если его нет, и обновляет заранее"""
+
+        while not self.stopped.is_set():
+            with self.lock:
+                token_data = self.token_data
+
+            if token_data is None or self.token_store.is_expired(token_data):
+                delay = self._acquire(renew=False)
+            elif self.token_store.is_expired(token_data, self.RENEW_BEFORE):
+                delay = self._acquire(renew=True)
+            else:
+                delay = self._time_to_renew(token_data)
+
+            self.wakeup.wait(delay)
+            self.wakeup.clear()
+
+
+    def _acquire(self, renew:bool) -> float:
+        """Получает токен и публикует его, возвращает паузу до следующей проверки"""
+
+        if renew:
+            log.info(f'Аккаунт {self.ACCOUNT}: срок действия токена подходит к концу, обновляю заранее')
+        try:
+            token_data = self.vk_interaction.get_vk_actual_token_data(renew, self.stopped)
+        except Exception as e:
+            log.error(f'Аккаунт {self.ACCOUNT}: не удалось получить токен VK: {e}')
+            token_data = None
+
+        if token_data is None:
+            return self.RENEW_RETRY_DELAY if renew else self.RETRY_DELAY
+
+        with self.lock:
+            previous = self.token_data
+            self.token_data = token_data
+
+        if previous is not None and previous['access_token'] == token_data['access_token']:
+            log.warning(f'Аккаунт {self.ACCOUNT}: срок действия токена продлить не удалось, повтор через {self.RENEW_RETRY_DELAY} сек.')
+            return self.RENEW_RETRY_DELAY
+
+        log.info(f'Аккаунт {self.ACCOUNT}: новый токен VK опубликован')
+        return self._time_to_renew(token_data)
+
+
+    def _time_to_renew(self, token_data:dict) -> float:
+        """Секунды до момента, когда токен пора обновлять заранее"""
+
+        expires = self.token_store.expires_at(token_data)
+        if expires is None:
+            return self.CHECK_INTERVAL
+        return min(self.CHECK_INTERVAL, max(0, expires - self.RENEW_BEFORE - time.time()))
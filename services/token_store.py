@@ -0,0 +1,104 @@
+import os
+import json
+import time
+
+from extensions.logging_ext import log
+from extensions.path_ext import get_path
+from extensions.file_ext import atomic_open
+from extensions.metrics_ext import metrics
+
+
+class TokenStore:
+    """Хранение токена VK между циклами и перезапусками программы"""
+
+    def __init__(self, file_path:str | None = None):
+        self.FILE_PATH = file_path or get_path('data', 'token.json')
+        # Запас по времени до истечения токена, в секундах
+        self.EXPIRE_MARGIN = 300
+
+        # Токен в памяти, чтобы не читать файл каждый цикл
+        self.token_data = None
+
+
+    def load(self) -> dict:
+        """
+        Возвращает сохранённые данные токена (JSON ключа :web_token:login:auth
+        с добавленным временем сохранения), если файла нет или он
+        повреждён - вернёт None.
+        """
+
+        if self.token_data is not None:
+            return self.token_data
+
+        if not os.path.exists(self.FILE_PATH):
+            log.info("Сохранённый токен не найден")
+            return None
+
+        try:
+            with open(self.FILE_PATH, "r", encoding="utf-8") as f:
+                token_data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            log.warning(f"Не удалось прочитать сохранённый токен: {e}")
+            return None
+
+        if not isinstance(token_data, dict) or not token_data.get('access_token'):
+            log.warning("Сохранённый токен имеет неверный формат")
+            return None
+
+        self.token_data = token_data
+        log.info("Загружен сохранённый токен")
+        return token_data
+
+
+    def save(self, token_data:dict):
+        """Сохраняет данные токена в память и в файл (атомарно, обрезанного файла не остаётся)"""
+
+        token_data = dict(token_data)
+        token_data.setdefault('saved_at', int(time.time()))
+        self.token_data = token_data
+
+        with atomic_open(self.FILE_PATH, "w", encoding="utf-8") as f:
+            json.dump(token_data, f, ensure_ascii=False)
+            metrics.inc('bytes_written_total', f.tell(), file='token.json')
+        log.info("Токен сохранён")
+
+
+    def clear(self):
+        """Удаляет сохранённый токен, например если VK его отклонил"""
+
+        self.token_data = None
+        if os.path.exists(self.FILE_PATH):
+            os.remove(self.FILE_PATH)
+        log.info("Сохранённый токен удалён")
+
+
+    def is_expired(self, token_data:dict, margin:float | None = None) -> bool:
+        """
+        Проверяет срок действия токена по полю expires (unix-время),
+        с запасом margin (по умолчанию EXPIRE_MARGIN). Если срок не указан - считается действующим.
+        """
+
+        expires = self.expires_at(token_data)
+        if expires is None:
+            return False
+        if margin is None:
+            margin = self.EXPIRE_MARGIN
+        return time.time() + margin >= expires
+
+
+    def expires_at(self, token_data:dict) -> int:
+        """Время истечения токена в секундах (unix-время), если не указано - None"""
+
+        expires = token_data.get('expires')
+        if not expires:
+            return None
+
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            return None
+
+        # VK местами хранит время в миллисекундах
+        if expires > 10 ** 12:
+            expires //= 1000
+        return expires
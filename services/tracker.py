@@ -0,0 +1,271 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from extensions.logging_ext import log
+from extensions.dotenv_ext import get_env
+from extensions.metrics_ext import metrics
+from extensions.deadline_ext import Deadline
+from services.vk import VKManager, AsyncVKManager
+from services.vk_client import VKAuthError, VKTooManyRequestsError
+from services.storage import FriendsStorage
+from services.scheduler import TargetScheduler
+from services.circuit_breaker import CircuitBreaker
+from services.profile_cache import ProfileCache
+from services.tg_bot import TelegramNotifier
+from services.token_pool import TokenPool
+from services.metrics_server import MetricsServer
+from services.query_server import QueryServer
+
+
+class FriendsTracker:
+    """
+    Опрос отслеживаемых пользователей: запросы к VK и расписание.
+    Токены аккаунтов обновляются в фоне, пачка делится между аккаунтами (см. TokenPool).
+    Опрос каждого аккаунта идёт под сторожем со сроком, неудачи учитываются
+    предохранителем каждого пользователя отдельно (см. CircuitBreaker).
+    """
+
+    def __init__(self, browser_managers:list, targets:dict[str, int]):
+        self.MAX_CONCURRENCY = int(get_env('MAX_CONCURRENCY', '4'))
+        self.JITTER = float(get_env('REFRESH_JITTER', '0.1'))
+        self.BATCH_WINDOW = float(get_env('BATCH_WINDOW', '30'))
+        # Полная выгрузка списка не реже чем раз в столько секунд, даже если проба не изменилась
+        self.FULL_CHECK_INTERVAL = int(get_env('FULL_CHECK_INTERVAL', '86400'))
+        # В каких пределах (доли от заданного интервала) подстраивается интервал опроса
+        self.ADAPTIVE_MIN_FACTOR = float(get_env('ADAPTIVE_MIN_FACTOR', '0.5'))
+        self.ADAPTIVE_MAX_FACTOR = float(get_env('ADAPTIVE_MAX_FACTOR', '8'))
+        # Срок опроса пачки одним аккаунтом (0 - без ограничения) и сколько ещё ждать
+        # поток после срока, прежде чем считать опрос зависшим
+        self.CYCLE_TIMEOUT = float(get_env('CYCLE_TIMEOUT', '900'))
+        self.STALL_GRACE = float(get_env('STALL_GRACE', '60'))
+        self.base_intervals = dict(targets)
+
+        self.token_pool = TokenPool(browser_managers)
+        self.storage = FriendsStorage()
+        self.profile_cache = ProfileCache(self.storage)
+        self.notifier = TelegramNotifier()
+        self.metrics_server = MetricsServer()
+        self.query_server = QueryServer(self.storage, self.profile_cache)
+        self.breaker = CircuitBreaker()
+        metrics.gauge('circuit_open_targets', self.breaker.open_count, 'Пользователи с разомкнутым предохранителем опроса')
+        # Опросы, отменённые сторожем, чьи потоки ещё не вернулись
+        self.stuck_polls = set()
+        metrics.gauge('stuck_workers', lambda: len(self.stuck_polls), 'Потоки зависших опросов, ещё занятые в пуле')
+        self.executor = ThreadPoolExecutor(max_workers=self.MAX_CONCURRENCY, thread_name_prefix='vk')
+        self.scheduler = TargetScheduler(self._restore_intervals(), self.poll_targets, self.MAX_CONCURRENCY,
+                                         VKManager.EXECUTE_BATCH_SIZE, self.JITTER, self.BATCH_WINDOW)
+
+        # Аккаунт -> AsyncVKManager его текущего токена
+        self.vk_managers = {}
+        self.loop = None
+
+
+    async def run(self):
+        """Запускает планировщик, работает до вызова stop()"""
+
+        self.loop = asyncio.get_running_loop()
+        self.token_pool.start()
+        self.metrics_server.start()
+        self.query_server.start()
+        try:
+            await self.scheduler.run()
+        finally:
+            self.query_server.stop()
+            self.metrics_server.stop()
+            self.token_pool.stop()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.notifier.stop()
+
+
+    def stop(self):
+        """Останавливает опрос, можно вызывать из любого потока"""
+
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.scheduler.stop)
+
+
+    async def poll_targets(self, user_ids:list[str]):
+        """Опрашивает пачку пользователей, вызывается планировщиком"""
+
+        intervals = {user_id: self.scheduler.intervals.get(user_id, self.base_intervals[user_id]) for user_id in user_ids}
+        groups, pending = self.token_pool.assign(intervals)
+        if pending:
+            self._postpone(pending, 'Нет действующего токена')
+        if not groups:
+            return
+
+        with metrics.timer('cycle'):
+            await asyncio.gather(*(self._poll_account(account, token, targets)
+                                   for account, (token, targets) in groups.items()))
+        metrics.inc('cycles_total')
+        metrics.inc('targets_polled_total', sum(len(targets) for _, targets in groups.values()))
+
+
+    async def _poll_account(self, account:str, token:str, user_ids:list[str]):
+        """
+        Опрашивает пользователей, закреплённых за одним аккаунтом. Весь опрос
+        и каждый его этап идут под сроком (CYCLE_TIMEOUT), отсчёт начинается,
+        когда опрос получил поток пула. Если поток не вернулся и через STALL_GRACE
+        секунд после срока, опрос считается зависшим (см. _hold_stuck).
+        Ошибка опроса - неудача для каждого пользователя пачки, ошибки токена
+        и лимита - нет, их пользователи откладываются.
+        """
+
+        vk_manager = self._get_vk_manager(account, token)
+        deadline = Deadline(self.CYCLE_TIMEOUT, 'cycle')
+        poll = asyncio.ensure_future(vk_manager.poll_friends_lists(user_ids, self.FULL_CHECK_INTERVAL, deadline))
+        try:
+            if not await self._watch(poll, deadline):
+                self._hold_stuck(account, user_ids, poll, deadline)
+                return
+            changes = poll.result()
+        except asyncio.CancelledError:
+            deadline.cancel()
+            poll.cancel()
+            raise
+        except VKAuthError:
+            self.token_pool.invalidate(account, token)
+            self._postpone(user_ids, f'Аккаунт {account}: VK отклонил токен')
+            return
+        except VKTooManyRequestsError:
+            self.token_pool.throttle(account)
+            self._postpone(user_ids, f'Аккаунт {account}: слишком много запросов')
+            return
+        except Exception as e:
+            log.error(f'Аккаунт {account}: не удалось опросить пользователей {", ".join(user_ids)}: {e}')
+            self._record_results(dict.fromkeys(user_ids))
+            return
+
+        self._record_results(changes)
+        await self._adapt_intervals(changes)
+
+
+    async def _watch(self, poll:asyncio.Future, deadline:Deadline) -> bool:
+        """Сторож опроса: ждёт его завершения, False - если поток не вернулся и через STALL_GRACE секунд после срока"""
+
+        if self.CYCLE_TIMEOUT <= 0:
+            await asyncio.wait({poll})
+            return True
+
+        while not poll.done():
+            if deadline.expires_at is None:
+                # Опрос ещё ждёт свободный поток пула, срок не начался
+                timeout = max(self.STALL_GRACE, 1)
+            else:
+                timeout = deadline.expires_at + self.STALL_GRACE - time.monotonic()
+                if timeout <= 0:
+                    return False
+            await asyncio.wait({poll}, timeout=timeout)
+        return True
+
+
+    def _hold_stuck(self, account:str, user_ids:list[str], poll:asyncio.Future, deadline:Deadline):
+        """
+        Зависший опрос отменяется (поток остановится в ближайшей точке проверки срока)
+        и считается неудачей, но пользователи остаются в опросе, пока поток не вернётся,
+        иначе следующий опрос тех же пользователей пошёл бы параллельно с зависшим
+        """
+
+        deadline.cancel()
+        metrics.inc('cycle_stalls_total')
+        log.error(f'Аккаунт {account}: опрос {len(user_ids)} пользователей завис дольше '
+                  f'{self.CYCLE_TIMEOUT + self.STALL_GRACE:.0f} сек. и отменён')
+        self._record_results(dict.fromkeys(user_ids))
+
+        self.scheduler.hold(user_ids)
+        self.stuck_polls.add(poll)
+        stalled_at = time.monotonic()
+        poll.add_done_callback(lambda poll: self._release_stuck(account, user_ids, poll, stalled_at))
+
+
+    def _release_stuck(self, account:str, user_ids:list[str], poll:asyncio.Future, stalled_at:float):
+        """Поток зависшего опроса вернулся: результат отбрасывается, пользователи возвращаются в расписание"""
+
+        self.stuck_polls.discard(poll)
+        if not poll.cancelled():
+            poll.exception()
+        log.warning(f'Аккаунт {account}: зависший опрос завершился через {time.monotonic() - stalled_at:.0f} сек. '
+                    f'после отмены, пользователи возвращены в расписание')
+        self.scheduler.release(user_ids)
+
+
+    def _record_results(self, changes:dict):
+        """
+        Учитывает результаты опроса ({id: количество изменений или None}) в предохранителях,
+        пользователь с разомкнутым предохранителем откладывается на паузу предохранителя
+        """
+
+        for user_id, changes_count in changes.items():
+            if changes_count is not None:
+                self.breaker.record_success(user_id)
+                continue
+            interval = self.scheduler.intervals.get(user_id, self.base_intervals[user_id])
+            delay = self.breaker.record_failure(user_id, interval)
+            if delay is not None:
+                self.scheduler.postpone(user_id, delay)
+
+
+    async def _adapt_intervals(self, changes:dict):
+        """
+        Подстраивает интервалы под частоту изменений: после изменения интервал
+        уменьшается вдвое, без изменений - растёт в 1.25 раза, в пределах
+        ADAPTIVE_MIN_FACTOR..ADAPTIVE_MAX_FACTOR от заданного интервала.
+        """
+
+        updated = {}
+        for user_id, changes_count in changes.items():
+            if changes_count is None or user_id not in self.base_intervals:
+                continue
+
+            current = self.scheduler.intervals.get(user_id, self.base_intervals[user_id])
+            interval = self._clamp_interval(user_id, current / 2 if changes_count else current * 1.25)
+            if interval != current:
+                self.scheduler.set_interval(user_id, interval)
+                updated[int(user_id)] = interval
+
+        if updated:
+            await self.loop.run_in_executor(self.executor, self._save_intervals, updated)
+
+
+    def _save_intervals(self, intervals:dict):
+        """Сохраняет подобранные интервалы в хранилище"""
+
+        for target, interval in intervals.items():
+            self.storage.save_interval(target, interval)
+
+
+    def _restore_intervals(self) -> dict:
+        """Возвращает интервалы опроса, подобранные в прошлые запуски"""
+
+        states = self.storage.load_poll_states()
+        intervals = {}
+        for user_id, base in self.base_intervals.items():
+            stored = states.get(int(user_id), {}).get('interval')
+            intervals[user_id] = self._clamp_interval(user_id, stored or base)
+        return intervals
+
+
+    def _clamp_interval(self, user_id:str, interval:float) -> int:
+        base = self.base_intervals[user_id]
+        return max(1, round(min(max(interval, base * self.ADAPTIVE_MIN_FACTOR), base * self.ADAPTIVE_MAX_FACTOR)))
+
+
+    def _get_vk_manager(self, account:str, token:str) -> AsyncVKManager:
+        """Возвращает VKManager для текущего токена аккаунта, при смене токена создаёт новый"""
+
+        vk_manager = self.vk_managers.get(account)
+        if vk_manager is None or vk_manager.token != token:
+            vk_manager = VKManager(token, self.token_pool.browser_manager(account),
+                                   self.profile_cache, self.storage, self.notifier)
+            vk_manager = self.vk_managers[account] = AsyncVKManager(vk_manager, self.executor)
+        return vk_manager
+
+
+    def _postpone(self, user_ids:list[str], reason:str):
+        """Откладывает опрос пользователей до появления доступного токена"""
+
+        delay = self.token_pool.RETRY_DELAY
+        log.warning(f'{reason}, опрос {len(user_ids)} пользователей отложен на {delay} сек.')
+        for user_id in user_ids:
+            self.scheduler.postpone(user_id, delay)
@@ -1,135 +1,726 @@
 import os
 import time
 import json
-
-from vk_api import vk_api
+import asyncio
+import threading
 
 from extensions.logging_ext import log
 from extensions.path_ext import get_path
-from services.tg_bot import TelegramAgent
+from extensions.dotenv_ext import get_env
+from extensions.metrics_ext import metrics
+from extensions.deadline_ext import Deadline, DeadlineExceeded, check_deadline, deadline_expired
+from services.tg_bot import TelegramNotifier
+from services.vk_client import VKClient, VKError, VKNetworkError, VKAuthError, VKTooManyRequestsError
+from services.token_store import TokenStore
+from services.profile_cache import ProfileCache
+from services.storage import FriendsStorage
+from services.snapshot import FriendsSnapshot
+from services.snapshot_file import SnapshotFile
+from services.crawler import GraphCrawler
+from services.profile_fields import parse_fields, request_fields, extract_fields, fingerprint, diff_fields
 
 
 class VKManager:
     """Взаимодействие с API"""
 
-    def __init__(self, token:str, browser_manager):
+    # Сколько вызовов API помещается в один запрос execute
+    EXECUTE_BATCH_SIZE = 25
+    # Максимальный размер страницы friends.get
+    FRIENDS_PAGE_SIZE = 5000
+    # Перекрытие соседних страниц: если во время выгрузки кто-то удалился
+    # из начала списка, сдвинутые записи не потеряются
+    FRIENDS_PAGE_OVERLAP = 100
+    # Сколько id принимает один запрос users.get
+    USERS_GET_BATCH_SIZE = 1000
+
+    def __init__(self, token:str, browser_manager, profile_cache:ProfileCache | None = None,
+                 storage:FriendsStorage | None = None, notifier:TelegramNotifier | None = None):
         self.token = token
         self.browser_manager = browser_manager
+        self.client = VKClient.for_token(token)
+        self.storage = storage or FriendsStorage()
+        self.profile_cache = profile_cache or ProfileCache(self.storage)
+        self.notifier = notifier or TelegramNotifier()
+        # Отслеживаемые поля профилей друзей (пусто - не отслеживаются) и как часто их проверять
+        self.PROFILE_FIELDS = parse_fields(get_env('PROFILE_FIELDS', ''))
+        self.PROFILE_CHECK_INTERVAL = int(get_env('PROFILE_CHECK_INTERVAL', '86400'))
+        # Обход графа друзей, если задана глубина GRAPH_DEPTH
+        self.graph_crawler = GraphCrawler(self)
+        if not self.graph_crawler.DEPTH:
+            self.graph_crawler = None
+        # Сроки этапов опроса в секундах (0 - без ограничения): проба, полная выгрузка
+        # списков и каждая дополнительная проверка (профили, граф) одного пользователя
+        self.PROBE_TIMEOUT = float(get_env('PROBE_TIMEOUT', '120'))
+        self.FETCH_TIMEOUT = float(get_env('FETCH_TIMEOUT', '600'))
+        self.EXTRA_CHECK_TIMEOUT = float(get_env('EXTRA_CHECK_TIMEOUT', '300'))
 
 
-    def get_friends_list(self, user_id:str):
-        """Возвращает список друзей пользователя"""
+    def get_friends_list(self, user_id:str) -> int:
+        """
+        Выгружает список друзей пользователя постранично, сверяет его с хранилищем.
+        Возвращает количество изменений (добавленных + пропавших).
+        """
         
-        response = self._api_request('friends.get', user_id=user_id, fields='nickname')
-        current_friends = {str(f['id']): f'{f['first_name']} {f['last_name']}' for f in response['items']}
-        log.info(f'Список друзей получен: {len(current_friends)} чел.')
-        self._save_friends_list_to_file(current_friends)
-        return current_friends
-
-
-    def _save_friends_list_to_file(self, current_friends: dict):
-            """
-            Сохраняет список друзей в файл, если файл существует - сравнивает список,
-            если есть разница - высылает уведомление в ТГ.
-            """
-
-            FRIENDS_FILE_PATH = get_path('data', 'friends.json')
-            tg = TelegramAgent()
-            log.info('Проверка изменений в списке друзей...')
-            
-            if os.path.exists(FRIENDS_FILE_PATH):
-                with open(FRIENDS_FILE_PATH, "r", encoding="utf-8") as f:
-                    old_friends = json.load(f)      
-                log.info(f"Загружен старый список друзей: {len(old_friends)} записей") 
-            else:
-                old_friends = {}
-                log.info("Старый список друзей не найден, создаём новый")
+        response = self._api_request('friends.get', user_id=user_id, count=self.FRIENDS_PAGE_SIZE)
+        pages = self.iter_friends_pages(user_id, first_response=response)
+        changes = self._save_friends_list(pages, user_id, _probe_value(response))
+        self.profile_cache.save()
+        return changes
 
-            # Поиск пропавших и новых друзей
-            lost_friends = set(old_friends) - set(current_friends)
-            new_friends = set(current_friends) - set(old_friends)
 
-            message_parts = []
+    def poll_friends_lists(self, user_ids:list[str], full_check_interval:int, deadline:Deadline | None = None) -> dict:
+        """
+        Двухэтапный опрос: сначала дешёвая проба (количество друзей и первый id,
+        пачками через execute), полная выгрузка и сравнение - только для тех,
+        у кого проба изменилась или подошёл срок плановой полной проверки
+        (раз в full_check_interval секунд, ловит замену друга при том же количестве).
+        Каждый этап выполняется под своим сроком, весь опрос - под deadline
+        (его отменяет сторож цикла, см. FriendsTracker).
+        Возвращает {user_id: количество изменений}, для неудавшихся - None.
+        """
+
+        with deadline or Deadline(None, 'cycle'):
+            return self._poll_friends_lists(user_ids, full_check_interval)
+
 
-            if lost_friends:
-                lost_text = "\n".join(f"{uid}: {old_friends[uid]}" for uid in lost_friends)
-                message_parts.append(f"Пропавшие друзья:\n{lost_text}")
+    def _poll_friends_lists(self, user_ids:list[str], full_check_interval:int) -> dict:
+        """Этапы опроса для poll_friends_lists, выполняются под сроком всего опроса"""
 
-            if new_friends:
-                new_text = "\n".join(f"{uid}: {current_friends[uid]}" for uid in new_friends)
-                message_parts.append(f"Новые друзья:\n{new_text}")
+        now = int(time.time())
+        with metrics.timer('probe'), Deadline(self.PROBE_TIMEOUT, 'probe'):
+            probes = self.probe_friends(user_ids)
+        states = self.storage.load_poll_states([int(user_id) for user_id in user_ids])
 
-            if message_parts:
-                message = "\n\n".join(message_parts)
-                log.info("Обнаружены изменения, отправляю список в Telegram...")
-                tg.send_message(message)
+        result = {}
+        need_full = []
+        for user_id in user_ids:
+            probe = probes.get(user_id)
+            state = states.get(int(user_id))
+            if probe is None:
+                result[user_id] = None
+                continue
+            # Причина полной выгрузки: новый пользователь, изменилась проба или плановая проверка
+            if state is None:
+                reason = 'new'
+            elif probe != (state['friends_count'], state['first_uid']):
+                reason = 'probe'
+            elif now - state['full_checked_at'] >= full_check_interval:
+                reason = 'scheduled'
             else:
-                log.info("Изменений в списке друзей не найдено.")
+                result[user_id] = 0
+                continue
+            metrics.inc('full_checks_total', reason=reason)
+            need_full.append(user_id)
 
-            # Сохраняем актуальный список друзей
-            with open(FRIENDS_FILE_PATH, "w", encoding="utf-8") as f:
-                json.dump(current_friends, f, ensure_ascii=False, indent=4)
+        if need_full:
+            log.info(f'Проба: полная проверка нужна {len(need_full)} из {len(user_ids)} пользователей')
+            with Deadline(self.FETCH_TIMEOUT, 'fetch'):
+                changes = self.get_friends_lists(need_full)
+            for user_id in need_full:
+                result[user_id] = changes.get(user_id)
 
+        checked = [user_id for user_id, changes in result.items() if changes is not None]
+        extra_checks = []
+        if self.PROFILE_FIELDS and checked:
+            targets = self.storage.due_profile_checks([int(user_id) for user_id in checked], now - self.PROFILE_CHECK_INTERVAL)
+            extra_checks += [(self.check_profiles, str(target), 'проверить профили друзей') for target in targets]
+        if self.graph_crawler is not None:
+            extra_checks += [(self.graph_crawler.crawl, user_id, 'продолжить обход графа друзей') for user_id in checked]
+        for number, (check, user_id, description) in enumerate(extra_checks):
+            # Списки уже сохранены, если срок опроса вышел - остальные проверки ждут следующего раза
+            if deadline_expired():
+                log.warning(f'Срок опроса вышел, дополнительные проверки отложены: {len(extra_checks) - number}')
+                break
+            self._run_extra_check(check, user_id, description)
+        return result
 
-    def _api_request(self, api_method: str, **params):
+
+    def probe_friends(self, user_ids:list[str]) -> dict:
         """
-        Выполняет запрос к VK API по названию метода.
-        Пример: api_request('users.get', user_ids=1)
-        Возвращает dict, при ошибке вернёт None.
+        Дешёвая проба списков друзей: friends.get с count=1 пачками через execute.
+        Возвращает {user_id: (количество друзей, первый id)}, недоступные пропускаются.
+        """
+
+        probes = {}
+        for start in range(0, len(user_ids), self.EXECUTE_BATCH_SIZE):
+            batch = user_ids[start:start + self.EXECUTE_BATCH_SIZE]
+            responses = self._execute([('friends.get', {'user_id': int(user_id), 'count': 1}) for user_id in batch])
+            for user_id, response in zip(batch, responses):
+                if not response:
+                    log.warning(f'Не удалось получить друзей пользователя {user_id} (профиль закрыт или удалён)')
+                    continue
+                probes[user_id] = _probe_value(response)
+        return probes
+
+
+    def get_friends_lists(self, user_ids:list[str]) -> dict:
+        """
+        Получает списки друзей сразу многих пользователей: первые страницы friends.get
+        упаковываются по EXECUTE_BATCH_SIZE штук в один запрос execute,
+        остальные страницы догружаются постранично.
+        Для каждого пользователя отдельно сравнивает и сохраняет список: ошибка
+        одного пользователя не мешает остальным (кроме ошибок токена и сети).
+        Если вышел срок этапа, возвращает то, что успело сохраниться.
+        Возвращает {user_id: количество изменений} для успешно полученных списков.
+        """
+
+        changes = {}
+        try:
+            for start in range(0, len(user_ids), self.EXECUTE_BATCH_SIZE):
+                batch = user_ids[start:start + self.EXECUTE_BATCH_SIZE]
+                calls = [('friends.get', {'user_id': int(user_id), 'count': self.FRIENDS_PAGE_SIZE}) for user_id in batch]
+                responses = self._execute(calls)
+
+                for user_id, response in zip(batch, responses):
+                    if not response:
+                        log.warning(f'Не удалось получить друзей пользователя {user_id} (профиль закрыт или удалён)')
+                        continue
+                    pages = self.iter_friends_pages(user_id, first_response=response)
+                    try:
+                        changes[user_id] = self._save_friends_list(pages, user_id, _probe_value(response))
+                    except (VKAuthError, VKTooManyRequestsError, VKNetworkError, DeadlineExceeded):
+                        raise
+                    except Exception as e:
+                        log.error(f'Не удалось проверить список друзей пользователя {user_id}: {e}')
+        except DeadlineExceeded as e:
+            log.warning(f'Выгрузка списков друзей прервана: {e}, проверено {len(changes)} из {len(user_ids)} пользователей')
+
+        self.profile_cache.save()
+        return changes
+
+
+    def iter_friends_pages(self, user_id:str, first_response:dict | None = None):
+        """
+        Генератор: выгружает id друзей пользователя через count/offset
+        и отдаёт страницы [id, ...] по возрастанию id.
+        Соседние страницы запрашиваются с перекрытием, повторы отбрасываются по id,
+        так что список получается точным и для 10k+ друзей.
+        first_response - уже полученная первая страница (например из execute).
+        """
+
+        response = first_response
+        offset = 0
+        last_id = -1
+        received = 0
+        while True:
+            if response is None:
+                response = self._api_request('friends.get', user_id=user_id,
+                                             count=self.FRIENDS_PAGE_SIZE, offset=offset)
+            total = response['count']
+            items = response['items']
+
+            if offset > 0 and items and items[0] > last_id:
+                log.warning(f'Список друзей пользователя {user_id} сильно изменился во время выгрузки, возможны пропуски')
+
+            # VK отдаёт друзей по возрастанию id, всё что не больше last_id - уже получено
+            page = [uid for uid in items if uid > last_id]
+            if page:
+                last_id = page[-1]
+                received += len(page)
+                yield page
+
+            if not items or offset + len(items) >= total:
+                break
+
+            step = len(items) - self.FRIENDS_PAGE_OVERLAP if len(items) > self.FRIENDS_PAGE_OVERLAP else len(items)
+            offset += step
+            response = None
+
+        if received != total:
+            log.warning(f'Получено {received} друзей пользователя {user_id} из {total}, список менялся во время выгрузки')
+
+
+    def check_token(self) -> bool:
+        """
+        Проверяет токен одним лёгким запросом к API (users.get без параметров),
+        возвращает True если VK принял токен.
+        """
+
+        if self.client.check_token():
+            return True
+        VKClient.forget_token(self.token)
+        return False
+
+
+    def check_profiles(self, user_id:str) -> int:
+        """
+        Проверяет отслеживаемые поля профилей пользователя и его друзей (PROFILE_FIELDS):
+        users.get по USERS_GET_BATCH_SIZE id, сравнение хешей полей с сохранёнными.
+        Сохранённые значения читаются и сравниваются по полям только у профилей
+        с изменившимся хешем, записываются только они. Новые профили запоминаются без уведомления.
+        Возвращает количество изменившихся полей.
+        """
+
+        target = int(user_id)
+        uids = [target] + [uid for uid in self.storage.load_snapshot(target) if uid != target]
+        fields = request_fields(self.PROFILE_FIELDS)
+        lines = []
+        changes_count = 0
+
+        for start in range(0, len(uids), self.USERS_GET_BATCH_SIZE):
+            batch = uids[start:start + self.USERS_GET_BATCH_SIZE]
+            params = {'user_ids': ','.join(map(str, batch))}
+            if fields:
+                params['fields'] = fields
+            profiles = self._api_request('users.get', **params)
+
+            values = {}
+            for profile in profiles:
+                self.profile_cache.put(profile['id'], profile)
+                values[profile['id']] = extract_fields(profile, self.PROFILE_FIELDS)
+            hashes = {uid: fingerprint(fields_values) for uid, fields_values in values.items()}
+
+            stored_hashes = self.storage.load_fingerprints(list(values))
+            changed = [uid for uid, value_hash in hashes.items() if stored_hashes.get(uid) != value_hash]
+            if not changed:
+                continue
+
+            stored_fields = self.storage.load_profile_fields([uid for uid in changed if uid in stored_hashes])
+            events = []
+            for uid in changed:
+                for field, (old, new) in diff_fields(stored_fields.get(uid, {}), values[uid]).items():
+                    events.append((uid, field, old, new))
+                    lines.append(f"{self.profile_cache.name(uid)} (vk.com/id{uid}): {field}: {old} -> {new}")
+            self.storage.save_profiles({uid: (hashes[uid], values[uid]) for uid in changed}, events)
+            changes_count += len(events)
+
+        self.storage.mark_profiles_checked(target)
+        self.profile_cache.save()
+        log.info(f'Профили пользователя {user_id} и его друзей проверены: {len(uids)}, изменений полей: {changes_count}')
+
+        if lines:
+            self.notifier.notify(f"Изменения профилей у пользователя vk.com/id{user_id} и его друзей:\n" + "\n".join(lines))
+        return changes_count
+
+
+    def resolve_names(self, uids:list[int]) -> dict:
+        """
+        Возвращает {uid: 'Имя Фамилия'}. Имена берутся из кэша профилей,
+        в users.get (по USERS_GET_BATCH_SIZE id за запрос) уходят только отсутствующие в кэше.
+        """
+
+        missing = self.profile_cache.missing(uids)
+        for start in range(0, len(missing), self.USERS_GET_BATCH_SIZE):
+            batch = missing[start:start + self.USERS_GET_BATCH_SIZE]
+            profiles = self._api_request('users.get', user_ids=','.join(map(str, batch)))
+            for profile in profiles:
+                self.profile_cache.put(profile['id'], profile)
+
+        if missing:
+            log.info(f'Запрошены профили из VK: {len(missing)}, из кэша: {len(uids) - len(missing)}')
+        return {uid: self.profile_cache.name(uid) for uid in uids}
+
+
+    def _run_extra_check(self, check, user_id:str, description:str):
+        """
+        Дополнительная проверка после опроса списков (профили, граф) под сроком
+        EXTRA_CHECK_TIMEOUT: её ошибка или превышение срока не прерывает опрос,
+        кроме ошибок токена - их обрабатывает планировщик.
         """
 
         try:
-            vk_session = vk_api.VkApi(token=self.token)
-            vk = vk_session.get_api()
-            parts = api_method.split('.')
-            method = vk
-            for part in parts:
-                method = getattr(method, part)
+            with metrics.timer(check.__name__), Deadline(self.EXTRA_CHECK_TIMEOUT, check.__name__):
+                check(user_id)
+        except (VKAuthError, VKTooManyRequestsError):
+            raise
+        except (VKError, DeadlineExceeded) as e:
+            log.error(f'Не удалось {description} пользователя {user_id}: {e}')
+
+
+    def _execute(self, calls:list[tuple[str, dict]]) -> list:
+        """
+        Выполняет до EXECUTE_BATCH_SIZE вызовов API одним запросом execute (VKScript).
+        Принимает [(метод, параметры), ...], возвращает ответы в том же порядке,
+        для неудавшихся вызовов - False.
+        """
+
+        code = 'return [' + ','.join(f'API.{method}({json.dumps(params)})' for method, params in calls) + '];'
+        response = self._api_request('execute', code=code)
+        return response or [False] * len(calls)
 
-            response = method(**params)
-            return response
 
-        except Exception as e:
+    def _migrate_json_snapshot(self, user_id:str):
+        """
+        Переносит список друзей из старых JSON файлов в хранилище, если пользователя там ещё нет:
+        data/friends/<id>.json, а для пользователя из USER_ID - общий data/friends.json.
+        После переноса файл переименовывается в *.migrated.
+        """
+
+        target = int(user_id)
+        if self.storage.has_snapshot(target):
+            return
+
+        paths = [get_path('data', 'friends', f'{user_id}.json')]
+        if user_id == get_env('USER_ID'):
+            paths.append(get_path('data', 'friends.json'))
+
+        for file_path in paths:
+            if os.path.exists(file_path):
+                try:
+                    uids = self._load_json_snapshot(file_path)
+                except (OSError, ValueError) as e:
+                    # Обрезанный файл не переносится: первый снимок из VK сохранится без уведомлений
+                    log.warning(f'Старый список друзей {file_path} повреждён и не перенесён: {e}')
+                    os.replace(file_path, file_path + '.broken')
+                    return
+                self.storage.import_snapshot(target, uids)
+                os.replace(file_path, file_path + '.migrated')
+                log.info(f'Список друзей пользователя {user_id} перенесён из {file_path}: {len(uids)} записей')
+                return
+
+
+    def _load_json_snapshot(self, file_path:str) -> set:
+        """
+        Загружает список id друзей из JSON файла. Старый формат {id: 'Имя Фамилия'}
+        тоже читается, имена из него переносятся в кэш профилей.
+        """
+
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        if isinstance(data, dict):
+            for uid, name in data.items():
+                if self.profile_cache.get(int(uid)) is None:
+                    first_name, _, last_name = name.partition(' ')
+                    self.profile_cache.put(int(uid), {'first_name': first_name, 'last_name': last_name})
+        return {int(uid) for uid in data}
+
+
+    def _save_friends_list(self, pages, user_id:str, probe:tuple[int, int]) -> int:
+        """
+        Сверяет список id друзей пользователя с хранилищем, читая страницы из генератора
+        в компактный снимок (массив int), и сравнивает снимки линейным слиянием.
+        Прошлый снимок - id прямо из бинарного файла снимка (через mmap) плюс изменения
+        журнала после его версии, если файла нет - из базы; файл закрывается до любой
+        записи (открытый через mmap файл на Windows не заменить). В хранилище
+        записываются только изменения, сразу за ними уведомление ставится в очередь ТГ.
+        Файл снимка переписывается редко - когда изменений после его версии накопилось
+        много (см. FriendsStorage.snapshot_outdated): он лишь ускоряет чтение,
+        поэтому его ошибка не теряет уведомление.
+        Первый снимок пользователя сохраняется без уведомления.
+        Запоминает probe - (count, первый id) из первой страницы ответа VK, а не длину
+        полученного списка: VK считает в count и недоступных друзей, и проба
+        poll_friends_lists сравнивает именно его.
+        Возвращает количество изменений (добавленных + пропавших).
+        """
+
+        target = int(user_id)
+        log.info(f'Проверка изменений в списке друзей пользователя {user_id}...')
+        self._migrate_json_snapshot(user_id)
+
+        with metrics.timer('friends_fetch'):
+            current_snapshot = FriendsSnapshot.from_pages(pages)
+        log.info(f'Список друзей пользователя {user_id} получен: {len(current_snapshot)} чел.')
+
+        snapshot_file = self.storage.open_snapshot_file(target)
+        try:
+            old_snapshot, pending, new_friends, lost_friends = self._diff_friends_list(target, current_snapshot, snapshot_file)
+            rewrite = (snapshot_file is None or
+                       self.storage.snapshot_outdated(pending + len(new_friends) + len(lost_friends), len(current_snapshot)))
+            file_names = self._names_from_snapshot_file(snapshot_file, current_snapshot, lost_friends, rewrite)
+        finally:
+            if snapshot_file is not None:
+                snapshot_file.close()
+
+        if old_snapshot is None:
+            check_deadline()
+            self.storage.import_snapshot(target, current_snapshot)
+            self.storage.save_full_check(target, *probe)
+            self._write_snapshot_file(target, current_snapshot, file_names)
+            return 0
+
+        # Имена запрашиваются до записи: если запрос упадёт или выйдет срок этапа,
+        # изменения не будут сохранены без уведомления и найдутся в следующий раз
+        names = self.resolve_names(lost_friends + new_friends)
+
+        check_deadline()
+        with metrics.timer('storage_write'):
+            self.storage.apply_diff(target, new_friends, lost_friends)
+            self.storage.save_full_check(target, *probe)
+        metrics.inc('friends_added_total', len(new_friends))
+        metrics.inc('friends_removed_total', len(lost_friends))
+
+        message_parts = []
+
+        if lost_friends:
+            lost_text = "\n".join(f"{uid}: {names[uid]}" for uid in lost_friends)
+            message_parts.append(f"Пропавшие друзья:\n{lost_text}")
+
+        if new_friends:
+            new_text = "\n".join(f"{uid}: {names[uid]}" for uid in new_friends)
+            message_parts.append(f"Новые друзья:\n{new_text}")
+
+        if message_parts:
+            message_parts.insert(0, f"Изменения у пользователя vk.com/id{user_id}:")
+            message = "\n\n".join(message_parts)
+            log.info("Обнаружены изменения, список поставлен в очередь на отправку в Telegram")
+            self.notifier.notify(message)
+        else:
+            log.info("Изменений в списке друзей не найдено.")
+
+        if rewrite:
+            self._write_snapshot_file(target, current_snapshot, file_names)
+        return len(new_friends) + len(lost_friends)
+
+
+    def _diff_friends_list(self, target:int, current_snapshot:FriendsSnapshot,
+                           snapshot_file:SnapshotFile | None) -> tuple[FriendsSnapshot | None, int, list[int], list[int]]:
+        """
+        Прошлый снимок (из файла снимка с изменениями журнала после него или из базы),
+        сколько изменений журнала не вошло в файл и (добавленные, пропавшие) относительно
+        прошлого снимка. Если списка пользователя ещё нет - (None, 0, [], []).
+        Снимок из файла ссылается на mmap и действителен, пока файл открыт.
+        """
+
+        pending = 0
+        if snapshot_file is not None:
+            added, removed = self.storage.snapshot_changes(target, snapshot_file.data_version)
+            pending = len(added) + len(removed)
+            old_snapshot = FriendsSnapshot(snapshot_file.uids).patched(added, removed)
+            log.info(f"Загружен старый список друзей из файла снимка: {len(old_snapshot)} записей, "
+                     f"изменений после снимка: {pending}")
+        elif self.storage.has_snapshot(target):
+            old_snapshot = self.storage.load_snapshot(target)
+            log.info(f"Загружен старый список друзей: {len(old_snapshot)} записей")
+        else:
+            log.info("Старый список друзей не найден, создаём новый")
+            return None, 0, [], []
+
+        with metrics.timer('diff'):
+            new_friends, lost_friends = old_snapshot.diff(current_snapshot)
+        return old_snapshot, pending, new_friends, lost_friends
+
+
+    def _names_from_snapshot_file(self, snapshot_file:SnapshotFile | None, current_snapshot:FriendsSnapshot,
+                                  lost_friends:list[int], rewrite:bool) -> dict:
+        """
+        Читает из файла снимка имена, которых нет в кэше профилей, пока файл открыт.
+        Имена пропавших друзей кладутся в кэш (для уведомления), если файл будет
+        переписан (rewrite) - имена текущих друзей возвращаются {uid: имя} для него.
+        """
+
+        if snapshot_file is None:
+            return {}
+
+        for uid in self.profile_cache.missing(lost_friends):
+            name = snapshot_file.name(uid)
+            if name is not None:
+                first_name, _, last_name = name.partition(' ')
+                self.profile_cache.put(uid, {'first_name': first_name, 'last_name': last_name})
+
+        names = {}
+        if not rewrite:
+            return names
+        for uid in self.profile_cache.missing(current_snapshot):
+            name = snapshot_file.name(uid)
+            if name is not None:
+                names[uid] = name
+        return names
+
+
+    def _write_snapshot_file(self, target:int, snapshot:FriendsSnapshot, file_names:dict):
+        """
+        Переписывает файл снимка с известными именами друзей (из кэша профилей или прошлого файла).
+        Ошибка записи не прерывает опрос: изменения уже в базе, а без файла
+        следующий опрос прочитает список из базы.
+        """
+
+        def known_name(uid):
+            return self.profile_cache.peek_name(uid) or file_names.get(uid)
+
+        try:
+            with metrics.timer('snapshot_write'):
+                self.storage.write_snapshot_file(target, snapshot, known_name)
+        except OSError as e:
+            log.warning(f'Не удалось записать файл снимка пользователя {target}: {e}')
+
+
+    def _api_request(self, api_method: str, **params):
+        """
+        Выполняет запрос к VK API по названию метода через общий клиент токена.
+        Пример: api_request('users.get', user_ids=1)
+        Возвращает dict, при ошибке поднимает VKError.
+        """
+
+        try:
+            return self.client.call(api_method, **params)
+        except VKError as e:
             log.error(f'Ошибка при выполнении {api_method}: {e}')
-            return None
+            raise
         
 
+def _probe_value(response:dict) -> tuple[int, int]:
+    """
+    Значение пробы по ответу friends.get: (count, первый id). Одно и то же для пробы
+    и для полной выгрузки, иначе они не совпадут, если count VK не равен числу
+    полученных id (удалённые и заблокированные друзья, повторы на стыке страниц).
+    Замену друга при том же количестве и первом id проба не видит, её ловит
+    плановая полная проверка (FULL_CHECK_INTERVAL).
+    """
+
+    items = response['items']
+    return response['count'], items[0] if items else 0
+
+
+class AsyncVKManager:
+    """
+    Асинхронный интерфейс к VKManager для планировщика: блокирующие запросы
+    выполняются в общем ограниченном пуле потоков, а не в отдельном потоке на пользователя.
+    """
+
+    def __init__(self, vk_manager:VKManager, executor):
+        self.vk_manager = vk_manager
+        self.executor = executor
+        self.token = vk_manager.token
+
+
+    async def get_friends_lists(self, user_ids:list[str]) -> dict:
+        """Асинхронный VKManager.get_friends_lists"""
+
+        return await self._run(self.vk_manager.get_friends_lists, user_ids)
+
+
+    async def poll_friends_lists(self, user_ids:list[str], full_check_interval:int, deadline:Deadline | None = None) -> dict:
+        """Асинхронный VKManager.poll_friends_lists"""
+
+        return await self._run(metrics.profile_call, self.vk_manager.poll_friends_lists,
+                               user_ids, full_check_interval, deadline)
+
+
+    async def check_token(self) -> bool:
+        """Асинхронный VKManager.check_token"""
+
+        return await self._run(self.vk_manager.check_token)
+
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+
 class VKInteraction:
     """Взаимодействие с браузером нацеленные на получение токена VK"""
     
-    def __init__(self, browser_manager):
+    def __init__(self, browser_manager, token_store:TokenStore | None = None):
         self.browser_manager = browser_manager
+        self.token_store = token_store or TokenStore()
         self.KEY_PATTERN = ':web_token:login:auth'
 
 
     def get_vk_actual_access_token(self):
+        """Возвращает действующий токен VK (см. get_vk_actual_token_data), если получить не удалось - None"""
+
+        token_data = self.get_vk_actual_token_data()
+        if token_data is None:
+            return None
+        return token_data['access_token']
+
+
+    def get_vk_actual_token_data(self, renew:bool = False, stopped:threading.Event | None = None) -> dict:
+        """
+        Возвращает данные сохранённого токена, если он не истёк и VK его принимает.
+        Иначе пробует токен из файлов localStorage профиля (без браузера),
+        и только если и его нет - получает новый токен через браузер.
+        Новый токен сохраняется.
+        renew - обновление заранее: сохранённый токен пропускается, из профиля
+        берётся только токен с более поздним сроком действия.
+        stopped - событие, по которому прерывается ожидание авторизации.
+        """
+
+        rejected_token = None
+        current_expires = None
+        token_data = self.token_store.load()
+        if token_data is not None:
+            if renew:
+                current_expires = self.token_store.expires_at(token_data)
+            elif self._is_token_usable(token_data, 'Сохранённый'):
+                return token_data
+            else:
+                rejected_token = token_data['access_token']
+                self.token_store.clear()
+
+        token_data = self.browser_manager.get_token_data_from_profile(self.KEY_PATTERN)
+        if token_data is not None and token_data['access_token'] != rejected_token \
+                and self._is_newer(token_data, current_expires):
+            if self._is_token_usable(token_data, 'Токен из профиля'):
+                self.token_store.save(token_data)
+                return token_data
+
+        token_data = self._get_token_data_from_browser(stopped)
+        if token_data is None:
+            return None
+
+        self.token_store.save(token_data)
+        return token_data
+
+
+    def _is_newer(self, token_data:dict, current_expires:int | None) -> bool:
+        """Срок действия токена позже current_expires (если текущий срок не известен - True)"""
+
+        if current_expires is None:
+            return True
+        expires = self.token_store.expires_at(token_data)
+        return expires is not None and expires > current_expires
+
+
+    def _is_token_usable(self, token_data:dict, source:str) -> bool:
+        """Проверяет срок действия токена и одним запросом - что VK его принимает"""
+
+        if self.token_store.is_expired(token_data):
+            log.info(f'{source}: срок действия токена истёк')
+            return False
+        client = VKClient.for_token(token_data['access_token'])
+        if not client.check_token():
+            VKClient.forget_token(token_data['access_token'])
+            log.warning(f'{source}: VK отклонил токен')
+            return False
+        log.info(f'{source}: токен действителен, браузер не требуется')
+        return True
+
+
+    def _get_token_data_from_browser(self, stopped:threading.Event | None = None) -> dict:
         """
-        Запускает браузер, попытается получить токен с сайта,
+        Берёт тёплый браузер (или запускает), попытается получить токен с сайта,
         если авторизация не активна - перезапустит браузер в видимом режиме,
-        будет ожидать авторизацию, как получит токен закроет браузер и вернёт токен.
-        Если авторизация активна - вернёт токен.
-        """
-
-        self.browser_manager.start_browser()
-        page = self._open_vk_url()
-        if page == 'vkuiPanel__in':
-            log.info('Требуется авторизация на сайте, перезапускаю браузер в обычном режиме')
-            self.browser_manager.start_browser(headless = False)
-            self._open_vk_url()
-            log.info('Ожидание авторизации на сайте, после авторизации браузер закроется в течении минуты...')
-
-            while True:
-                token = self.browser_manager.get_token(self.KEY_PATTERN)
-                if token:
-                    self.browser_manager.stop_browser()
-                    return token
-                time.sleep(60)
-
-        elif page == 'vkitTextClamp__root--8Ttiw':
-            log.info('Авторизация на сайте активна')
-            token = self.browser_manager.get_token(self.KEY_PATTERN)
-            self.browser_manager.stop_browser()
-            return token
+        будет ожидать авторизацию, как получит токен закроет браузер и вернёт
+        данные токена. Если авторизация активна - вернёт данные токена,
+        а браузер оставит запущенным до истечения времени простоя.
+        Ожидание авторизации прерывается событием stopped, тогда вернёт None.
+        """
+
+        stopped = stopped or threading.Event()
+
+        # Как бы ни закончилось получение токена, запущенный браузер отпускается
+        # (закроется по таймеру простоя), а не остаётся занятым
+        try:
+            if self.browser_manager.ensure_browser() is None:
+                log.error('Браузер не запущен, получить токен с сайта не удалось')
+                return None
+            page = self._open_vk_url()
+            if page == 'vkuiPanel__in':
+                log.info('Требуется авторизация на сайте, перезапускаю браузер в обычном режиме')
+                if self.browser_manager.ensure_browser(headless = False) is None:
+                    log.error('Браузер не запущен, авторизация на сайте невозможна')
+                    return None
+                self._open_vk_url()
+                log.info('Ожидание авторизации на сайте, после авторизации браузер закроется в течении минуты...')
+
+                while True:
+                    token_data = self.browser_manager.get_token_data(self.KEY_PATTERN)
+                    if token_data:
+                        self.browser_manager.stop_browser()
+                        return token_data
+                    if stopped.wait(60):
+                        self.browser_manager.stop_browser()
+                        return None
+
+            elif page == 'vkitTextClamp__root--8Ttiw':
+                log.info('Авторизация на сайте активна')
+                return self.browser_manager.get_token_data(self.KEY_PATTERN)
+
+            return None
+        finally:
+            self.browser_manager.release_browser()
 
 
     def _open_vk_url(self) -> str:
@@ -0,0 +1,191 @@
+import time
+import random
+import weakref
+import threading
+
+from extensions.logging_ext import log
+from extensions.dotenv_ext import get_env
+from extensions.rate_limit_ext import TokenBucket
+from extensions.metrics_ext import metrics
+from extensions.deadline_ext import check_deadline, remaining_time
+
+
+class VKError(Exception):
+    """Базовая ошибка при обращении к VK API"""
+
+
+class VKNetworkError(VKError):
+    """Сетевая ошибка: таймаут, обрыв соединения, ответ 5xx"""
+
+
+class VKApiError(VKError):
+    """Ошибка, которую вернул VK API (поле error в ответе)"""
+
+    def __init__(self, method:str, code:int, message:str):
+        super().__init__(f'{method}: [{code}] {message}')
+        self.method = method
+        self.code = code
+        self.message = message
+
+
+class VKAuthError(VKApiError):
+    """Токен недействителен или отозван (код 5)"""
+
+
+class VKTooManyRequestsError(VKApiError):
+    """Превышена частота запросов (код 6)"""
+
+
+class VKClient:
+    """
+    Долгоживущий клиент VK API для одного токена:
+    держит keep-alive соединения, ограничивает частоту запросов
+    и повторяет запрос при временных ошибках.
+    """
+
+    API_URL = 'https://api.vk.com/method/'
+    API_VERSION = '5.199'
+
+    # Коды ошибок VK, после которых имеет смысл повторить запрос
+    RETRY_CODES = {6, 10}
+    AUTH_CODES = {5}
+
+    # Один клиент на токен на весь процесс
+    _clients = {}
+    _clients_lock = threading.Lock()
+
+    def __init__(self, token:str):
+        self.token = token
+        self.API_URL = get_env('VK_API_URL', self.API_URL)
+        self.RPS = float(get_env('VK_API_RPS', '3'))
+        self.MAX_RETRIES = int(get_env('VK_API_MAX_RETRIES', '5'))
+        self.TIMEOUT = float(get_env('VK_API_TIMEOUT', '15'))
+
+        # requests импортируется при первом клиенте, а не при старте программы
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.rate_limiter = TokenBucket(self.RPS)
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=10)
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+        # Соединения закрываются, когда клиент больше никем не используется (или по close())
+        self.closer = weakref.finalize(self, self.http.close)
+
+
+    @classmethod
+    def for_token(cls, token:str) -> 'VKClient':
+        """Возвращает общий клиент для токена, создаёт его при первом обращении"""
+
+        with cls._clients_lock:
+            client = cls._clients.get(token)
+            if client is None:
+                client = cls(token)
+                cls._clients[token] = client
+            return client
+
+
+    @classmethod
+    def forget_token(cls, token:str):
+        """
+        Удаляет клиент токена из общих, например после его отзыва. Клиент не закрывается:
+        его сессией в этот момент могут пользоваться другие потоки того же аккаунта,
+        соединения закроются, когда последний из них перестанет его использовать.
+        """
+
+        with cls._clients_lock:
+            cls._clients.pop(token, None)
+
+
+    def call(self, api_method:str, **params):
+        """
+        Выполняет запрос к VK API по названию метода.
+        Пример: call('users.get', user_ids=1)
+        Возвращает поле response, при ошибке поднимает VKError.
+        Ошибки 6/10 и сетевые сбои повторяет с экспоненциальной задержкой.
+        Перед каждой попыткой проверяется срок текущего этапа (extensions.deadline_ext):
+        если он вышел - DeadlineExceeded, таймаут запроса не больше оставшегося времени.
+        """
+
+        params['access_token'] = self.token
+        params.setdefault('v', self.API_VERSION)
+
+        attempt = 0
+        while True:
+            try:
+                return self._request(api_method, params)
+
+            except VKError as e:
+                retryable = not isinstance(e, VKApiError) or e.code in self.RETRY_CODES
+                if not retryable or attempt >= self.MAX_RETRIES:
+                    raise
+
+                delay = min(30.0, 0.5 * 2 ** attempt) + random.uniform(0, 0.5)
+                attempt += 1
+                metrics.inc('vk_api_retries_total', method=api_method)
+                log.warning(f'Ошибка при выполнении {api_method}: {e}, повтор {attempt}/{self.MAX_RETRIES} через {delay:.1f} сек.')
+                time.sleep(remaining_time(delay))
+
+
+    def check_token(self) -> bool:
+        """
+        Проверяет токен одним лёгким запросом (users.get без параметров),
+        возвращает False только если VK отклонил токен.
+        """
+
+        try:
+            return bool(self.call('users.get'))
+        except VKAuthError:
+            return False
+        except VKError as e:
+            # Сеть/VK недоступны - токен не отбрасываем, ошибка повторится при опросе
+            log.warning(f'Не удалось проверить токен: {e}')
+            return True
+
+
+    def close(self):
+        """Закрывает соединения клиента"""
+
+        self.closer()
+
+
+    def _request(self, api_method:str, params:dict):
+        """Один HTTP запрос к API без повторов"""
+
+        import requests
+
+        waited = self.rate_limiter.acquire()
+        check_deadline()
+        metrics.inc('vk_rate_limit_wait_seconds_total', waited)
+        metrics.inc('vk_api_calls_total', method=api_method)
+        started = time.perf_counter()
+        try:
+            response = self.http.post(self.API_URL + api_method, data=params, timeout=remaining_time(self.TIMEOUT))
+        except requests.RequestException as e:
+            metrics.inc('vk_api_errors_total', method=api_method, code='network')
+            raise VKNetworkError(f'{api_method}: {e}') from e
+        finally:
+            metrics.observe('vk_api_request_seconds', time.perf_counter() - started, method=api_method)
+
+        if response.status_code >= 500:
+            metrics.inc('vk_api_errors_total', method=api_method, code=f'http_{response.status_code}')
+            raise VKNetworkError(f'{api_method}: HTTP {response.status_code}')
+
+        try:
+            data = response.json()
+        except ValueError as e:
+            raise VKNetworkError(f'{api_method}: некорректный ответ ({e})') from e
+
+        if 'error' in data:
+            error = data['error']
+            code = int(error.get('error_code', 0))
+            message = error.get('error_msg', '')
+            metrics.inc('vk_api_errors_total', method=api_method, code=code)
+            if code in self.AUTH_CODES:
+                raise VKAuthError(api_method, code, message)
+            if code == 6:
+                raise VKTooManyRequestsError(api_method, code, message)
+            raise VKApiError(api_method, code, message)
+
+        return data['response']
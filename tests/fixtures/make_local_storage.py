@@ -0,0 +1,86 @@
+"""
+Создаёт наборы LevelDB для tests/test_local_storage.py (нужен plyvel, в работе программы не используется).
+Запуск из корня репозитория: python tests/fixtures/make_local_storage.py
+"""
+
+import os
+import glob
+import shutil
+
+import plyvel
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'local_storage')
+PROFILE = 'Default'
+ORIGIN = b'_https://vk.com\x00'
+OTHER_ORIGIN = b'_https://example.com\x00'
+
+
+def latin1(text:str) -> bytes:
+    return b'\x01' + text.encode('latin-1')
+
+
+def utf16(text:str) -> bytes:
+    return b'\x00' + text.encode('utf-16-le')
+
+
+def open_db(name:str):
+    path = os.path.join(FIXTURES_DIR, name, PROFILE, 'Local Storage', 'leveldb')
+    shutil.rmtree(os.path.join(FIXTURES_DIR, name), ignore_errors=True)
+    os.makedirs(path)
+    return path, plyvel.DB(path, create_if_missing=True, compression='snappy', write_buffer_size=64 * 1024 * 1024)
+
+
+def cleanup(path:str):
+    """Оставляет только файлы, которые читает LocalStorageReader, и CURRENT/MANIFEST"""
+
+    for file_path in glob.glob(os.path.join(path, '*')):
+        name = os.path.basename(file_path)
+        if not (name.endswith(('.log', '.ldb', '.sst')) or name == 'CURRENT' or name.startswith('MANIFEST')):
+            os.remove(file_path)
+
+
+def make_log_only():
+    """Всё в журнале: перезапись, удаление, другой сайт, значение длиннее блока журнала (32 КБ)"""
+
+    path, db = open_db('log_only')
+    db.put(b'VERSION', b'1')
+    db.put(ORIGIN + latin1('token'), latin1('old'))
+    db.put(ORIGIN + latin1('token'), latin1('new'))
+    db.put(ORIGIN + latin1('removed'), latin1('value'))
+    db.delete(ORIGIN + latin1('removed'))
+    db.put(ORIGIN + latin1('utf16'), utf16('Привет, мир'))
+    db.put(ORIGIN + latin1('big'), latin1('x' * 40000))
+    with db.write_batch() as batch:
+        batch.put(ORIGIN + latin1('batch_a'), latin1('a'))
+        batch.put(ORIGIN + latin1('batch_b'), latin1('b'))
+    db.put(OTHER_ORIGIN + latin1('token'), latin1('other'))
+    db.close()
+    cleanup(path)
+
+
+def make_compacted():
+    """
+    Таблица .ldb со сжатыми snappy блоками, поверх неё - журнал с более новыми
+    изменениями: перезапись и удаление ключей из таблицы
+    """
+
+    path, db = open_db('compacted')
+    for index in range(300):
+        db.put(ORIGIN + latin1(f'key{index:04d}'), latin1(f'value {index:04d} ' * 8))
+    db.put(ORIGIN + latin1('token'), latin1('from table'))
+    db.put(ORIGIN + latin1('deleted_later'), latin1('value'))
+    db.put(ORIGIN + latin1('deleted_in_table'), latin1('value'))
+    db.delete(ORIGIN + latin1('deleted_in_table'))
+    db.put(ORIGIN + latin1('utf16'), utf16('Значение в таблице ' * 4))
+    db.compact_range()
+
+    db.put(ORIGIN + latin1('token'), latin1('from log'))
+    db.delete(ORIGIN + latin1('deleted_later'))
+    db.close()
+    cleanup(path)
+
+
+if __name__ == '__main__':
+    make_log_only()
+    make_compacted()
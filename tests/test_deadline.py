@@ -0,0 +1,41 @@
+import time
+
+import pytest
+
+from extensions.deadline_ext import Deadline, DeadlineExceeded, remaining_time
+
+
+def test_remaining_time_without_deadline():
+    assert remaining_time(15) == 15
+
+
+def test_remaining_time_nearest_deadline():
+    with Deadline(900, 'cycle'), Deadline(0.5, 'probe'):
+        assert 0 < remaining_time(15) <= 0.5
+    with Deadline(900, 'cycle'):
+        assert remaining_time(15) == 15
+
+
+def test_remaining_time_after_expiry_raises():
+    # Таймаут 0 requests не принимает, поэтому вышедший срок - исключение, а не 0
+    with Deadline(0.01, 'cycle'):
+        time.sleep(0.02)
+        with pytest.raises(DeadlineExceeded):
+            remaining_time(15)
+
+
+def test_remaining_time_after_cancel_raises():
+    deadline = Deadline(None, 'cycle')
+    with deadline:
+        deadline.cancel()
+        with pytest.raises(DeadlineExceeded, match='отменён'):
+            remaining_time(15)
+
+
+def test_deadline_starts_on_enter():
+    # Время до входа в with (ожидание потока пула) в срок не входит
+    deadline = Deadline(0.05, 'cycle')
+    time.sleep(0.06)
+    assert deadline.expires_at is None
+    with deadline:
+        assert 0 < remaining_time(15) <= 0.05
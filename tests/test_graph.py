@@ -0,0 +1,134 @@
+import random
+from array import array
+
+import pytest
+
+from services.graph import FriendsGraph, pack_edge
+from services.crawler import GraphCrawler
+from services.storage import FriendsStorage
+from services.snapshot import FriendsSnapshot
+
+
+def graph_of(pairs) -> FriendsGraph:
+    return FriendsGraph.from_edges(array('Q', (pack_edge(a, b) for a, b in pairs)))
+
+
+def reference_rows(pairs) -> dict:
+    """Строки графа, собранные через множества"""
+
+    rows = {}
+    for a, b in pairs:
+        rows.setdefault(a, set()).add(b)
+        rows.setdefault(b, set()).add(a)
+    return {uid: sorted(neighbours) for uid, neighbours in sorted(rows.items())}
+
+
+def test_from_edges_csr():
+    graph = graph_of([(1, 5), (5, 1), (1, 3), (3, 7), (1, 3)])
+
+    # Связи в обе стороны, повторы отброшены
+    assert list(graph.nodes) == [1, 3, 5, 7]
+    assert list(graph.offsets) == [0, 2, 4, 5, 6]
+    assert list(graph.neighbours_data) == [3, 5, 1, 7, 1, 3]
+    assert len(graph) == 4 and graph.edge_count() == 3
+    assert list(graph.iter_edges()) == [(1, 3), (1, 5), (3, 7)]
+
+
+def test_lookups():
+    graph = graph_of([(10, 20), (10, 30), (20, 30)])
+    assert 10 in graph and 15 not in graph and 40 not in graph
+    assert list(graph.neighbours(10)) == [20, 30]
+    assert list(graph.neighbours(30)) == [10, 20]
+    assert list(graph.neighbours(15)) == []
+    assert len(graph_of([])) == 0 and list(graph_of([]).neighbours(1)) == []
+
+
+@pytest.mark.parametrize('chunk', [3, 64, 1 << 16])
+def test_from_edges_matches_reference(monkeypatch, chunk):
+    # Мелкие части - чтобы слияние отсортированных частей было из многих частей
+    monkeypatch.setattr(FriendsGraph, 'SORT_CHUNK', chunk)
+    rng = random.Random(chunk)
+    pairs = [(rng.randrange(1, 200), rng.randrange(1, 200)) for _ in range(1000)]
+    pairs.append((1, FriendsGraph.MAX_UID))
+    graph = graph_of(pairs)
+
+    rows = reference_rows(pairs)
+    assert list(graph.nodes) == list(rows)
+    assert {uid: list(graph.neighbours(uid)) for uid in graph.nodes} == rows
+
+
+def test_write_and_open(tmp_path):
+    file_path = str(tmp_path / 'graph.csr')
+    graph_of([(1, 2), (2, 3), (1, 4_000_000_000)]).write(file_path)
+
+    graph = FriendsGraph.open(file_path)
+    try:
+        assert list(graph.nodes) == [1, 2, 3, 4_000_000_000]
+        assert list(graph.neighbours(1)) == [2, 4_000_000_000]
+        assert list(graph.iter_edges()) == [(1, 2), (1, 4_000_000_000), (2, 3)]
+    finally:
+        graph.close()
+
+    assert len(FriendsGraph.open(str(tmp_path / 'missing.csr'))) == 0
+    with open(file_path, 'r+b') as f:
+        f.write(b'XXXX')
+    with pytest.raises(ValueError):
+        FriendsGraph.open(file_path)
+
+
+def test_diff():
+    old = graph_of([(1, 2), (1, 3), (2, 3), (5, 6)])
+    new = graph_of([(1, 2), (2, 3), (2, 4), (7, 8)])
+    added, removed = old.diff(new)
+    assert added == [(2, 4), (7, 8)]
+    assert removed == [(1, 3), (5, 6)]
+
+
+def test_pack_edge_rejects_large_ids():
+    assert pack_edge(FriendsGraph.MAX_UID, 1) == FriendsGraph.MAX_UID << 32 | 1
+    for a, b in ((FriendsGraph.MAX_UID + 1, 1), (1, FriendsGraph.MAX_UID + 1), (-1, 1)):
+        with pytest.raises(ValueError):
+            pack_edge(a, b)
+
+
+class FakeNotifier:
+    def __init__(self):
+        self.messages = []
+
+    def notify(self, text:str):
+        self.messages.append(text)
+
+
+class FakeVKManager:
+    def __init__(self, storage:FriendsStorage):
+        self.storage = storage
+        self.notifier = FakeNotifier()
+
+
+@pytest.fixture
+def crawler(tmp_path, monkeypatch):
+    monkeypatch.setenv('GRAPH_DEPTH', '1')
+    storage = FriendsStorage(str(tmp_path / 'tracker.db'))
+    yield GraphCrawler(FakeVKManager(storage), str(tmp_path / 'graph'))
+    storage.close()
+
+
+def test_finish_round_skips_large_ids(crawler):
+    large = GraphCrawler.MAX_UID + 1
+    nodes = array(FriendsSnapshot.TYPECODE, [2, 3, large])
+    crawler.storage.start_crawl_round(1, 1, nodes)
+    crawler.storage.save_crawl_lists(1, 'mutual', {2: array(FriendsSnapshot.TYPECODE, [3, large])})
+
+    crawler._finish_round(1, nodes)
+    graph = FriendsGraph.open(crawler.graph_path(1))
+    try:
+        assert list(graph.iter_edges()) == [(1, 2), (1, 3), (2, 3)]
+    finally:
+        graph.close()
+
+
+def test_crawl_skips_large_target(crawler):
+    target = GraphCrawler.MAX_UID + 1
+    crawler.storage.import_snapshot(target, [2, 3])
+    assert crawler.crawl(str(target)) is False
+    assert crawler.storage.load_crawl_round(target) is None
@@ -0,0 +1,74 @@
+import os
+import glob
+
+import pytest
+
+from services.local_storage import LocalStorageReader, snappy_decompress
+
+
+# Наборы созданы настоящим LevelDB (tests/fixtures/make_local_storage.py)
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'local_storage')
+ORIGIN = 'https://vk.com'
+
+
+def read_fixture(name:str, origin:str = ORIGIN) -> dict:
+    return LocalStorageReader(os.path.join(FIXTURES_DIR, name), 'Default').read_origin(origin)
+
+
+def fixture_files(name:str, pattern:str) -> list[str]:
+    return glob.glob(os.path.join(FIXTURES_DIR, name, 'Default', 'Local Storage', 'leveldb', pattern))
+
+
+def test_log_only_database():
+    assert fixture_files('log_only', '*.log') and not fixture_files('log_only', '*.ldb')
+
+    data = read_fixture('log_only')
+    # Перезапись: побеждает запись с большим порядковым номером
+    assert data['token'] == 'new'
+    # Удалённый ключ не попадает в результат
+    assert 'removed' not in data
+    # Значение длиннее блока журнала собирается из записей FIRST/MIDDLE/LAST
+    assert data['big'] == 'x' * 40000
+    # Несколько записей одного WriteBatch
+    assert data['batch_a'] == 'a' and data['batch_b'] == 'b'
+
+
+def test_utf16_values():
+    assert read_fixture('log_only')['utf16'] == 'Привет, мир'
+    assert read_fixture('compacted')['utf16'] == 'Значение в таблице ' * 4
+
+
+def test_other_origin_is_ignored():
+    assert read_fixture('log_only', 'https://example.com') == {'token': 'other'}
+    assert 'other' not in read_fixture('log_only').values()
+
+
+def test_compacted_table_with_snappy_blocks():
+    assert fixture_files('compacted', '*.ldb')
+
+    data = read_fixture('compacted')
+    for index in (0, 150, 299):
+        assert data[f'key{index:04d}'] == f'value {index:04d} ' * 8
+    # Удаление, попавшее в таблицу вместе со значением
+    assert 'deleted_in_table' not in data
+
+
+def test_newest_sequence_wins_across_files():
+    data = read_fixture('compacted')
+    # Журнал новее таблицы: перезапись и удаление ключей из таблицы
+    assert data['token'] == 'from log'
+    assert 'deleted_later' not in data
+
+
+def test_missing_database():
+    assert LocalStorageReader(FIXTURES_DIR, 'no_such_profile').read_origin(ORIGIN) == {}
+
+
+def test_snappy_overlapping_copy():
+    # Литерал 'abc', затем копия длиной 9 со смещением 3 (перекрывает сама себя)
+    assert snappy_decompress(bytes([12, 0x08]) + b'abc' + bytes([0x15, 3])) == b'abc' * 4
+
+
+def test_snappy_length_mismatch():
+    with pytest.raises(ValueError):
+        snappy_decompress(bytes([5, 0x08]) + b'abc')
@@ -0,0 +1,74 @@
+import json
+
+from services.storage import FriendsStorage
+from services.profile_cache import ProfileCache
+
+
+def profile(uid:int) -> dict:
+    return {'first_name': f'Имя{uid}', 'last_name': f'Фамилия{uid}'}
+
+
+def stored_uids(storage:FriendsStorage) -> list[int]:
+    return [uid for uid, _, _ in storage.load_profile_names(1000)]
+
+
+def test_save_writes_only_changes(tmp_path, monkeypatch):
+    storage = FriendsStorage(str(tmp_path / 'tracker.db'))
+    cache = ProfileCache(storage, capacity=100, json_path=str(tmp_path / 'profiles.json'))
+    for uid in range(1, 51):
+        cache.put(uid, profile(uid))
+    cache.save()
+    assert stored_uids(storage) == list(range(1, 51))
+
+    written = []
+    save_profile_names = storage.save_profile_names
+
+    def recording_save(names, removed, capacity):
+        written.append(names)
+        save_profile_names(names, removed, capacity)
+
+    monkeypatch.setattr(storage, 'save_profile_names', recording_save)
+
+    # Без изменений запись не выполняется
+    cache.peek_name(3)
+    cache.save()
+    assert written == []
+
+    # Записываются только новая и использованная записи, порядок LRU сохраняется
+    cache.put(60, profile(60))
+    assert cache.name(2) == 'Имя2 Фамилия2'
+    cache.save()
+    assert written == [[(60, 'Имя60', 'Фамилия60'), (2, 'Имя2', 'Фамилия2')]]
+    assert stored_uids(storage)[-2:] == [60, 2]
+    storage.close()
+
+
+def test_eviction_and_reload(tmp_path):
+    storage = FriendsStorage(str(tmp_path / 'tracker.db'))
+    cache = ProfileCache(storage, capacity=3, json_path=str(tmp_path / 'profiles.json'))
+    for uid in (1, 2, 3):
+        cache.put(uid, profile(uid))
+    cache.save()
+    cache.get(1)
+    cache.put(4, profile(4))
+    cache.save()
+    # Вытеснен самый давно использованный - 2
+    assert stored_uids(storage) == [3, 1, 4]
+
+    reloaded = ProfileCache(storage, capacity=3, json_path=str(tmp_path / 'profiles.json'))
+    assert list(reloaded.profiles) == [3, 1, 4]
+    assert reloaded.missing([1, 2, 3]) == [2]
+    storage.close()
+
+
+def test_json_migration(tmp_path):
+    json_path = tmp_path / 'profiles.json'
+    json_path.write_text(json.dumps([[1, 'A', 'B'], [2, 'C', 'D'], [3, 'E', 'F']]), encoding='utf-8')
+    storage = FriendsStorage(str(tmp_path / 'tracker.db'))
+
+    cache = ProfileCache(storage, capacity=2, json_path=str(json_path))
+    assert cache.peek_name(3) == 'E F'
+    assert cache.missing([1, 2, 3]) == [1]
+    assert stored_uids(storage) == [2, 3]
+    assert not json_path.exists() and (tmp_path / 'profiles.json.migrated').exists()
+    storage.close()
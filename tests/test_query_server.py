@@ -0,0 +1,151 @@
+import json
+import socket
+import http.client
+
+import pytest
+
+from services.storage import FriendsStorage
+from services.query_server import QueryServer, encode_cursor, decode_cursor
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = FriendsStorage(str(tmp_path / 'tracker.db'))
+    yield storage
+    storage.close()
+
+
+@pytest.fixture
+def server(storage, monkeypatch):
+    monkeypatch.setenv('QUERY_API_HOST', '127.0.0.1')
+    monkeypatch.setenv('QUERY_API_PORT', str(free_port()))
+    server = QueryServer(storage)
+    server.start()
+    yield server
+    server.stop()
+
+
+def get(server:QueryServer, path:str, etag:str | None = None) -> tuple[int, dict, bytes]:
+    """GET к серверу: (статус, заголовки, тело)"""
+
+    connection = http.client.HTTPConnection(server.HOST, server.PORT, timeout=10)
+    try:
+        connection.request('GET', path, headers={'If-None-Match': etag} if etag else {})
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+def get_json(server:QueryServer, path:str) -> dict:
+    status, _, body = get(server, path)
+    assert status == 200
+    return json.loads(body)
+
+
+def test_cursor_roundtrip():
+    for event_id in (0, 1, 123456789):
+        cursor = encode_cursor(event_id)
+        assert '=' not in cursor
+        assert decode_cursor(cursor) == event_id
+    for cursor in ('', '!!!', encode_cursor(5)[:-1] + '*', 'eDo1'):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
+
+
+def test_events_cursor_paging(server, storage):
+    storage.import_snapshot(1, [])
+    storage.import_snapshot(2, [])
+    for uid in range(1, 6):
+        storage.apply_diff(1, [uid], [], ts=100 + uid)
+        storage.apply_diff(2, [uid + 100], [], ts=100 + uid)
+
+    seen = []
+    cursor = ''
+    while True:
+        page = get_json(server, f'/events?target=1&limit=2&since={cursor}')
+        seen.extend(event['uid'] for event in page['events'])
+        cursor = page['next']
+        if not page['more']:
+            break
+    assert seen == [1, 2, 3, 4, 5]
+
+    # С последнего курсора - только новые события
+    assert get_json(server, f'/events?target=1&since={cursor}')['events'] == []
+    storage.apply_diff(1, [6], [1], ts=200)
+    page = get_json(server, f'/events?target=1&since={cursor}')
+    assert [(event['uid'], event['kind']) for event in page['events']] == [(6, 'added'), (1, 'removed')]
+    assert page['more'] is False
+
+
+def test_events_time_filter_and_bad_cursor(server, storage):
+    storage.import_snapshot(1, [])
+    for uid in range(1, 6):
+        storage.apply_diff(1, [uid], [], ts=100 + uid)
+
+    assert [event['uid'] for event in get_json(server, '/events?from=102&to=104')['events']] == [2, 3]
+    status, _, body = get(server, '/events?since=bad')
+    assert status == 400 and 'курсор' in json.loads(body)['error']
+
+
+def test_events_etag(server, storage):
+    storage.import_snapshot(1, [])
+    storage.import_snapshot(2, [])
+    storage.apply_diff(1, [10], [])
+
+    status, headers, _ = get(server, '/events?target=1')
+    etag = headers['ETag']
+    assert status == 200
+    status, headers, body = get(server, '/events?target=1', etag)
+    assert status == 304 and headers['ETag'] == etag and body == b''
+    # ETag зависит от запроса
+    assert get(server, '/events?target=1&limit=5', etag)[0] == 200
+
+    # События другого пользователя ответ не меняют
+    storage.apply_diff(2, [20], [])
+    assert get(server, '/events?target=1', etag)[0] == 304
+    storage.apply_diff(1, [11], [])
+    status, headers, _ = get(server, '/events?target=1', etag)
+    assert status == 200 and headers['ETag'] != etag
+
+
+def test_friends_etag_and_formats(server, storage):
+    storage.import_snapshot(1, [10, 20], ts=100)
+    status, headers, body = get(server, '/friends?target=1')
+    etag = headers['ETag']
+    assert status == 200
+    assert json.loads(body) == {'target': 1, 'count': 2, 'friends': [
+        {'uid': 10, 'name': None, 'added_at': 100}, {'uid': 20, 'name': None, 'added_at': 100}]}
+    assert get(server, '/friends?target=1', etag)[0] == 304
+
+    storage.apply_diff(1, [30], [10], ts=200)
+    status, headers, _ = get(server, '/friends?target=1', etag)
+    assert status == 200 and headers['ETag'] != etag
+
+    status, headers, body = get(server, '/friends?target=1&format=csv')
+    assert status == 200 and headers['ETag'] not in (etag, None)
+    assert body.decode().splitlines() == ['uid,name,added_at', '20,,100', '30,,200']
+    status, _, body = get(server, '/friends?target=1&format=ndjson')
+    assert [json.loads(line)['uid'] for line in body.decode().splitlines()] == [20, 30]
+
+    assert get(server, '/friends?target=2')[0] == 404
+    assert get(server, '/friends')[0] == 400
+    assert get(server, '/friends?target=1&format=xml')[0] == 400
+
+
+def test_targets_etag(server, storage):
+    storage.import_snapshot(1, [10], ts=100)
+    status, headers, body = get(server, '/targets')
+    assert json.loads(body) == {'targets': [{'target': 1, 'synced_at': 100, 'friends_count': None}]}
+    etag = headers['ETag']
+    assert get(server, '/targets', etag)[0] == 304
+
+    storage.save_full_check(1, 1, 10)
+    assert get(server, '/targets', etag)[0] == 200
+    assert get(server, '/unknown')[0] == 404
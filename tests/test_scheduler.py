@@ -0,0 +1,156 @@
+import time
+import asyncio
+
+from services.scheduler import TargetScheduler
+
+
+def run_for(scheduler:TargetScheduler, seconds:float):
+    """Запускает планировщик на seconds секунд"""
+
+    async def main():
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(seconds)
+        scheduler.stop()
+        await task
+
+    asyncio.run(main())
+
+
+def make_scheduler(targets:dict, run_batch=None, **kwargs) -> tuple[TargetScheduler, list]:
+    """Планировщик без разброса, run_batch записывает пачки в calls"""
+
+    calls = []
+
+    async def record(batch):
+        calls.append(list(batch))
+        if run_batch is not None:
+            await run_batch(batch)
+
+    kwargs.setdefault('jitter', 0)
+    kwargs.setdefault('batch_window', 0)
+    return TargetScheduler(targets, record, **kwargs), calls
+
+
+def test_pop_due_order_and_window():
+    scheduler, _ = make_scheduler({}, batch_window=1)
+    now = scheduler._now()
+    for target, due in (('c', 0.5), ('a', -2), ('d', 5), ('b', -1)):
+        scheduler.intervals[target] = 60
+        scheduler._push(target, due)
+
+    # Пора только a и b, но c попадает в окно пачки, d - нет
+    assert scheduler._pop_due() == ['a', 'b', 'c']
+    assert scheduler.scheduled == {'d'}
+    assert scheduler.queue[0][0] >= now + 5
+
+
+def test_pop_due_skips_removed_targets():
+    scheduler, _ = make_scheduler({'a': 60, 'b': 60})
+    scheduler.remove_target('a')
+    time.sleep(0.001)
+    assert scheduler._pop_due() == ['b']
+
+
+def test_batches_and_concurrency():
+    active = 0
+    peak = 0
+
+    async def slow(batch):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.05)
+        active -= 1
+
+    targets = {str(target): 60 for target in range(5)}
+    scheduler, calls = make_scheduler(targets, slow, batch_size=2, max_concurrency=1)
+    run_for(scheduler, 0.3)
+
+    assert sorted(len(batch) for batch in calls) == [1, 2, 2]
+    assert sorted(target for batch in calls for target in batch) == sorted(targets)
+    assert peak == 1
+
+
+def test_intervals_and_postpone():
+    async def postpone_later(batch):
+        if 'later' in batch:
+            scheduler.postpone('later', 10)
+
+    scheduler, calls = make_scheduler({'fast': 0.05, 'slow': 0.5, 'later': 0.05}, postpone_later)
+    run_for(scheduler, 0.4)
+
+    polled = [target for batch in calls for target in batch]
+    assert polled.count('fast') >= 4
+    assert polled.count('slow') == 1
+    # Отложен один раз на 10 секунд вместо интервала
+    assert polled.count('later') == 1
+
+
+def test_failed_batch_is_rescheduled():
+    async def fail(batch):
+        raise RuntimeError('VK недоступен')
+
+    scheduler, calls = make_scheduler({'a': 0.05}, fail)
+    run_for(scheduler, 0.3)
+    assert len(calls) >= 3
+    assert not scheduler.running
+
+
+def test_held_targets_wait_for_release():
+    async def hold_first(batch):
+        if len(calls) == 1:
+            scheduler.hold(['a'])
+
+    scheduler, calls = make_scheduler({'a': 0.02, 'b': 0.02}, hold_first)
+
+    async def main():
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0.2)
+        # Пока a удержан, опрашивается только b
+        held_polls = [target for batch in calls for target in batch]
+        assert held_polls.count('a') == 1 and held_polls.count('b') >= 3
+        assert 'a' in scheduler.running and 'a' not in scheduler.scheduled
+
+        scheduler.release(['a'])
+        await asyncio.sleep(0.1)
+        scheduler.stop()
+        await task
+
+    asyncio.run(main())
+    assert [target for batch in calls for target in batch].count('a') >= 2
+    assert scheduler.held == {}
+
+
+def test_release_before_batch_end():
+    scheduler, _ = make_scheduler({'a': 60})
+    scheduler._pop_due()
+    scheduler.running.add('a')
+    scheduler.hold(['a'])
+    # Пачка ещё идёт: release не ставит в очередь, это сделает конец пачки
+    scheduler.release(['a'])
+    assert 'a' not in scheduler.scheduled
+    assert 'a' in scheduler.running
+
+
+def test_loop_restart_backoff(monkeypatch):
+    scheduler, calls = make_scheduler({'a': 60})
+    scheduler.RESTART_DELAY = 0.02
+    scheduler.RESTART_MAX_DELAY = 0.08
+    failures = []
+    pop_due = scheduler._pop_due
+
+    def broken_pop_due():
+        failures.append(time.monotonic())
+        if len(failures) <= 4:
+            raise RuntimeError('сломан')
+        return pop_due()
+
+    monkeypatch.setattr(scheduler, '_pop_due', broken_pop_due)
+    run_for(scheduler, 0.4)
+
+    # Паузы между падениями растут вдвое до RESTART_MAX_DELAY
+    pauses = [later - earlier for earlier, later in zip(failures, failures[1:5])]
+    for pause, expected in zip(pauses, (0.02, 0.04, 0.08, 0.08)):
+        assert expected <= pause < expected + 0.05
+    # После перезапуска опрос продолжился
+    assert calls == [['a']]
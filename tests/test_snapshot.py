@@ -0,0 +1,66 @@
+import random
+from array import array
+
+import pytest
+
+from services.snapshot import FriendsSnapshot, diff_sorted, diff_sets
+
+
+def _snapshot_array(uids) -> array:
+    return array(FriendsSnapshot.TYPECODE, sorted(set(uids)))
+
+
+@pytest.mark.parametrize('old, new', [
+    ([], []),
+    ([], [1, 2, 3]),
+    ([1, 2, 3], []),
+    ([1, 2, 3], [1, 2, 3]),
+    ([1, 3, 5], [2, 4, 6]),
+    ([1, 2, 3], [1, 2, 3, 4, 5]),
+    ([1, 2, 3, 4, 5], [3, 4, 5]),
+    ([5], [1, 9]),
+])
+def test_diff_sorted_edge_cases(old, new):
+    old, new = _snapshot_array(old), _snapshot_array(new)
+    assert diff_sorted(old, new) == diff_sets(old, new)
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_diff_sorted_matches_set_diff(seed):
+    rng = random.Random(seed)
+    universe = rng.choice([10, 100, 10_000, 2 ** 40])
+    old = _snapshot_array(rng.sample(range(1, universe), rng.randint(0, min(300, universe - 1))))
+    # Новый список - старый с частью пропавших и новых id
+    kept = [uid for uid in old if rng.random() > rng.random() * 0.5]
+    new = _snapshot_array(kept + rng.sample(range(1, universe), rng.randint(0, min(50, universe - 1))))
+
+    added, removed = diff_sorted(old, new)
+    assert (added, removed) == diff_sets(old, new)
+    assert FriendsSnapshot(old).diff(FriendsSnapshot(new)) == (added, removed)
+
+
+def test_from_pages_with_overlapping_pages():
+    # Соседние страницы friends.get запрашиваются с перекрытием, повторы должны отброситься
+    pages = [[1, 2, 3, 4, 5], [4, 5, 6, 7], [7, 8, 9], []]
+    snapshot = FriendsSnapshot.from_pages(iter(pages))
+    assert list(snapshot) == [1, 2, 3, 4, 5, 6, 7, 8, 9]
+    assert 5 in snapshot and 10 not in snapshot
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_from_pages_random_overlap_matches_set(seed):
+    rng = random.Random(seed)
+    uids = sorted(rng.sample(range(1, 10 ** 9), rng.randint(0, 2000)))
+    pages = []
+    offset = 0
+    while offset < len(uids):
+        size = rng.randint(1, 300)
+        pages.append(uids[max(0, offset - rng.randint(0, 20)):offset + size])
+        offset += size
+    # Иногда страницы приходят не по порядку - снимок всё равно отсортирован
+    if pages and rng.random() < 0.3:
+        rng.shuffle(pages)
+
+    snapshot = FriendsSnapshot.from_pages(iter(pages))
+    assert list(snapshot) == uids
+    assert snapshot == FriendsSnapshot.from_iterable(reversed(uids))
@@ -0,0 +1,151 @@
+import os
+
+import pytest
+
+from services.storage import FriendsStorage
+from services.snapshot import FriendsSnapshot
+from services.snapshot_file import SnapshotFile
+
+
+NAMES = {1: 'Павел Дуров', 5: '', 7: 'Ann Lee'}
+
+
+def write_snapshot(file_path:str, uids=(1, 5, 7), db_id:int = 42, data_version:int = 3):
+    SnapshotFile.write(file_path, list(uids), lambda uid: NAMES.get(uid), db_id, data_version)
+
+
+def corrupt(file_path:str, offset:int):
+    with open(file_path, 'r+b') as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 0xff]))
+
+
+def test_roundtrip(tmp_path):
+    file_path = str(tmp_path / 'a.snap')
+    write_snapshot(file_path)
+
+    with SnapshotFile.open(file_path) as snapshot_file:
+        assert (snapshot_file.db_id, snapshot_file.data_version) == (42, 3)
+        assert len(snapshot_file) == 3
+        assert list(snapshot_file.uids) == [1, 5, 7]
+        assert 5 in snapshot_file and 6 not in snapshot_file
+        assert snapshot_file.name(1) == 'Павел Дуров'
+        assert snapshot_file.name(7) == 'Ann Lee'
+        # Пустое имя и отсутствующий id - неизвестны
+        assert snapshot_file.name(5) is None
+        assert snapshot_file.name(6) is None
+
+
+def test_missing_file(tmp_path):
+    assert SnapshotFile.open(str(tmp_path / 'missing.snap')) is None
+
+
+def test_ids_checksum_mismatch(tmp_path):
+    file_path = str(tmp_path / 'a.snap')
+    write_snapshot(file_path)
+    corrupt(file_path, SnapshotFile.HEADER.size)
+
+    with pytest.raises(ValueError, match='контрольная сумма'):
+        SnapshotFile.open(file_path)
+    # Без проверки файл открывается, повреждение не замечено
+    SnapshotFile.open(file_path, verify=False).close()
+
+
+def test_names_checksum_checked_lazily(tmp_path):
+    file_path = str(tmp_path / 'a.snap')
+    write_snapshot(file_path)
+    corrupt(file_path, os.path.getsize(file_path) - 1)
+
+    # id целы, поэтому файл открывается, а повреждённые имена считаются неизвестными
+    with SnapshotFile.open(file_path) as snapshot_file:
+        assert snapshot_file.names_valid is None
+        assert 7 in snapshot_file
+        assert snapshot_file.name(1) is None
+        assert snapshot_file.names_valid is False
+
+
+def test_truncated_file(tmp_path):
+    file_path = str(tmp_path / 'a.snap')
+    write_snapshot(file_path)
+    size = os.path.getsize(file_path)
+
+    with open(file_path, 'r+b') as f:
+        f.truncate(size - 1)
+    with pytest.raises(ValueError, match='размер'):
+        SnapshotFile.open(file_path)
+
+    with open(file_path, 'r+b') as f:
+        f.truncate(SnapshotFile.HEADER.size - 1)
+    with pytest.raises(ValueError, match='обрезан'):
+        SnapshotFile.open(file_path)
+
+
+def test_format_version_mismatch(tmp_path):
+    file_path = str(tmp_path / 'a.snap')
+    write_snapshot(file_path)
+    with open(file_path, 'r+b') as f:
+        f.seek(4)
+        f.write((SnapshotFile.VERSION + 1).to_bytes(4, 'little'))
+
+    with pytest.raises(ValueError, match='версия формата'):
+        SnapshotFile.open(file_path)
+
+
+def test_atomic_replace(tmp_path):
+    file_path = str(tmp_path / 'a.snap')
+    write_snapshot(file_path)
+    write_snapshot(file_path, uids=(2, 3), data_version=4)
+    with SnapshotFile.open(file_path) as snapshot_file:
+        assert list(snapshot_file.uids) == [2, 3]
+        assert snapshot_file.data_version == 4
+
+    # Ошибка посреди записи: прошлый файл цел, временный удалён
+    def broken_names(uid):
+        raise RuntimeError('сбой')
+
+    with pytest.raises(RuntimeError):
+        SnapshotFile.write(file_path, [8, 9], broken_names, 42, 5)
+    with SnapshotFile.open(file_path) as snapshot_file:
+        assert list(snapshot_file.uids) == [2, 3]
+    assert os.listdir(tmp_path) == ['a.snap']
+
+
+def test_storage_reads_changes_after_snapshot(tmp_path):
+    storage = FriendsStorage(str(tmp_path / 'tracker.db'))
+    storage.import_snapshot(1, [10, 20, 30])
+    storage.write_snapshot_file(1, FriendsSnapshot.from_iterable([10, 20, 30]), lambda uid: None)
+    storage.apply_diff(1, [40], [10])
+    storage.apply_diff(1, [10], [40])
+    storage.apply_diff(1, [50], [20])
+
+    # Файл старше журнала, но подходит: изменения после него дочитываются
+    with storage.open_snapshot_file(1) as snapshot_file:
+        assert snapshot_file.data_version == 0
+        added, removed = storage.snapshot_changes(1, snapshot_file.data_version)
+        assert (added, removed) == ([10, 50], [20, 40])
+        patched = FriendsSnapshot(snapshot_file.uids).patched(added, removed)
+        assert patched == storage.load_snapshot(1)
+    storage.close()
+
+
+def test_storage_rejects_foreign_snapshot(tmp_path):
+    storage = FriendsStorage(str(tmp_path / 'tracker.db'))
+    storage.import_snapshot(1, [10])
+    write_snapshot(storage.snapshot_path(1), uids=(10,), db_id=storage.DB_ID + 1, data_version=0)
+    assert storage.open_snapshot_file(1) is None
+
+    # Снимок новее журнала (например, база восстановлена из копии)
+    write_snapshot(storage.snapshot_path(1), uids=(10,), db_id=storage.DB_ID, data_version=5)
+    assert storage.open_snapshot_file(1) is None
+    storage.close()
+
+
+def test_snapshot_outdated(tmp_path):
+    storage = FriendsStorage(str(tmp_path / 'tracker.db'))
+    assert not storage.snapshot_outdated(99, 100)
+    assert storage.snapshot_outdated(100, 100)
+    assert not storage.snapshot_outdated(999, 10000)
+    assert storage.snapshot_outdated(1000, 10000)
+    storage.close()
@@ -0,0 +1,127 @@
+import time
+import threading
+
+import pytest
+
+from services.storage import FriendsStorage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = FriendsStorage(str(tmp_path / 'tracker.db'))
+    yield storage
+    storage.close()
+
+
+def test_apply_diff_updates_friends_and_history(storage):
+    assert not storage.has_snapshot(1)
+    storage.import_snapshot(1, [10, 20, 30], ts=100)
+    assert storage.has_snapshot(1)
+    # Первый снимок записывается без событий
+    assert storage.load_events() == []
+
+    storage.apply_diff(1, [25, 40], [10], ts=200)
+    assert list(storage.load_snapshot(1).uids) == [20, 25, 30, 40]
+    assert storage.load_friends_page(1) == [(20, 100), (25, 200), (30, 100), (40, 200)]
+    assert [event[1:] for event in storage.load_events()] == [
+        (1, 25, 'added', 200), (1, 40, 'added', 200), (1, 10, 'removed', 200)]
+    assert storage.load_targets() == [(1, 200, None)]
+
+
+def test_apply_diff_keeps_targets_apart(storage):
+    storage.import_snapshot(1, [10, 20])
+    storage.import_snapshot(2, [10, 20])
+    storage.apply_diff(2, [30], [10])
+
+    assert list(storage.load_snapshot(1).uids) == [10, 20]
+    assert list(storage.load_snapshot(2).uids) == [20, 30]
+    assert [event[1:3] for event in storage.load_events(targets=[1])] == []
+    assert [event[1:3] for event in storage.load_events(targets=[2])] == [(2, 30), (2, 10)]
+
+
+def test_events_paging_and_filters(storage):
+    storage.import_snapshot(1, [])
+    for ts, uid in enumerate(range(1, 6), start=100):
+        storage.apply_diff(1, [uid], [], ts=ts)
+
+    first = storage.load_events(limit=2)
+    assert [event[2] for event in first] == [1, 2]
+    assert [event[2] for event in storage.load_events(after_id=first[-1][0], limit=2)] == [3, 4]
+    # Время события в пределах [since_ts, until_ts)
+    assert [event[2] for event in storage.load_events(since_ts=101, until_ts=103)] == [2, 3]
+    assert storage.last_event_id(since_ts=101, until_ts=103) == storage.load_events()[2][0]
+    assert storage.last_event_id(targets=[2]) == 0
+
+
+def test_load_poll_states(storage):
+    assert storage.load_poll_states() == {}
+    storage.save_full_check(1, 120, 5, ts=100)
+    storage.save_full_check(2, 3, 7, ts=200)
+    storage.save_interval(2, 900)
+    # Интервал без полной выгрузки: проба с ним не совпадёт
+    storage.save_interval(3, 600)
+    storage.save_full_check(1, 121, 4, ts=300)
+
+    assert storage.load_poll_states() == {
+        1: {'friends_count': 121, 'first_uid': 4, 'full_checked_at': 300, 'interval': None},
+        2: {'friends_count': 3, 'first_uid': 7, 'full_checked_at': 200, 'interval': 900},
+        3: {'friends_count': 0, 'first_uid': 0, 'full_checked_at': 0, 'interval': 600},
+    }
+    assert storage.load_poll_states([2, 4]) == {2: {'friends_count': 3, 'first_uid': 7, 'full_checked_at': 200, 'interval': 900}}
+    assert storage.load_poll_states([]) == {}
+
+
+def test_wait_for_events_timeout(storage):
+    storage.import_snapshot(1, [10])
+    started = time.monotonic()
+    assert storage.wait_for_events(storage.last_event_id(), 0.1) is False
+    assert time.monotonic() - started >= 0.1
+    # Событие уже есть - ожидания нет
+    storage.apply_diff(1, [20], [])
+    assert storage.wait_for_events(0, 10) is True
+
+
+def test_wait_for_events_wakes_on_diff(storage):
+    storage.import_snapshot(1, [10])
+    timer = threading.Timer(0.05, storage.apply_diff, (1, [20], []))
+    timer.start()
+    started = time.monotonic()
+    try:
+        assert storage.wait_for_events(0, 10) is True
+    finally:
+        timer.join()
+    assert time.monotonic() - started < 5
+
+
+def test_wait_for_events_stopped(storage):
+    stopped = threading.Event()
+
+    def stop():
+        stopped.set()
+        with storage.changed:
+            storage.changed.notify_all()
+
+    timer = threading.Timer(0.05, stop)
+    timer.start()
+    started = time.monotonic()
+    try:
+        # Возвращает результат условия: событий нет, но ожидание прервано
+        assert storage.wait_for_events(0, 10, stopped) is True
+    finally:
+        timer.join()
+    assert time.monotonic() - started < 5
+
+
+def test_in_lists_are_batched(storage, monkeypatch):
+    monkeypatch.setattr(storage, 'IN_BATCH_SIZE', 3)
+    targets = list(range(1, 11))
+    for target in targets:
+        storage.save_full_check(target, target, 0, ts=100)
+    for target in (2, 5, 9):
+        storage.mark_profiles_checked(target, ts=500)
+    storage.mark_profiles_checked(3, ts=50)
+
+    assert sorted(storage.load_poll_states(targets + [11])) == targets
+    # Порядок сохраняется, проверенные после checked_before не возвращаются
+    assert storage.due_profile_checks(targets, 100) == [1, 3, 4, 6, 7, 8, 10]
+    assert storage.due_profile_checks([], 100) == []
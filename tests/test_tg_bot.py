@@ -0,0 +1,122 @@
+import time
+import threading
+
+import pytest
+
+from services.tg_bot import TelegramAgent, TelegramNotifier, TelegramUnavailable, split_message
+
+
+LIMIT = TelegramAgent.MAX_MESSAGE_LENGTH
+
+
+@pytest.mark.parametrize('text', [
+    'одна строка',
+    'a\n\nb',
+    '\n\nв начале и в конце\n\n',
+    'строка\n' * 2000,
+    ('x' * 100 + '\n\n') * 100,
+])
+def test_split_message_keeps_text(text):
+    chunks = split_message(text, LIMIT)
+    assert all(len(chunk) <= LIMIT for chunk in chunks)
+    # Разрезы только по переводам строк, пустые строки не теряются
+    assert '\n'.join(chunks) == text
+
+
+def test_split_message_long_line():
+    chunks = split_message('a\n' + 'x' * (2 * LIMIT + 10) + '\nb', LIMIT)
+    assert chunks == ['a', 'x' * LIMIT, 'x' * LIMIT, 'x' * 10 + '\nb']
+
+
+def test_split_message_drops_blank_chunks():
+    assert split_message('', LIMIT) == []
+    assert split_message('  \n ', LIMIT) == []
+    assert split_message('x' * LIMIT, LIMIT) == ['x' * LIMIT]
+
+
+class FakeAgent:
+    """Вместо Telegram: отклоняет части с BAD, первые unavailable попыток - недоступен"""
+
+    def __init__(self, unavailable:int = 0):
+        self.sent = []
+        self.unavailable = unavailable
+
+    def send_chunk(self, text:str) -> bool:
+        if self.unavailable:
+            self.unavailable -= 1
+            raise TelegramUnavailable('недоступен')
+        if 'BAD' in text:
+            return False
+        self.sent.append(text)
+        return True
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def notifier(tmp_path, monkeypatch):
+    monkeypatch.setenv('TG_COALESCE_WINDOW', '0.2')
+    notifier = TelegramNotifier(str(tmp_path / 'notifications.db'))
+    notifier.agent = FakeAgent()
+    yield notifier
+    notifier.stop()
+
+
+def outbox(notifier:TelegramNotifier) -> list[tuple[str, int]]:
+    with notifier.lock:
+        return notifier.connection.execute('SELECT text, failed FROM outbox ORDER BY id').fetchall()
+
+
+def wait_until(condition, timeout:float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_delivered_messages_are_deleted(notifier):
+    notifier.notify('первое')
+    notifier.notify('второе')
+    wait_until(lambda: not outbox(notifier))
+    assert notifier.agent.sent == ['первое\n\nвторое']
+
+
+def test_rejected_chunk_fails_only_its_rows(notifier):
+    # Каждое сообщение почти на всю часть: части и сообщения совпадают
+    texts = ['a' * (LIMIT - 10), 'BAD' + 'b' * (LIMIT - 10), 'c' * (LIMIT - 10)]
+    for text in texts:
+        notifier.notify(text)
+
+    wait_until(lambda: outbox(notifier) == [(texts[1], 1)])
+    assert notifier.agent.sent == [texts[0], texts[2]]
+    assert notifier.queue_size() == 0
+
+
+def test_long_message_deleted_after_last_part(notifier):
+    # Одна временная ошибка: часть повторяется, а не теряется
+    notifier.agent = FakeAgent(unavailable=1)
+    text = 'x' * LIMIT + '\n' + 'y' * 10
+    notifier.notify(text)
+    wait_until(lambda: not outbox(notifier), timeout=10)
+    assert notifier.agent.sent == ['x' * LIMIT, 'y' * 10]
+
+
+def test_rejected_long_message_skips_remaining_parts(notifier):
+    notifier.notify('BAD' + 'x' * LIMIT + '\nостаток')
+    wait_until(lambda: outbox(notifier) and outbox(notifier)[0][1] == 1)
+    notifier.notify('следующее')
+    wait_until(lambda: notifier.queue_size() == 0)
+    assert notifier.agent.sent == ['следующее']
+
+
+def test_agent_backoff_stops_on_event(monkeypatch):
+    stopped = threading.Event()
+    agent = TelegramAgent(stopped)
+    monkeypatch.setattr(agent, '_post', lambda method, payload: (500, {'ok': False}))
+    threading.Timer(0.1, stopped.set).start()
+
+    started = time.monotonic()
+    with pytest.raises(TelegramUnavailable, match='остановлена'):
+        agent.send_chunk('текст')
+    assert time.monotonic() - started < 1
@@ -0,0 +1,96 @@
+import pytest
+
+from services.token_pool import TokenPool, load_accounts
+
+
+class FakeBrowserManager:
+    def __init__(self, account:str):
+        self.ACCOUNT = account
+
+
+@pytest.fixture
+def pool():
+    pool = TokenPool([FakeBrowserManager(account) for account in ('a', 'b', 'c')])
+    for account in pool.refreshers:
+        set_token(pool, account, f'token-{account}')
+    return pool
+
+
+def set_token(pool:TokenPool, account:str, token:str | None):
+    """Публикует токен аккаунта, как это сделал бы его TokenRefresher"""
+
+    pool.refreshers[account].token_data = None if token is None else {'access_token': token}
+
+
+def accounts_of(groups:dict) -> dict:
+    return {target: account for account, (_, targets) in groups.items() for target in targets}
+
+
+def test_load_accounts(monkeypatch):
+    monkeypatch.setenv('VK_ACCOUNTS', ' main, second,main,, None')
+    assert load_accounts() == ['main', 'second']
+    monkeypatch.setenv('VK_ACCOUNTS', '')
+    assert load_accounts() == ['script']
+
+
+def test_even_load(pool):
+    groups, unassigned = pool.assign({str(target): 60 for target in range(9)})
+    assert unassigned == []
+    assert {account: len(targets) for account, (_, targets) in groups.items()} == {'a': 3, 'b': 3, 'c': 3}
+    assert {account: token for account, (token, _) in groups.items()} == {'a': 'token-a', 'b': 'token-b', 'c': 'token-c'}
+
+
+def test_load_is_weighted_by_interval(pool):
+    # Один частый пользователь нагружает аккаунт как десять редких
+    intervals = {'fast': 10, **{f'slow{number}': 100 for number in range(20)}}
+    assigned = accounts_of(pool.assign(intervals)[0])
+    fast_account = assigned['fast']
+    assert sum(account == fast_account for account in assigned.values()) <= 2
+    assert max(pool.loads.values()) - min(pool.loads.values()) <= 0.1
+
+
+def test_assignments_are_sticky(pool):
+    intervals = {str(target): 60 for target in range(9)}
+    first = accounts_of(pool.assign(intervals)[0])
+    loads = dict(pool.loads)
+    # Повторные пачки не перекладывают пользователей и не копят нагрузку
+    for start in range(0, 9, 4):
+        batch = dict(list(intervals.items())[start:start + 4])
+        assert accounts_of(pool.assign(batch)[0]) == {target: first[target] for target in batch}
+    assert pool.loads == pytest.approx(loads)
+
+
+def test_unavailable_account_hands_over_targets(pool):
+    intervals = {str(target): 60 for target in range(9)}
+    first = accounts_of(pool.assign(intervals)[0])
+
+    set_token(pool, 'b', None)
+    second = accounts_of(pool.assign(intervals)[0])
+    assert 'b' not in second.values()
+    # Пользователи остальных аккаунтов остаются на месте
+    assert all(second[target] == account for target, account in first.items() if account != 'b')
+    assert pool.loads['b'] == pytest.approx(0)
+
+
+def test_throttled_account_is_skipped(pool):
+    pool.throttle('a')
+    assert set(pool.available_tokens()) == {'b', 'c'}
+    groups, _ = pool.assign({str(target): 60 for target in range(4)})
+    assert set(groups) == {'b', 'c'}
+
+    pool.cooldowns['a'] = 0
+    assert set(pool.available_tokens()) == {'a', 'b', 'c'}
+
+
+def test_invalidated_token(pool):
+    pool.invalidate('a', 'token-other')
+    assert 'a' in pool.available_tokens()
+    pool.invalidate('a', 'token-a')
+    assert 'a' not in pool.available_tokens()
+
+
+def test_no_accounts_available(pool):
+    for account in pool.refreshers:
+        set_token(pool, account, None)
+    assert pool.assign({'1': 60, '2': 60}) == ({}, ['1', '2'])
+    assert pool.assignments == {}
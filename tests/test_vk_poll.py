@@ -0,0 +1,88 @@
+import pytest
+
+from benchmark.stubs import SyntheticVK, VKStubServer
+from services.vk import VKManager
+from services.vk_client import VKClient
+from services.storage import FriendsStorage
+from services.profile_cache import ProfileCache
+
+
+class HiddenFriendsVK(SyntheticVK):
+    """VK считает в count и недоступных друзей, которых не отдаёт в items"""
+
+    HIDDEN = 3
+
+    def call(self, method:str, params:dict):
+        response = super().call(method, params)
+        if method == 'friends.get' and response is not None:
+            response['count'] += self.HIDDEN
+        return response
+
+
+class FakeNotifier:
+    def __init__(self):
+        self.messages = []
+
+    def notify(self, text:str):
+        self.messages.append(text)
+
+
+@pytest.fixture
+def vk(tmp_path, monkeypatch):
+    vk = HiddenFriendsVK(targets=2, friends=50, churn=0.1)
+    server = VKStubServer(vk)
+    monkeypatch.setenv('VK_API_URL', server.start())
+    monkeypatch.setenv('PROFILE_FIELDS', '')
+    monkeypatch.setenv('GRAPH_DEPTH', '0')
+    yield vk
+    VKClient.forget_token('test-poll')
+    server.stop()
+
+
+@pytest.fixture
+def manager(vk, tmp_path):
+    storage = FriendsStorage(str(tmp_path / 'tracker.db'))
+    notifier = FakeNotifier()
+    manager = VKManager('test-poll', None, ProfileCache(storage), storage, notifier)
+    yield manager
+    storage.close()
+
+
+def fetched(manager:VKManager, monkeypatch) -> list:
+    """Подменяет полную выгрузку, возвращает список пользователей, для которых она вызывалась"""
+
+    calls = []
+    get_friends_lists = manager.get_friends_lists
+
+    def counting(user_ids):
+        calls.extend(user_ids)
+        return get_friends_lists(user_ids)
+
+    monkeypatch.setattr(manager, 'get_friends_lists', counting)
+    return calls
+
+
+def test_probe_matches_stored_count(vk, manager, monkeypatch):
+    targets = [str(target) for target in vk.targets()]
+    calls = fetched(manager, monkeypatch)
+
+    assert manager.poll_friends_lists(targets, 86400) == dict.fromkeys(targets, 0)
+    assert calls == targets
+
+    # count VK больше числа полученных id, но проба совпадает с сохранённой
+    calls.clear()
+    assert manager.poll_friends_lists(targets, 86400) == dict.fromkeys(targets, 0)
+    assert calls == []
+
+
+def test_probe_detects_changes(vk, manager, monkeypatch):
+    targets = [str(target) for target in vk.targets()]
+    manager.poll_friends_lists(targets, 86400)
+    calls = fetched(manager, monkeypatch)
+
+    # Друг удалился: count и первый id меняются (удаляем первого)
+    target = vk.targets()[0]
+    vk.friends[target] = vk.friends[target][1:]
+    assert manager.poll_friends_lists(targets, 86400) == {str(target): 1, targets[1]: 0}
+    assert calls == [str(target)]
+    assert len(manager.notifier.messages) == 1